@@ -1,125 +1,175 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import Dict, Any, Optional
-import json
-import os
-import tempfile
+from typing import AsyncIterator, Dict, Any, List, Optional
 from datetime import datetime
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.models import UploadedFile, DocumentChunk
+from app.services.columnar import COLUMNAR_FORMATS, ColumnarWriter
+from app.services.export_schemas import ExportSchema, encode, get_schema, list_schemas
+from app.services.exporters import (
+    DifyExporter, ElasticsearchExporter, ExportItem, exporter_options, get_http_client
+)
+from app.services.metrics import EXPORT_SECONDS, StageTimer
 
 router = APIRouter()
 
+# 流式导出时每次从数据库取出的分块数
+STREAM_BATCH_SIZE = 500
+STREAM_FLUSH_SIZE = 64 * 1024
+
 class ExportConfig(BaseModel):
     format: str = "json"  # json, dify, elasticsearch
     schema_type: str = "standard"
     include_metadata: bool = True
 
+def _envelope_head(envelope: Dict[str, Any], key: str) -> bytes:
+    """
+    外层字段加上分块数组的开头，如 ``{"file_id":1,"chunks":[``
+    """
+    return encode(envelope)[:-1] + (b"," if envelope else b"") + encode(key) + b":["
+
+def _schema(name: str) -> ExportSchema:
+    schema = get_schema(name)
+    if schema is None:
+        raise HTTPException(status_code=400, detail=f"Unknown schema: {name}")
+    return schema
+
+async def _stream_export(file_id: int, schema: ExportSchema, output_format: str,
+                         outer: Optional[Dict[str, Any]] = None, total: Optional[int] = None):
+    """
+    按 chunk_index 顺序分批读取分块并逐个序列化，内存占用与文档大小无关
+
+    outer 不为空时（仅 json 格式）导出数据作为该对象的 export_data 字段输出；
+    total 为外层字段中的分块数，默认使用文件记录的 chunks_count
+    """
+    serialize = schema.serialize
+    # 只计序列化，不含读取数据库和发送的时间
+    timer = StageTimer()
+    async with AsyncSessionLocal() as db:
+        file = await db.get(UploadedFile, file_id)
+        chunks = await db.stream_scalars(
+            select(DocumentChunk)
+            .where(DocumentChunk.file_id == file_id)
+            .order_by(DocumentChunk.chunk_index)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+
+        if output_format == "ndjson":
+            head, separator, terminator, tail = b"", b"", b"\n", b""
+        else:
+            # 先输出外层字段，再逐个输出数组元素，最后补上闭合括号
+            head = _envelope_head(*schema.envelope(file, file.chunks_count if total is None else total))
+            separator, terminator, tail = b",", b"", b"]}"
+            if outer is not None:
+                head = encode(outer)[:-1] + b',"export_data":' + head
+                tail += b"}"
+        # 外层字段立即发送，之后按约 64KB 合并写出，避免每个分块发送一次
+        yield head
+
+        buffer = []
+        size = 0
+        position = 0
+        async for chunk in chunks:
+            with timer:
+                item = (separator if position else b"") + serialize(chunk, file) + terminator
+            buffer.append(item)
+            size += len(item)
+            position += 1
+            if size >= STREAM_FLUSH_SIZE:
+                yield b"".join(buffer)
+                buffer, size = [], 0
+        buffer.append(tail)
+        yield b"".join(buffer)
+    EXPORT_SECONDS.observe(timer.seconds, output_format)
+
 @router.post("/json")
 async def export_to_json(
     file_id: int,
     config: ExportConfig,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     导出为JSON格式
+
+    与下载接口一样以流式响应输出，分块分批读取，内存占用与文档大小无关
     """
     # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    file = await db.get(UploadedFile, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # 获取分块数据
-    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).order_by(DocumentChunk.chunk_index).all()
-    
-    # 根据schema类型生成不同格式
-    if config.schema_type == "dify":
-        export_data = {
-            "file_info": {
-                "filename": file.original_filename,
-                "source": file.original_filename,
-                "created_at": file.upload_time.isoformat()
-            },
-            "chunks": [
-                {
-                    "text": chunk.content,
-                    "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {},
-                    "source": file.original_filename
-                }
-                for chunk in chunks
-            ]
-        }
-    elif config.schema_type == "elasticsearch":
-        export_data = {
-            "index_name": "smartrag_docs",
-            "documents": [
-                {
-                    "content": chunk.content,
-                    "title": f"{file.original_filename} - Chunk {chunk.chunk_index + 1}",
-                    "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {},
-                    "timestamp": chunk.created_at.isoformat(),
-                    "source_file": file.original_filename
-                }
-                for chunk in chunks
-            ]
-        }
-    else:  # standard
-        export_data = {
-            "file_id": file_id,
-            "filename": file.original_filename,
-            "total_chunks": len(chunks),
-            "export_time": datetime.now().isoformat(),
-            "chunks": [
-                {
-                    "id": chunk.id,
-                    "chunk_index": chunk.chunk_index,
-                    "content": chunk.content,
-                    "html_content": chunk.html_content,
-                    "markdown_content": chunk.markdown_content,
-                    "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {}
-                }
-                for chunk in chunks
-            ]
-        }
-    
-    return {
+    # 分块由 _stream_export 分批读取，这里只取总数
+    total = await db.scalar(select(func.count()).select_from(DocumentChunk).where(DocumentChunk.file_id == file_id))
+    schema = _schema(config.schema_type)
+    outer = {
         "file_id": file_id,
-        "export_data": export_data,
         "config": config.dict(),
         "status": "ready",
-        "total_chunks": len(chunks)
+        "total_chunks": total
     }
+    return StreamingResponse(_stream_export(file_id, schema, "json", outer, total), media_type="application/json")
+
+async def _export_items(db: AsyncSession, file: UploadedFile, serialize) -> AsyncIterator[ExportItem]:
+    chunks = await db.stream_scalars(
+        select(DocumentChunk)
+        .where(DocumentChunk.file_id == file.id)
+        .order_by(DocumentChunk.chunk_index)
+        .execution_options(yield_per=STREAM_BATCH_SIZE)
+    )
+    async for chunk in chunks:
+        yield chunk.chunk_index, serialize(chunk, file)
+
+def _dify_segment(chunk: DocumentChunk, file: UploadedFile) -> Dict[str, Any]:
+    return {"content": chunk.content, "keywords": []}
 
 @router.post("/dify")
 async def export_to_dify(
     file_id: int,
     dify_config: Dict[str, Any],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     一键导入到Dify知识库
+
+    dify_config: api_key、knowledge_base_id（数据集 ID）必填；
+    可选 api_endpoint、document_id（追加到已有文档）、batch_size、concurrency、max_retries、retry_backoff
     """
     # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    file = await db.get(UploadedFile, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
+    if not dify_config.get("api_key") or not dify_config.get("knowledge_base_id"):
+        raise HTTPException(status_code=400, detail="api_key and knowledge_base_id are required")
     
-    # 获取分块数据
-    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).all()
-    
-    # 模拟Dify导入过程
-    import time
-    time.sleep(1)  # 模拟API调用延迟
+    api_endpoint = dify_config.get("api_endpoint", "https://api.dify.ai/v1")
+    exporter = DifyExporter(
+        get_http_client(),
+        api_endpoint=api_endpoint,
+        api_key=dify_config["api_key"],
+        dataset_id=dify_config["knowledge_base_id"],
+        document_name=file.original_filename,
+        document_id=dify_config.get("document_id"),
+        **exporter_options(dify_config)
+    )
+    result = await exporter.export(_export_items(db, file, _dify_segment))
     
     return {
         "file_id": file_id,
-        "dify_status": "imported",
-        "knowledge_base_id": dify_config.get("knowledge_base_id", "kb_123456"),
-        "imported_chunks": len(chunks),
-        "api_endpoint": dify_config.get("api_endpoint", "https://api.dify.ai/v1/knowledge"),
+        "dify_status": {
+            "completed": "imported", "partial": "partial", "failed": "failed", "aborted": "aborted"
+        }[result.status],
+        "knowledge_base_id": dify_config["knowledge_base_id"],
+        "document_id": exporter.document_id,
+        "imported_chunks": result.exported,
+        "failed_chunks": result.failed,
+        "errors": result.errors,
+        "api_endpoint": api_endpoint,
         "import_time": datetime.now().isoformat()
     }
 
@@ -127,71 +177,142 @@ async def export_to_dify(
 async def export_to_elasticsearch(
     file_id: int,
     es_config: Dict[str, Any],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     一键导入到Elasticsearch
+
+    es_config: 可选 es_url、index_name、api_key 或 username/password、batch_size、concurrency、max_retries、retry_backoff
     """
     # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    file = await db.get(UploadedFile, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # 获取分块数据
-    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).all()
-    
-    # 模拟Elasticsearch导入过程
-    import time
-    time.sleep(1)  # 模拟索引创建延迟
+    es_url = es_config.get("es_url", "http://localhost:9200")
+    index_name = es_config.get("index_name", "smartrag_docs")
+    exporter = ElasticsearchExporter(
+        get_http_client(),
+        es_url=es_url,
+        index_name=index_name,
+        file_id=file_id,
+        api_key=es_config.get("api_key"),
+        username=es_config.get("username"),
+        password=es_config.get("password"),
+        **exporter_options(es_config)
+    )
+    result = await exporter.export(_export_items(db, file, get_schema("elasticsearch").serialize))
     
     return {
         "file_id": file_id,
-        "elasticsearch_status": "indexed",
-        "index_name": es_config.get("index_name", "smartrag_docs"),
-        "indexed_chunks": len(chunks),
-        "es_url": es_config.get("es_url", "http://localhost:9200"),
+        "elasticsearch_status": {
+            "completed": "indexed", "partial": "partial", "failed": "failed", "aborted": "aborted"
+        }[result.status],
+        "index_name": index_name,
+        "indexed_chunks": result.exported,
+        "failed_chunks": result.failed,
+        "errors": result.errors,
+        "es_url": es_url,
         "index_time": datetime.now().isoformat()
     }
 
 @router.get("/download/{file_id}")
-async def download_json(file_id: int, db: Session = Depends(get_db)):
+async def download_json(
+    file_id: int,
+    schema_type: str = "standard",
+    format: str = "json",
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     下载JSON文件
+
+    以流式响应输出，format=ndjson 时每行一个分块
     """
     # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    file = await db.get(UploadedFile, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # 获取分块数据
-    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).order_by(DocumentChunk.chunk_index).all()
+    schema = _schema(schema_type)
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
     
-    # 生成下载数据
-    download_data = {
-        "file_id": file_id,
-        "filename": file.original_filename,
-        "total_chunks": len(chunks),
-        "export_time": datetime.now().isoformat(),
-        "chunks": [
-            {
-                "id": chunk.id,
-                "chunk_index": chunk.chunk_index,
-                "content": chunk.content,
-                "html_content": chunk.html_content,
-                "markdown_content": chunk.markdown_content,
-                "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {}
-            }
-            for chunk in chunks
-        ]
-    }
-    
-    return JSONResponse(
-        content=download_data,
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(
+        _stream_export(file_id, schema, format),
+        media_type=media_type,
         headers={
-            "Content-Disposition": f"attachment; filename={file.original_filename}_chunks.json"
+            "Content-Disposition": f"attachment; filename={file.original_filename}_chunks.{format}"
         }
     )
 
+async def _stream_columnar(file_ids: List[int], output_format: str, include_formatted: bool, row_group_size: int):
+    """
+    按 (file_id, chunk_index) 顺序读取分块，每 row_group_size 行写出一个行组
+    """
+    writer = ColumnarWriter(output_format, include_formatted)
+    timer = StageTimer()
+
+    def write(rows) -> bytes:
+        with timer:
+            return writer.write(rows)
+
+    columns = [
+        DocumentChunk.file_id,
+        UploadedFile.original_filename.label("filename"),
+        DocumentChunk.id.label("chunk_id"),
+        DocumentChunk.chunk_index,
+        DocumentChunk.content,
+        DocumentChunk.chunk_metadata,
+        DocumentChunk.created_at,
+    ]
+    if include_formatted:
+        columns += [DocumentChunk.html_content, DocumentChunk.markdown_content]
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(
+            select(*columns)
+            .join(UploadedFile, UploadedFile.id == DocumentChunk.file_id)
+            .where(DocumentChunk.file_id.in_(file_ids))
+            .order_by(DocumentChunk.file_id, DocumentChunk.chunk_index)
+            .execution_options(yield_per=row_group_size)
+        )
+        async for rows in result.partitions(row_group_size):
+            # 转换和压缩是 CPU 密集的，放到线程池中执行
+            yield await run_in_threadpool(write, rows)
+    with timer:
+        tail = writer.close()
+    EXPORT_SECONDS.observe(timer.seconds, output_format)
+    yield tail
+
+@router.get("/columnar")
+async def download_columnar(
+    file_ids: List[int] = Query(..., alias="file_id"),
+    format: str = "parquet",
+    include_formatted: bool = False,
+    row_group_size: int = Query(settings.COLUMNAR_ROW_GROUP_SIZE, ge=1),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    以 Parquet 或 Arrow IPC 流导出一个或多个文件的分块
+
+    重复 file_id 参数指定多个文件；元数据展开为 page、heading、tokens 等列，
+    include_formatted=true 时包含 html_content / markdown_content
+    """
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    file_ids = list(dict.fromkeys(file_ids))
+    found = set((await db.scalars(select(UploadedFile.id).where(UploadedFile.id.in_(file_ids)))).all())
+    missing = [file_id for file_id in file_ids if file_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Files not found: {missing}")
+    
+    extension = "parquet" if format == "parquet" else "arrows"
+    return StreamingResponse(
+        _stream_columnar(file_ids, format, include_formatted, row_group_size),
+        media_type=COLUMNAR_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=chunks.{extension}"}
+    )
+
 @router.get("/schemas")
 async def get_export_schemas():
     """
@@ -200,19 +321,10 @@ async def get_export_schemas():
     return {
         "schemas": [
             {
-                "name": "standard",
-                "description": "标准JSON格式",
-                "fields": ["id", "content", "html_content", "markdown_content", "metadata"]
-            },
-            {
-                "name": "dify",
-                "description": "Dify知识库格式",
-                "fields": ["text", "metadata", "source"]
-            },
-            {
-                "name": "elasticsearch",
-                "description": "Elasticsearch索引格式",
-                "fields": ["content", "title", "metadata", "timestamp", "source_file"]
+                "name": schema.name,
+                "description": schema.description,
+                "fields": schema.field_names
             }
+            for schema in list_schemas()
         ]
-    }
\ No newline at end of file
+    }
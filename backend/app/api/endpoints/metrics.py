@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.endpoints.websocket import manager
+from app.core.database import get_async_db
+from app.models import ProcessingTask
+from app.services.metrics import (
+    CONTENT_TYPE, SSE_SUBSCRIBERS, TASK_QUEUE_DEPTH, TASKS_RUNNING, WEBSOCKET_CONNECTIONS,
+    WEBSOCKET_SUBSCRIPTIONS, registry
+)
+from app.services.task_queue import task_queue
+from app.services.task_state import task_states
+
+router = APIRouter()
+
+WEBSOCKET_CONNECTIONS.set_function(lambda: len(manager.connections))
+WEBSOCKET_SUBSCRIPTIONS.set_function(lambda: len(manager.task_connections))
+SSE_SUBSCRIBERS.set_function(lambda: task_states.subscriber_count)
+
+@router.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_async_db)):
+    """
+    Prometheus 格式的指标
+
+    运行中的任务数来自数据库，包括其他副本和 Celery worker 上的任务；
+    Celery 后端的队列深度需要查询 broker，放到线程池中执行
+    """
+    if not registry.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    TASK_QUEUE_DEPTH.set(await run_in_threadpool(task_queue.queue_depth))
+    TASKS_RUNNING.set(await db.scalar(
+        select(func.count()).select_from(ProcessingTask).where(ProcessingTask.status == "running")
+    ))
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -1,160 +1,380 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional, List
-import json
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, delete, func, insert, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from typing import AsyncIterator, Optional, List
+from datetime import datetime
 import asyncio
-import random
-import time
+import inspect
+import json
+import os
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.api.endpoints.websocket import send_task_update
+from app.core.database import get_async_db
 from app.models import UploadedFile, ProcessingTask, DocumentChunk
+from app.services.counters import count_cache
+from app.services.executor import QueueFullError
+from app.services.chunker import SIZE_UNITS
+from app.services.near_dup import NEAR_DUP_MODES, delete_signatures
+from app.services.parsers import PARSERS
+from app.services.pipeline import config_fingerprint
+from app.services.task_queue import task_queue
+from app.services.task_state import TERMINAL_STATUSES, task_states
+from app.services.tokenizers import UnknownTokenizerError, available_tokenizers, get_tokenizer
 
 router = APIRouter()
 
 class ChunkConfig(BaseModel):
-    chunk_size: int = 500
-    chunk_overlap: int = 50
+    chunk_size: int = Field(500, gt=0)
+    chunk_overlap: int = Field(50, ge=0)  # 须小于 chunk_size
     chunk_method: str = "paragraph"  # paragraph, page, heading
+    size_unit: str = "chars"  # chars, tokens
+    tokenizer: Optional[str] = None  # 默认 DEFAULT_TOKENIZER
+    timeout: Optional[float] = None  # 任务最长运行秒数，默认 TASK_TIMEOUT；不影响分块结果
+    near_duplicates: str = "off"  # off, flag（元数据记录 duplicate_of）, drop（不写入）
+    near_duplicate_threshold: float = 0.8  # 估计的 Jaccard 相似度阈值
 
-# 模拟处理任务的后台函数
-async def simulate_processing_task(task_id: int, file_id: int, config: ChunkConfig, db: Session):
-    """
-    模拟文档处理任务
-    """
-    from app.api.endpoints.websocket import send_task_update
-    
-    # 更新任务状态为running
-    task = db.query(ProcessingTask).filter(ProcessingTask.id == task_id).first()
-    if task:
-        task.status = "running"
-        task.progress = 0.0
-        db.commit()
-        
-        # Send WebSocket update
-        await send_task_update(task_id, "running", 0.0, "処理を開始しています...")
-    
-    # 模拟处理过程
-    total_chunks = random.randint(15, 30)
-    
-    for i in range(total_chunks):
-        if task:
-            # 更新进度
-            progress = (i + 1) / total_chunks * 100
-            task.progress = progress
-            db.commit()
-            
-            # Send WebSocket update
-            await send_task_update(
-                task_id, 
-                "running", 
-                progress, 
-                f"チャンク {i+1}/{total_chunks} を処理中..."
-            )
-            
-            # 创建模拟的分块
-            chunk = DocumentChunk(
-                file_id=file_id,
-                chunk_index=i,
-                content=f"这是第 {i+1} 个分块的内容。本分块包含了文档的重要信息，使用 {config.chunk_method} 方法进行分割，大小限制为 {config.chunk_size} 字符。",
-                html_content=f"<p>这是第 {i+1} 个分块的内容。</p><p>本分块包含了文档的重要信息。</p>",
-                markdown_content=f"## 分块 {i+1}\n\n这是第 {i+1} 个分块的内容。\n\n本分块包含了文档的重要信息。",
-                chunk_metadata=json.dumps({
-                    "page": (i // 5) + 1,
-                    "type": "paragraph",
-                    "tokens": random.randint(30, 80),
-                    "method": config.chunk_method
-                })
-            )
-            db.add(chunk)
-            db.commit()
-        
-        # 模拟处理时间
-        await asyncio.sleep(0.1)
-    
-    # 完成任务
-    if task:
-        task.status = "completed"
-        task.progress = 100.0
-        db.commit()
-        
-        # Send WebSocket update
-        await send_task_update(task_id, "completed", 100.0, "処理が完了しました！")
-        
-        # 更新文件状态
-        file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-        if file:
-            file.status = "completed"
-            file.chunks_count = total_chunks
-            db.commit()
+    @model_validator(mode="after")
+    def _check_overlap(self):
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap must be less than chunk_size")
+        return self
 
-@router.post("/chunk")
-async def process_document(
-    file_id: int,
-    config: ChunkConfig,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
-):
+def chunk_config_query(**values) -> ChunkConfig:
     """
-    处理文档分块
+    从查询参数读取 ChunkConfig 的依赖；直接用 Depends(ChunkConfig) 时字段间校验失败会变成 500，这里转换为 422
     """
-    # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        return ChunkConfig(**values)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("query", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+chunk_config_query.__signature__ = inspect.signature(ChunkConfig)
+
+class TokenizeRequest(BaseModel):
+    texts: List[str]
+    tokenizer: Optional[str] = None
+
+async def _find_cached_chunks(file: UploadedFile, fingerprint: str, db: AsyncSession) -> Optional[UploadedFile]:
+    """
+    查找内容相同、且已用相同配置分块完成的文件，优先使用文件自身
+
+    解析器按扩展名选择，扩展名不同的文件即使内容相同分块结果也不同，不能复用
+    """
+    if file.status == "completed" and file.chunk_config_hash == fingerprint:
+        return file
+    if not file.content_hash:
+        return None
+    return await db.scalar(select(UploadedFile).where(
+        UploadedFile.content_hash == file.content_hash,
+        func.lower(UploadedFile.file_path).endswith(os.path.splitext(file.file_path)[1].lower()),
+        UploadedFile.chunk_config_hash == fingerprint,
+        UploadedFile.status == "completed",
+        UploadedFile.id != file.id
+    ).limit(1))
+
+async def _reuse_chunks(file: UploadedFile, source: UploadedFile, task: ProcessingTask, fingerprint: str, db: AsyncSession):
+    """
+    把 source 的分块结果复制给 file，整个过程在数据库内完成，不需要重新解析
+    """
+    if source.id != file.id:
+        await db.execute(delete(DocumentChunk).where(DocumentChunk.file_id == file.id))
+        # 复制来的分块不进入近似重复索引
+        for statement in delete_signatures(("file_id", file.id)):
+            await db.execute(statement)
+        await db.execute(insert(DocumentChunk).from_select(
+            ["file_id", "task_id", "chunk_index", "content", "html_content", "markdown_content", "chunk_metadata"],
+            select(
+                literal(file.id),
+                literal(task.id),
+                DocumentChunk.chunk_index,
+                DocumentChunk.content,
+                DocumentChunk.html_content,
+                DocumentChunk.markdown_content,
+                DocumentChunk.chunk_metadata
+            ).where(DocumentChunk.file_id == source.id)
+        ))
+    file.status = "completed"
+    file.chunks_count = source.chunks_count
+    file.chunk_config_hash = fingerprint
+    file.error_message = None
+    await db.commit()
+
+async def submit_chunk_task(file: UploadedFile, config: ChunkConfig, db: AsyncSession) -> dict:
+    """
+    为文件创建分块任务并提交到任务队列，无法提交时抛出 HTTPException
+    """
+    file_id = file.id
+    if os.path.splitext(file.file_path)[1].lower() not in PARSERS:
+        raise HTTPException(status_code=400, detail="File format not supported for chunking")
+    if config.size_unit not in SIZE_UNITS:
+        raise HTTPException(status_code=400, detail=f"Unknown size unit: {config.size_unit}")
+    try:
+        # 固定为具体的分词器名称，默认值以后变化也不影响分块结果缓存
+        config.tokenizer = get_tokenizer(config.tokenizer).name
+    except UnknownTokenizerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if config.near_duplicates not in NEAR_DUP_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown near-duplicate mode: {config.near_duplicates}")
+    if not 0 < config.near_duplicate_threshold <= 1:
+        raise HTTPException(status_code=400, detail="near_duplicate_threshold must be in (0, 1]")
+    if config.timeout is None:
+        config.timeout = settings.TASK_TIMEOUT
+    elif config.timeout < 0:
+        raise HTTPException(status_code=400, detail="timeout must not be negative")
+    
+    # 同一文件同时只允许一个分块任务，避免两个任务交错写入
+    active = await db.scalar(select(ProcessingTask).where(
+        ProcessingTask.file_id == file_id,
+        ProcessingTask.task_type == "chunk",
+        ProcessingTask.status.in_(["pending", "queued", "running"])
+    ).limit(1))
+    if active:
+        raise HTTPException(status_code=409, detail=f"File is already being processed by task {active.id}")
+    
+    # 相同内容已用相同配置分块过时直接复用结果
+    fingerprint = config_fingerprint(config.dict())
+    source = await _find_cached_chunks(file, fingerprint, db)
+    if source is not None:
+        now = datetime.utcnow()
+        task = ProcessingTask(
+            file_id=file_id,
+            task_type="chunk",
+            status="completed",
+            progress=100.0,
+            config=json.dumps(config.dict()),
+            started_at=now,
+            completed_at=now
+        )
+        db.add(task)
+        await db.flush()
+        await _reuse_chunks(file, source, task, fingerprint, db)
+        count_cache.invalidate("tasks:")
+        task_states.put(task)
+        return {
+            "task_id": task.id,
+            "file_id": file_id,
+            "config": config.dict(),
+            "status": "completed",
+            "cached": True,
+            "message": "Reused chunks from a previous run with the same content and config"
+        }
+    
+    # 进程池和等待队列都已满时拒绝新任务；Celery 后端的队列操作都要访问 broker，放到线程池中执行
+    if await run_in_threadpool(task_queue.is_saturated):
+        raise HTTPException(
+            status_code=429,
+            detail="Processing queue is full, please retry later",
+            headers={"Retry-After": "5"}
+        )
     
     # 更新文件状态
     file.status = "processing"
-    db.commit()
+    await db.commit()
     
-    # 创建处理任务
+    # 创建处理任务（worker 全忙时先标记为排队中）
+    busy = await run_in_threadpool(task_queue.is_busy)
     task = ProcessingTask(
         file_id=file_id,
         task_type="chunk",
-        status="pending",
-        config=json.dumps(config.dict())
+        status="queued" if busy else "pending",
+        config=json.dumps(config.dict()),
+        owner=task_queue.owner
     )
     db.add(task)
-    db.commit()
-    db.refresh(task)
+    await db.commit()
+    await db.refresh(task)
+    count_cache.invalidate("tasks:")
+    task_states.put(task)
     
-    # 启动后台任务
-    background_tasks.add_task(simulate_processing_task, task.id, file_id, config, db)
+    # 提交到任务队列
+    try:
+        state = await run_in_threadpool(task_queue.submit, task.id, file_id, config.dict())
+    except QueueFullError:
+        task.status = "failed"
+        task.error_message = "Processing queue is full"
+        file.status = "uploaded"
+        await db.commit()
+        task_states.put(task)
+        raise HTTPException(
+            status_code=429,
+            detail="Processing queue is full, please retry later",
+            headers={"Retry-After": "5"}
+        )
     
     return {
         "task_id": task.id,
         "file_id": file_id,
         "config": config.dict(),
-        "status": "processing",
-        "message": "Processing started"
+        "status": "processing" if state == "running" else "queued",
+        "message": "Processing started" if state == "running" else "Waiting for an available worker"
     }
 
+@router.post("/chunk")
+async def process_document(
+    file_id: int,
+    config: ChunkConfig,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    处理文档分块
+    """
+    # 检查文件是否存在
+    file = await db.get(UploadedFile, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return await submit_chunk_task(file, config, db)
+
+@router.get("/tokenizers")
+async def list_tokenizers():
+    """
+    获取可用的分词器
+    """
+    return {"tokenizers": available_tokenizers(), "default": settings.DEFAULT_TOKENIZER}
+
+@router.post("/tokens")
+async def count_tokens(request: TokenizeRequest):
+    """
+    批量计算文本的 token 数
+    """
+    try:
+        tokenizer = get_tokenizer(request.tokenizer)
+    except UnknownTokenizerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    counts = await run_in_threadpool(tokenizer.count_batch, request.texts)
+    return {"tokenizer": tokenizer.name, "counts": counts, "total": sum(counts)}
+
 @router.get("/task/{task_id}")
-async def get_task_status(task_id: int, db: Session = Depends(get_db)):
+async def get_task_status(task_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     获取任务状态
     """
-    task = db.query(ProcessingTask).filter(ProcessingTask.id == task_id).first()
-    if not task:
+    state = await task_states.get(task_id, lambda: db.get(ProcessingTask, task_id))
+    if state is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return {
-        "task_id": task.id,
-        "file_id": task.file_id,
-        "status": task.status,
-        "progress": task.progress,
-        "task_type": task.task_type,
-        "created_at": task.created_at.isoformat(),
-        "started_at": task.started_at.isoformat() if task.started_at else None,
-        "completed_at": task.completed_at.isoformat() if task.completed_at else None
-    }
+    return state
+
+def _sse_event(sequence: int, data: dict) -> bytes:
+    event_id = task_states.event_id(sequence)
+    return f"id: {event_id}\nevent: task_update\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+async def _stream_task_events(
+    task_id: Optional[int],
+    snapshot: Optional[dict],
+    snapshot_sequence: int,
+    last_event_id: Optional[int]
+) -> AsyncIterator[bytes]:
+    """
+    先发送当前状态（断线重连时改为补发 Last-Event-ID 之后错过的事件），再推送后续事件；
+    单个任务的流在任务结束后关闭
+
+    snapshot 是序号为 snapshot_sequence 时读取的状态，之后到达的事件从历史中补发
+    """
+    # 先订阅再读取历史，两者之间到达的事件不会遗漏
+    queue = task_states.subscribe(task_id)
+    try:
+        yield b"retry: 3000\n\n"
+        backlog = None
+        if last_event_id is not None:
+            backlog = task_states.events_since(last_event_id, task_id)
+        last_sent = last_event_id if backlog is not None else snapshot_sequence
+        if backlog is None:
+            # 首次连接，或错过的事件已不在缓冲区中：发送当前状态
+            if snapshot is not None:
+                yield _sse_event(snapshot_sequence, {"type": "task_state", **snapshot})
+            backlog = task_states.events_since(snapshot_sequence, task_id)
+        status = snapshot["status"] if snapshot is not None else None
+        for sequence, _, data in backlog or ():
+            last_sent = sequence
+            status = data.get("status", status)
+            yield _sse_event(sequence, data)
+        while task_id is None or status not in TERMINAL_STATUSES:
+            try:
+                sequence, _, data = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                # 注释行用于保持连接，避免被代理判定为空闲
+                yield b": keepalive\n\n"
+                continue
+            if sequence <= last_sent:
+                continue
+            last_sent = sequence
+            status = data.get("status", status)
+            yield _sse_event(sequence, data)
+    finally:
+        task_states.unsubscribe(queue, task_id)
+
+@router.get("/task/{task_id}/events")
+async def stream_task_status(
+    task_id: int,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    以 Server-Sent Events 推送任务状态变化，适用于无法保持 WebSocket 的客户端
+
+    首个事件是当前状态；断线重连时浏览器会自动带上 Last-Event-ID，只补发错过的事件
+    """
+    snapshot_sequence = task_states.sequence
+    state = await task_states.get(task_id, lambda: db.get(ProcessingTask, task_id))
+    if state is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        _stream_task_events(task_id, state, snapshot_sequence, task_states.parse_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/tasks/events")
+async def stream_all_task_events(last_event_id: Optional[str] = Header(None)):
+    """
+    以 Server-Sent Events 推送所有任务的状态变化，供任务列表页代替轮询 GET /tasks
+    """
+    return StreamingResponse(
+        _stream_task_events(None, None, task_states.sequence, task_states.parse_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/tasks")
-async def list_tasks(db: Session = Depends(get_db)):
+async def list_tasks(
+    after_id: Optional[int] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     获取任务列表
+
+    按创建时间倒序分页，把上一页返回的 next_after_id 作为 after_id 取下一页
     """
-    tasks = db.query(ProcessingTask).order_by(ProcessingTask.created_at.desc()).all()
+    query = (
+        select(ProcessingTask)
+        .order_by(ProcessingTask.created_at.desc(), ProcessingTask.id.desc())
+        .limit(limit)
+    )
+    count_query = select(func.count()).select_from(ProcessingTask)
+    if status:
+        query = query.where(ProcessingTask.status == status)
+        count_query = count_query.where(ProcessingTask.status == status)
+    if after_id is not None:
+        # 以 (created_at, id) 作为游标，只需一次主键查找
+        cursor = await db.scalar(select(ProcessingTask.created_at).where(ProcessingTask.id == after_id))
+        if cursor is not None:
+            query = query.where(or_(
+                ProcessingTask.created_at < cursor,
+                and_(ProcessingTask.created_at == cursor, ProcessingTask.id < after_id)
+            ))
+    
+    tasks = (await db.scalars(query)).all()
+    total = await count_cache.get(f"tasks:{status or ''}", lambda: db.scalar(count_query))
     
     return {
         "tasks": [
@@ -167,50 +387,109 @@ async def list_tasks(db: Session = Depends(get_db)):
                 "created_at": task.created_at.isoformat()
             }
             for task in tasks
-        ]
+        ],
+        "total": total,
+        "next_after_id": tasks[-1].id if len(tasks) == limit else None
     }
 
+# 预览可选的字段及对应的列
+PREVIEW_FIELDS = {
+    "id": DocumentChunk.id,
+    "chunk_index": DocumentChunk.chunk_index,
+    "content": DocumentChunk.content,
+    "html_content": DocumentChunk.html_content,
+    "markdown_content": DocumentChunk.markdown_content,
+    "metadata": DocumentChunk.chunk_metadata,
+}
+
 @router.get("/preview/{file_id}")
-async def preview_chunks(file_id: int, db: Session = Depends(get_db)):
+async def preview_chunks(
+    file_id: int,
+    after_chunk_index: Optional[int] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None, description="逗号分隔的字段列表，如 id,chunk_index,content,metadata"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     预览分块结果
+
+    按 chunk_index 游标分页；fields 指定返回的字段，未指定的大字段（如 html_content）不会被读取
     """
     # 检查文件是否存在
-    file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    file = await db.get(UploadedFile, file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
+    names = [name.strip() for name in fields.split(",") if name.strip()] if fields else list(PREVIEW_FIELDS)
+    unknown = [name for name in names if name not in PREVIEW_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # 分页游标依赖 chunk_index，始终读取
+    columns = [PREVIEW_FIELDS[name] for name in names]
+    if "chunk_index" not in names:
+        columns.append(DocumentChunk.chunk_index)
+    
     # 获取分块
-    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).order_by(DocumentChunk.chunk_index).all()
+    query = (
+        select(*columns)
+        .where(DocumentChunk.file_id == file_id)
+        .order_by(DocumentChunk.chunk_index)
+        .limit(limit)
+    )
+    if after_chunk_index is not None:
+        query = query.where(DocumentChunk.chunk_index > after_chunk_index)
+    rows = (await db.execute(query)).all()
+    
+    chunks = []
+    for row in rows:
+        chunk = {}
+        for name, value in zip(names, row):
+            if name == "metadata":
+                value = json.loads(value) if value else {}
+            chunk[name] = value
+        chunks.append(chunk)
+    
+    # 已完成的文件直接使用记录的分块数，处理中的文件使用缓存的计数
+    if file.status == "completed":
+        total = file.chunks_count
+    else:
+        total = await count_cache.get(
+            f"chunks:{file_id}",
+            lambda: db.scalar(select(func.count()).select_from(DocumentChunk).where(DocumentChunk.file_id == file_id))
+        )
     
     return {
         "file_id": file_id,
-        "chunks": [
-            {
-                "id": chunk.id,
-                "chunk_index": chunk.chunk_index,
-                "content": chunk.content,
-                "html_content": chunk.html_content,
-                "markdown_content": chunk.markdown_content,
-                "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {}
-            }
-            for chunk in chunks
-        ]
+        "chunks": chunks,
+        "total": total,
+        "next_after_chunk_index": rows[-1].chunk_index if len(rows) == limit else None
     }
 
 @router.delete("/task/{task_id}")
-async def cancel_task(task_id: int, db: Session = Depends(get_db)):
+async def cancel_task(task_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     取消任务
     """
-    task = db.query(ProcessingTask).filter(ProcessingTask.id == task_id).first()
+    task = await db.get(ProcessingTask, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
     if task.status in ["completed", "failed"]:
         raise HTTPException(status_code=400, detail="Cannot cancel completed or failed task")
     
+    # 运行中的任务在下一个检查点发现状态变化后自行停止并回滚已写入的分块
+    started = task.status == "running"
     task.status = "cancelled"
-    db.commit()
+    task.completed_at = datetime.utcnow()
+    if not started and task.task_type == "chunk":
+        # 尚未开始的任务不会再运行，由这里恢复文件状态
+        file = await db.get(UploadedFile, task.file_id)
+        if file is not None and file.status == "processing":
+            file.status = "completed" if file.chunks_count else "uploaded"
+    await db.commit()
+    count_cache.invalidate("tasks:")
+    await run_in_threadpool(task_queue.cancel, task_id)
+    # 更新所有进程的状态缓存和订阅者
+    await send_task_update(task_id, "cancelled", task.progress, "処理がキャンセルされました")
     
     return {"message": "Task cancelled successfully"}
\ No newline at end of file
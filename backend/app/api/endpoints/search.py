@@ -0,0 +1,61 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import json
+
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.services.search import SearchQuery, SearchQueryError, parse_metadata_filter, search_chunks
+
+router = APIRouter()
+
+@router.get("/chunks")
+async def search(
+    q: str = Query(..., min_length=1, description="检索词，空格分隔的多个词需同时出现，引号括起的部分作为一个词"),
+    file_id: Optional[List[int]] = Query(None),
+    metadata: Optional[List[str]] = Query(None, description="元数据过滤条件 key=value，如 type=table、page=3"),
+    include_content: bool = False,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=settings.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    全文检索分块
+
+    SQLite 下使用 FTS5 索引并按 bm25 相关度排序（score 越大越相关），少于 3 个字符的词使用 bigram 索引；
+    只含标点等无法索引的短词时必须指定 file_id，否则返回 400。其他数据库按 LIKE 过滤，score 为 null。
+    都返回带 <mark> 高亮的摘要；按 offset 分页，返回的 next_offset 为下一页的起点
+    """
+    try:
+        query = SearchQuery(
+            text=q,
+            file_ids=file_id,
+            metadata=[parse_metadata_filter(value) for value in metadata or ()],
+            include_content=include_content,
+            limit=limit,
+            offset=offset
+        )
+        rows = await search_chunks(query, db)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    results = []
+    for row in rows:
+        result = {
+            "chunk_id": row["id"],
+            "file_id": row["file_id"],
+            "filename": row["original_filename"],
+            "chunk_index": row["chunk_index"],
+            "score": row["score"],
+            "snippet": row["snippet"],
+            "metadata": json.loads(row["chunk_metadata"]) if row["chunk_metadata"] else {}
+        }
+        if include_content:
+            result["content"] = row["content"]
+        results.append(result)
+    
+    return {
+        "query": q,
+        "results": results,
+        "next_offset": offset + limit if len(results) == limit else None
+    }
@@ -1,108 +1,266 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import Counter
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import json
 import os
-import shutil
-import uuid
-from datetime import datetime
+import time
 
-from app.core.database import get_db
-from app.models import UploadedFile
+from app.api.endpoints.processing import ChunkConfig, chunk_config_query, submit_chunk_task
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_async_db
+from app.models import UploadedFile, DocumentChunk
+from app.services.block_store import ir_path
+from app.services.counters import count_cache
+from app.services.metrics import UPLOAD_SECONDS
+from app.services.near_dup import delete_signatures
+from app.services.uploads import StoredUpload, UploadError, receive_multipart, receive_multipart_files
 
 router = APIRouter()
 
 # 确保上传目录存在
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = settings.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/file")
-async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
+# 请求体由 receive_multipart 直接解析，这里只用于生成 API 文档
+UPLOAD_FILE_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+UPLOAD_FILES_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"]
+                }
+            }
+        }
+    }
+}
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    return upsert
+
+async def _register_uploads(stored_files: List[StoredUpload], db: AsyncSession) -> List[dict]:
     """
-    上传单个文件
+    把已保存的文件记录到数据库，用一条批量 INSERT ... ON CONFLICT 写入
+
+    相同内容（file_path 唯一）已有记录时复用该记录并增加引用计数，分块结果也随之共享；
+    并发上传相同内容时由唯一索引保证只有一条记录
     """
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="No file selected")
-    
-    # 检查文件类型
-    allowed_types = [
-        "application/pdf",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        "application/vnd.openxmlformats-officedocument.presentationml.presentation",
-        "text/plain",
-        "text/html",
-        "text/csv",
-        "application/vnd.ms-excel"
+    references = Counter(s.path for s in stored_files)
+    first = {}
+    for stored in stored_files:
+        first.setdefault(stored.path, stored)
+    rows = [
+        {
+            "filename": os.path.basename(path),
+            "original_filename": stored.filename,
+            "file_path": path,
+            "file_size": stored.size,
+            "content_hash": stored.sha256,
+            "content_type": stored.content_type,
+            "status": "uploaded",
+            "ref_count": references[path]
+        }
+        for path, stored in first.items()
     ]
-    
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"File type {file.content_type} not supported"
-        )
-    
-    # 生成唯一文件名
-    file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{file_id}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    # 保存文件
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 保存到数据库
-        db_file = UploadedFile(
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=file_path,
-            file_size=file.size,
-            content_type=file.content_type,
-            status="uploaded"
+        statement = _upsert(db.bind.dialect.name)(UploadedFile)
+        statement = statement.on_conflict_do_update(
+            index_elements=[UploadedFile.file_path],
+            set_={"ref_count": UploadedFile.ref_count + statement.excluded.ref_count}
         )
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
-        
-        return {
-            "id": db_file.id,
-            "filename": file.filename,
-            "content_type": file.content_type,
-            "size": file.size,
-            "status": "uploaded",
-            "upload_time": db_file.upload_time.isoformat()
-        }
-        
+        created = await db.scalars(
+            statement.returning(UploadedFile, sort_by_parameter_order=True),
+            rows,
+            execution_options={"populate_existing": True}
+        )
+        records = {f.file_path: f for f in created.all()}
+        await db.commit()
+        count_cache.invalidate("files")
     except Exception as e:
+        await db.rollback()
+        for stored in stored_files:
+            if not stored.deduplicated and os.path.exists(stored.path):
+                os.remove(stored.path)
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
+    
+    results = []
+    for stored in stored_files:
+        db_file = records[stored.path]
+        results.append({
+            "id": db_file.id,
+            "filename": stored.filename,
+            "content_type": stored.content_type,
+            "size": stored.size,
+            "sha256": stored.sha256,
+            "status": db_file.status,
+            # 引用计数超过本批的引用数说明记录之前就存在
+            "deduplicated": db_file.ref_count > references[stored.path] or first[stored.path] is not stored,
+            "ref_count": db_file.ref_count,
+            "upload_time": db_file.upload_time.isoformat()
+        })
+    return results
 
-@router.post("/files")
-async def upload_files(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+async def _ingest_batch(
+    received: List[Tuple[str, Union[StoredUpload, UploadError]]], chunk: bool, config: ChunkConfig
+) -> AsyncIterator[dict]:
     """
-    批量上传文件
+    批量上传的处理过程，按发生顺序产出事件：
+
+    - stored / failed: 单个文件写入完成或失败（按上传顺序）
+    - uploaded: 批量登记后每个文件的记录，chunk=true 时附带分块任务
+    - done: 汇总
     """
-    results = []
+    stored_files: List[StoredUpload] = []
+    indexes: List[int] = []
+    failed = 0
+    for index, (filename, result) in enumerate(received):
+        if isinstance(result, UploadError):
+            failed += 1
+            yield {"event": "failed", "index": index, "filename": filename, "error": result.detail, "status": "failed"}
+            continue
+        stored_files.append(result)
+        indexes.append(index)
+        yield {"event": "stored", "index": index, "filename": result.filename, "size": result.size, "sha256": result.sha256}
+    
+    if not stored_files:
+        yield {"event": "done", "uploaded": 0, "failed": failed}
+        return
     
-    for file in files:
+    async with AsyncSessionLocal() as db:
         try:
-            result = await upload_file(file, db)
-            results.append(result)
+            registered = await _register_uploads(stored_files, db)
         except HTTPException as e:
-            results.append({
-                "filename": file.filename,
-                "error": e.detail,
-                "status": "failed"
-            })
+            for index, stored in zip(indexes, stored_files):
+                yield {"event": "failed", "index": index, "filename": stored.filename, "error": e.detail, "status": "failed"}
+            yield {"event": "done", "uploaded": 0, "failed": failed + len(stored_files)}
+            return
+        
+        submitted = {}
+        for index, record in zip(indexes, registered):
+            if chunk:
+                # 同一批中的重复内容共用一条记录，只提交一次分块任务
+                if record["id"] not in submitted:
+                    try:
+                        submitted[record["id"]] = await submit_chunk_task(
+                            await db.get(UploadedFile, record["id"]), config, db
+                        )
+                    except HTTPException as e:
+                        submitted[record["id"]] = {"error": e.detail}
+                record = {**record, "task": submitted[record["id"]]}
+            yield {"event": "uploaded", "index": index, **record}
+    
+    yield {"event": "done", "uploaded": len(stored_files), "failed": failed}
+
+@router.post("/file", openapi_extra=UPLOAD_FILE_SCHEMA)
+async def upload_file(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    上传单个文件
+
+    请求体边接收边写入上传目录并计算 SHA-256，超过 MAX_FILE_SIZE 立即返回 413
+    """
+    with UPLOAD_SECONDS.time("file"):
+        try:
+            stored = (await receive_multipart(request, UPLOAD_DIR, settings.MAX_FILE_SIZE))[0]
+        except UploadError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        
+        return (await _register_uploads([stored], db))[0]
+
+@router.post("/files", openapi_extra=UPLOAD_FILES_SCHEMA)
+async def upload_files(
+    request: Request,
+    chunk: bool = False,
+    stream: bool = False,
+    config: ChunkConfig = Depends(chunk_config_query)
+):
+    """
+    批量上传文件
+
+    与单文件上传一样边接收边写入并计算 SHA-256，单个文件超过 MAX_FILE_SIZE 或类型不支持时只有该文件失败；
+    一个请求最多 MAX_UPLOAD_FILES 个文件，全部接收后用一条批量 INSERT 登记。
+    chunk=true 时随即按 chunk_size / chunk_overlap / chunk_method 为每个文件提交分块任务；
+    stream=true 时以 NDJSON 逐行返回每个文件的结果，否则在全部完成后按上传顺序返回。
+    """
+    started = time.perf_counter()
+    # 请求体在返回响应之前接收完，流式响应期间不再读取请求
+    try:
+        received = await receive_multipart_files(
+            request, UPLOAD_DIR, settings.MAX_FILE_SIZE, settings.MAX_UPLOAD_FILES
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    async def events():
+        async for event in _ingest_batch(received, chunk, config):
+            yield event
+        # 从开始接收请求体到全部文件登记（及提交分块任务）完成
+        UPLOAD_SECONDS.observe(time.perf_counter() - started, "files")
+    
+    if stream:
+        return StreamingResponse(
+            (json.dumps(event, ensure_ascii=False) + "\n" async for event in events()),
+            media_type="application/x-ndjson"
+        )
+    
+    results = [None] * len(received)
+    async for event in events():
+        if event.pop("event") in ("failed", "uploaded"):
+            results[event.pop("index")] = event
     
     return {"files": results}
 
 @router.get("/files")
-async def list_files(db: Session = Depends(get_db)):
+async def list_files(
+    after_id: Optional[int] = None,
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     获取已上传文件列表
+
+    按上传时间倒序分页，把上一页返回的 next_after_id 作为 after_id 取下一页
     """
-    files = db.query(UploadedFile).order_by(UploadedFile.upload_time.desc()).all()
+    query = (
+        select(UploadedFile)
+        .order_by(UploadedFile.upload_time.desc(), UploadedFile.id.desc())
+        .limit(limit)
+    )
+    if after_id is not None:
+        cursor = await db.scalar(select(UploadedFile.upload_time).where(UploadedFile.id == after_id))
+        if cursor is not None:
+            query = query.where(or_(
+                UploadedFile.upload_time < cursor,
+                and_(UploadedFile.upload_time == cursor, UploadedFile.id < after_id)
+            ))
+    files = (await db.scalars(query)).all()
+    total = await count_cache.get(
+        "files",
+        lambda: db.scalar(select(func.count()).select_from(UploadedFile))
+    )
     
     return {
         "files": [
@@ -116,27 +274,66 @@ async def list_files(db: Session = Depends(get_db)):
                 "chunks_count": f.chunks_count
             }
             for f in files
-        ]
+        ],
+        "total": total,
+        "next_after_id": files[-1].id if len(files) == limit else None
     }
 
 @router.delete("/files/{file_id}")
-async def delete_file(file_id: int, db: Session = Depends(get_db)):
+async def delete_file(file_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     删除文件
+
+    相同内容被多次上传时只减少引用计数，最后一个引用释放时才删除记录、分块和物理文件
     """
-    db_file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+    db_file = await db.get(UploadedFile, file_id)
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
+    file_path = db_file.file_path
+    parsed_path = ir_path(db_file)
     
-    # 删除物理文件
-    try:
-        if os.path.exists(db_file.file_path):
-            os.remove(db_file.file_path)
-    except Exception as e:
-        print(f"Warning: Could not delete file {db_file.file_path}: {e}")
+    # 引用计数的递减和记录的删除都是条件语句：并发上传相同内容会在两条语句之间增加引用计数，
+    # 此时不能删除记录，重新递减即可
+    while True:
+        ref_count = await db.scalar(
+            update(UploadedFile)
+            .where(UploadedFile.id == file_id, UploadedFile.ref_count > 1)
+            .values(ref_count=UploadedFile.ref_count - 1)
+            .returning(UploadedFile.ref_count)
+        )
+        if ref_count is not None:
+            await db.commit()
+            return {"message": "File reference released", "ref_count": ref_count}
+        
+        deleted = await db.scalar(
+            delete(UploadedFile)
+            .where(UploadedFile.id == file_id, UploadedFile.ref_count <= 1)
+            .returning(UploadedFile.id)
+        )
+        if deleted is not None:
+            break
+        if await db.scalar(select(UploadedFile.id).where(UploadedFile.id == file_id)) is None:
+            # 记录已被并发的删除请求删除
+            await db.rollback()
+            raise HTTPException(status_code=404, detail="File not found")
+    
+    # 只有确实删除了记录时才删除分块和物理文件
+    await db.execute(delete(DocumentChunk).where(DocumentChunk.file_id == file_id))
+    for statement in delete_signatures(("file_id", file_id)):
+        await db.execute(statement)
+    await db.commit()
+    count_cache.invalidate("files")
     
-    # 删除数据库记录
-    db.delete(db_file)
-    db.commit()
+    # 没有其他记录引用同一内容时删除物理文件
+    shared = await db.scalar(select(UploadedFile.id).where(UploadedFile.file_path == file_path).limit(1))
+    if shared is None:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            # 解析结果与物理文件一起删除
+            if os.path.exists(parsed_path):
+                os.remove(parsed_path)
+        except Exception as e:
+            print(f"Warning: Could not delete file {file_path}: {e}")
     
-    return {"message": "File deleted successfully"}
\ No newline at end of file
+    return {"message": "File deleted successfully"}
@@ -1,70 +1,179 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
 import json
 import asyncio
+import time
 
-from app.core.database import get_db
-from app.models import ProcessingTask
+from app.core.config import settings
+from app.services.metrics import WEBSOCKET_DROPPED_MESSAGES
+from app.services.progress_bus import progress_bus, task_update_message
 
 router = APIRouter()
 
-class ConnectionManager:
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class _Connection:
+    """
+    单个 WebSocket 连接的发送队列
+
+    消息放入有界队列后由独立的发送协程逐条发送，慢客户端只会让自己的队列变满，
+    队列满时丢弃最旧的消息，不会拖慢其他连接和调用方。
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "ConnectionManager", queue_size: int):
+        self.websocket = websocket
+        self.manager = manager
+        self.queue: Deque[str] = deque(maxlen=max(1, queue_size))
+        self.tasks: Set[int] = set()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def push(self, message: str):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            WEBSOCKET_DROPPED_MESSAGES.inc()
+        self.queue.append(message)
+        self._ready.set()
+
+    async def _send_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.queue:
+                    await self.websocket.send_text(self.queue.popleft())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.manager.disconnect(self.websocket)
+
+    def close(self):
+        self._sender.cancel()
+
+
+class _PendingUpdate:
+    __slots__ = ("last_sent", "data", "handle")
+
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.task_connections: Dict[int, List[WebSocket]] = {}
+        self.last_sent = 0.0
+        self.data: Optional[dict] = None
+        self.handle: Optional[asyncio.TimerHandle] = None
+
+
+class ConnectionManager:
+    def __init__(self, queue_size: int = 32, updates_per_second: float = 5.0):
+        self.queue_size = queue_size
+        self.min_interval = 1 / updates_per_second if updates_per_second > 0 else 0.0
+        self.connections: Dict[WebSocket, _Connection] = {}
+        self.task_connections: Dict[int, Set[WebSocket]] = {}
+        self._updates: Dict[int, _PendingUpdate] = {}
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.connections)
+
+    @property
+    def dropped_messages(self) -> int:
+        return sum(connection.dropped for connection in self.connections.values())
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.connections[websocket] = _Connection(websocket, self, self.queue_size)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        
-        # Remove from task connections
-        for task_id, connections in self.task_connections.items():
-            if websocket in connections:
-                connections.remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        connection.close()
+        # 只需要处理该连接订阅过的任务
+        for task_id in connection.tasks:
+            subscribers = self.task_connections.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.task_connections[task_id]
+                    self._discard_update(task_id)
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        try:
-            await websocket.send_text(message)
-        except:
-            self.disconnect(websocket)
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.push(message)
 
     async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
-        
-        # Clean up disconnected connections
-        for conn in disconnected:
-            self.disconnect(conn)
+        for connection in self.connections.values():
+            connection.push(message)
 
     async def send_to_task_subscribers(self, task_id: int, message: str):
-        if task_id in self.task_connections:
-            disconnected = []
-            for connection in self.task_connections[task_id]:
-                try:
-                    await connection.send_text(message)
-                except:
-                    disconnected.append(connection)
-            
-            # Clean up disconnected connections
-            for conn in disconnected:
-                self.task_connections[task_id].remove(conn)
+        self._fan_out(task_id, message)
+
+    def _fan_out(self, task_id: int, message: str):
+        # 只入队不等待发送，各连接的发送协程并发执行
+        for websocket in self.task_connections.get(task_id, ()):
+            self.connections[websocket].push(message)
 
     def subscribe_to_task(self, task_id: int, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        connection.tasks.add(task_id)
+        self.task_connections.setdefault(task_id, set()).add(websocket)
+
+    def publish_task_update(self, task_id: int, data: dict):
+        """
+        发布任务进度；同一任务每秒最多发送 updates_per_second 次，间隔内的更新只保留最新一条，
+        结束状态立即发送
+
+        限流状态只为有订阅者的任务保留，最后一个订阅者断开时清除，
+        停滞或没有发布结束状态的任务不会一直占用内存和定时器
+        """
         if task_id not in self.task_connections:
-            self.task_connections[task_id] = []
-        if websocket not in self.task_connections[task_id]:
-            self.task_connections[task_id].append(websocket)
+            self._discard_update(task_id)
+            return
+        state = self._updates.get(task_id)
+        if state is None:
+            state = self._updates[task_id] = _PendingUpdate()
+        state.data = data
+        now = time.monotonic()
+        if data.get("status") in TERMINAL_STATUSES:
+            if state.handle is not None:
+                state.handle.cancel()
+            self._updates.pop(task_id, None)
+            self._send_update(task_id, data)
+        elif now - state.last_sent >= self.min_interval:
+            self._flush_update(task_id)
+        elif state.handle is None:
+            delay = self.min_interval - (now - state.last_sent)
+            state.handle = asyncio.get_running_loop().call_later(delay, self._flush_update, task_id)
 
-manager = ConnectionManager()
+    def _discard_update(self, task_id: int):
+        state = self._updates.pop(task_id, None)
+        if state is not None and state.handle is not None:
+            state.handle.cancel()
+
+    def _flush_update(self, task_id: int):
+        state = self._updates.get(task_id)
+        if state is None or state.data is None:
+            return
+        state.handle = None
+        state.last_sent = time.monotonic()
+        data, state.data = state.data, None
+        self._send_update(task_id, data)
+        if task_id not in self.task_connections:
+            self._updates.pop(task_id, None)
+
+    def _send_update(self, task_id: int, data: dict):
+        if task_id not in self.task_connections:
+            return
+        # 每条更新只序列化一次
+        self._fan_out(task_id, json.dumps(data, ensure_ascii=False))
+
+manager = ConnectionManager(
+    queue_size=settings.WS_SEND_QUEUE_SIZE,
+    updates_per_second=settings.WS_TASK_UPDATES_PER_SECOND,
+)
 
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -100,36 +209,12 @@ async def websocket_endpoint(websocket: WebSocket):
                 )
                 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 async def send_task_update(task_id: int, status: str, progress: float = None, message: str = None):
     """
-    Send task update to all subscribers
-    """
-    update_data = {
-        "type": "task_update",
-        "task_id": task_id,
-        "status": status,
-        "timestamp": asyncio.get_event_loop().time()
-    }
-    
-    if progress is not None:
-        update_data["progress"] = progress
-    
-    if message:
-        update_data["message"] = message
-    
-    await manager.send_to_task_subscribers(task_id, json.dumps(update_data))
-
-@router.get("/connections")
-async def get_connection_stats():
-    """
-    Get WebSocket connection statistics
+    Publish a task update to the progress bus; every worker relays it to its own subscribers
     """
-    return {
-        "total_connections": len(manager.active_connections),
-        "task_subscriptions": {
-            str(task_id): len(connections) 
-            for task_id, connections in manager.task_connections.items()
-        }
-    }
\ No newline at end of file
+    await progress_bus.publish(task_id, task_update_message(task_id, status, progress, message))
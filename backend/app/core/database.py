@@ -1,18 +1,100 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
-from app.models import Base
+import os
+
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+def _engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # 内存数据库只能使用单连接池
+        return {}
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_pre_ping": True,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL 模式下读写互不阻塞；synchronous=NORMAL 在 WAL 下仍然保证崩溃一致性
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")  # 64MB
+    cursor.close()
+    # document_chunks 的 bigram 索引触发器调用的函数
+    from app.services.search import register_sqlite_functions
+    register_sqlite_functions(dbapi_connection)
 
 # Create database engine
-engine = create_engine(settings.DATABASE_URL)
+# 同步引擎供进程池 / Celery worker 和迁移使用，API 请求使用异步引擎
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+async_engine = create_async_engine(_async_url(settings.DATABASE_URL), **_engine_options(settings.DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+# Alembic 迁移脚本所在目录（backend/）
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def alembic_config(connection=None):
+    """
+    供程序内调用的 Alembic 配置，使用传入的连接执行迁移
+    """
+    from alembic.config import Config
+
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.attributes["configure_logger"] = False
+    config.attributes["connection"] = connection
+    return config
+
+def init_db():
+    """
+    将数据库升级到最新的迁移版本
+
+    引入 Alembic 之前由 create_all 建立的数据库会先被标记为初始版本再升级。
+    """
+    from alembic import command
+
+    with engine.begin() as connection:
+        config = alembic_config(connection)
+        tables = inspect(connection).get_table_names()
+        if "uploaded_files" in tables and "alembic_version" not in tables:
+            command.stamp(config, "0001")
+        command.upgrade(config, "head")
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
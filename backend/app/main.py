@@ -1,12 +1,39 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.api.endpoints import metrics
 from app.core.config import settings
+from app.core.database import init_db
+from app.api.endpoints.websocket import manager
+from app.services.exporters import close_http_client
+from app.services.progress_bus import progress_bus
+from app.services.task_queue import task_queue
+from app.services.task_state import task_states
+
+
+def _relay_progress(task_id: int, data: dict):
+    task_states.apply(task_id, data)
+    manager.publish_task_update(task_id, data)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_db()
+    # 总线上的进度（来自任意进程）更新本进程的任务状态缓存，并由 ConnectionManager 转发给连接
+    await progress_bus.start(_relay_progress)
+    task_queue.start()
+    task_queue.resume_interrupted()
+    yield
+    task_queue.shutdown()
+    await progress_bus.close()
+    await close_http_client()
 
 app = FastAPI(
     title="SmartRAG Preprocessor",
     description="Document preprocessing tool for RAG systems",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -18,6 +45,8 @@ app.add_middleware(
 )
 
 app.include_router(router, prefix="/api/v1")
+# Prometheus 默认抓取根路径下的 /metrics
+app.include_router(metrics.router, tags=["metrics"])
 
 @app.get("/")
 async def root():
@@ -1,3 +1,3 @@
-from .file import Base, UploadedFile, ProcessingTask, DocumentChunk
+from .file import Base, UploadedFile, ProcessingTask, DocumentChunk, ChunkSignature, ChunkLSHBucket
 
-__all__ = ["Base", "UploadedFile", "ProcessingTask", "DocumentChunk"]
\ No newline at end of file
+__all__ = ["Base", "UploadedFile", "ProcessingTask", "DocumentChunk", "ChunkSignature", "ChunkLSHBucket"]
\ No newline at end of file
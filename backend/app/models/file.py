@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Float, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -12,11 +12,21 @@ class UploadedFile(Base):
     original_filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=True)  # SHA-256
     content_type = Column(String, nullable=False)
     upload_time = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="uploaded")  # uploaded, processing, completed, failed
     chunks_count = Column(Integer, default=0)
     error_message = Column(String, nullable=True)
+    ref_count = Column(Integer, default=1, nullable=False)  # 重复上传相同内容时复用记录并计数
+    chunk_config_hash = Column(String(64), nullable=True)  # 当前分块结果对应的 ChunkConfig 指纹
+    
+    __table_args__ = (
+        Index("ix_uploaded_files_upload_time", "upload_time"),
+        Index("ix_uploaded_files_content_hash", "content_hash"),
+        # 内容寻址的存储路径，相同内容（和扩展名）只有一条记录
+        Index("ix_uploaded_files_file_path", "file_path", unique=True),
+    )
 
 class ProcessingTask(Base):
     __tablename__ = "processing_tasks"
@@ -24,22 +34,70 @@ class ProcessingTask(Base):
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, nullable=False)
     task_type = Column(String, nullable=False)  # chunk, export
-    status = Column(String, default="pending")  # pending, running, completed, failed
+    status = Column(String, default="pending")  # pending, queued, running, completed, failed, cancelled
     progress = Column(Float, default=0.0)
     config = Column(String, nullable=True)  # JSON string
     created_at = Column(DateTime, default=datetime.utcnow)
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error_message = Column(String, nullable=True)
+    owner = Column(String(128), nullable=True)  # 提交任务的进程（local 后端，<主机名>:<pid>），重启恢复时据此认领
+    
+    __table_args__ = (
+        Index("ix_processing_tasks_status_created_at", "status", "created_at"),
+        Index("ix_processing_tasks_file_id", "file_id"),
+    )
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
     
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=True)  # 生成该分块的处理任务，用于断点续做
     chunk_index = Column(Integer, nullable=False)
     content = Column(String, nullable=False)
     html_content = Column(String, nullable=True)
     markdown_content = Column(String, nullable=True)
     chunk_metadata = Column(String, nullable=True)  # JSON string
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 预览和导出都按 file_id 过滤、按 chunk_index 排序
+        Index("ix_document_chunks_file_id_chunk_index", "file_id", "chunk_index", unique=True),
+        Index("ix_document_chunks_task_id", "task_id"),
+    )
+
+class ChunkSignature(Base):
+    """
+    分块的 MinHash 签名，只保存非重复的分块，作为跨文件近似重复检测的索引
+    """
+    __tablename__ = "chunk_signatures"
+    
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=True)
+    chunk_index = Column(Integer, nullable=False)
+    signature = Column(LargeBinary, nullable=False)  # uint32 数组
+    
+    __table_args__ = (
+        Index("ix_chunk_signatures_file_id_chunk_index", "file_id", "chunk_index", unique=True),
+        Index("ix_chunk_signatures_task_id", "task_id"),
+    )
+
+class ChunkLSHBucket(Base):
+    """
+    LSH 分桶：每个签名按 band 计算一个桶值，桶值相同的分块是近似重复的候选
+    """
+    __tablename__ = "chunk_lsh_buckets"
+    
+    id = Column(Integer, primary_key=True)
+    bucket = Column(BigInteger, nullable=False)
+    file_id = Column(Integer, nullable=False)
+    task_id = Column(Integer, nullable=True)
+    chunk_index = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_chunk_lsh_buckets_bucket", "bucket"),
+        Index("ix_chunk_lsh_buckets_file_id", "file_id"),
+        Index("ix_chunk_lsh_buckets_task_id", "task_id"),
+    )
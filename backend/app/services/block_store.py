@@ -0,0 +1,81 @@
+"""
+解析结果（Block 流）的持久化
+
+文件第一次分块时，解析器产出的 Block 在被分块的同时写入
+``<UPLOAD_DIR>/ir/<sha256 前两位>/<sha256><扩展名>.v<版本>.jsonl.gz``，每行一个 ``[type, page, text]``。
+之后只改分块配置时直接读取这份中间结果，跳过解析。
+解析器按扩展名选择，相同内容以不同扩展名上传（如 .html 与 .txt）时解析结果不同，各自保存一份；
+键与内容寻址的存储路径一一对应，删除文件时只删除它自己的中间结果。
+解析器的输出格式变化时提高 IR_VERSION，旧的中间结果自然失效。
+"""
+from typing import Iterator
+import gzip
+import json
+import os
+import uuid
+
+from app.core.config import settings
+from app.models import UploadedFile
+from app.services.parsers import BaseParser, Block
+
+IR_VERSION = 1
+
+
+def ir_path(file: UploadedFile) -> str:
+    # 没有内容哈希的旧记录按文件 ID 存放
+    if file.content_hash:
+        key = file.content_hash + os.path.splitext(file.file_path)[1].lower()
+    else:
+        key = f"file-{file.id}"
+    return os.path.join(settings.UPLOAD_DIR, "ir", key[:2], f"{key}.v{IR_VERSION}.jsonl.gz")
+
+
+class BlockRecorder:
+    """
+    包装解析器，把产出的 Block 同时写入中间结果文件；只有完整读完时才会生成该文件
+    """
+
+    def __init__(self, parser: BaseParser, path: str):
+        self.parser = parser
+        self.path = path
+
+    @property
+    def progress(self) -> float:
+        return self.parser.progress
+
+    def iter_blocks(self) -> Iterator[Block]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = os.path.join(os.path.dirname(self.path), f".{uuid.uuid4()}.part")
+        completed = False
+        try:
+            # 压缩级别 1：中间结果只在本机读取，写入速度比压缩率重要
+            with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+                for block in self.parser.iter_blocks():
+                    f.write(json.dumps([block.type, block.page, block.text], ensure_ascii=False))
+                    f.write("\n")
+                    yield block
+            os.replace(temp_path, self.path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class BlockReader:
+    """
+    从中间结果文件读取 Block，进度按已读取的压缩字节数计算
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.progress = 0.0
+
+    def iter_blocks(self) -> Iterator[Block]:
+        total = os.path.getsize(self.path) or 1
+        with open(self.path, "rb") as raw, gzip.open(raw, "rt", encoding="utf-8") as f:
+            for line in f:
+                kind, page, text = json.loads(line)
+                self.progress = min(raw.tell() / total, 1.0)
+                yield Block(text, type=kind, page=page)
+        self.progress = 1.0
+
@@ -0,0 +1,59 @@
+"""
+处理任务的协作式取消
+
+取消接口只把任务状态改为 cancelled，运行中的任务（可能在进程池或其他节点的 worker 中）
+在页、Block、分块之间调用 ``CancellationToken.check()``，发现已取消或超过期限时
+抛出 TaskCancelled，由 pipeline 回滚该任务写入的分块。
+
+状态查询使用独立的连接，不受 pipeline 会话中未提交事务的快照影响；
+查询按 TASK_CANCEL_POLL_MS 节流，频繁调用 check() 的开销可以忽略。
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import time
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import engine
+from app.models import ProcessingTask
+
+
+class TaskCancelled(Exception):
+    def __init__(self, reason: str = "cancelled", message: Optional[str] = None):
+        super().__init__(message or f"Task {reason}")
+        self.reason = reason  # cancelled, timeout
+
+    @property
+    def timed_out(self) -> bool:
+        return self.reason == "timeout"
+
+
+def task_deadline(started_at: datetime, timeout: Optional[float]) -> Optional[datetime]:
+    if not timeout or timeout <= 0:
+        return None
+    return started_at + timedelta(seconds=timeout)
+
+
+class CancellationToken:
+    def __init__(self, task_id: int, deadline: Optional[datetime] = None, poll_interval_ms: Optional[int] = None):
+        self.task_id = task_id
+        self.deadline = deadline
+        interval = settings.TASK_CANCEL_POLL_MS if poll_interval_ms is None else poll_interval_ms
+        self.poll_interval = interval / 1000
+        self._last_poll = time.monotonic()
+
+    def check(self, force: bool = False):
+        """
+        任务已被取消或超过期限时抛出 TaskCancelled
+        """
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        if self.deadline is not None and datetime.utcnow() >= self.deadline:
+            raise TaskCancelled("timeout", f"Task timed out at {self.deadline.isoformat()}")
+        with engine.connect() as connection:
+            status = connection.scalar(select(ProcessingTask.status).where(ProcessingTask.id == self.task_id))
+        if status in (None, "cancelled"):
+            raise TaskCancelled("cancelled")
@@ -0,0 +1,72 @@
+"""
+分块批量写入
+
+分块先缓存在内存中，达到批量大小或距上次写入超过指定时间后，
+用一条 executemany 形式的 INSERT 写入，并在同一个事务中提交任务进度。
+before_flush 可以在写入前整批处理分块（如近似重复检测），返回实际写入的行。
+"""
+from typing import Callable, List, Optional
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models import DocumentChunk, ProcessingTask
+from app.services.metrics import DB_WRITE_SECONDS
+
+
+class ChunkWriter:
+    def __init__(
+        self,
+        db: Session,
+        task: ProcessingTask,
+        batch_size: int = 500,
+        flush_interval_ms: int = 500,
+        on_flush: Optional[Callable[[int, float], None]] = None,
+        before_flush: Optional[Callable[[List[dict]], List[dict]]] = None,
+    ):
+        self.db = db
+        self.task = task
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000
+        self.on_flush = on_flush
+        self.before_flush = before_flush
+        self.written = 0
+        self.write_seconds = 0.0
+        self._rows: List[dict] = []
+        self._progress = task.progress or 0.0
+        self._last_flush = time.monotonic()
+
+    def add(self, row: dict, progress: float):
+        self._rows.append(row)
+        self._progress = progress
+        if len(self._rows) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def update_progress(self, progress: float):
+        """
+        没有新分块时单独更新进度（如 PDF 逐页提取），同样按写入间隔节流
+        """
+        self._progress = progress
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        rows = []
+        if self._rows:
+            rows = self.before_flush(self._rows) if self.before_flush else self._rows
+            self._rows = []
+        # 分块与进度在同一事务中提交，断点续做时两者保持一致
+        self.task.progress = self._progress
+        if rows:
+            # INSERT 与提交计为一次批量写入；只更新进度的提交不计入
+            with DB_WRITE_SECONDS.time() as timer:
+                self.db.execute(insert(DocumentChunk), rows)
+                self.db.commit()
+            self.write_seconds += timer.seconds
+            self.written += len(rows)
+        else:
+            self.db.commit()
+        self._last_flush = time.monotonic()
+        if self.on_flush:
+            self.on_flush(self.written, self._progress)
@@ -0,0 +1,263 @@
+"""
+滑动窗口分块器
+
+对解析器产出的 Block 流做单遍扫描：每个字符只被追加和切分常数次，
+整体为 O(n)，内存中只保留当前窗口，与文档总长度无关。
+
+窗口大小可以按字符计，也可以按分词器的 token 计（size_unit="tokens"）。
+"""
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from html import escape
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from app.services.parsers import Block
+from app.services.tokenizers import Tokenizer, get_tokenizer
+
+SEPARATOR = "\n\n"
+
+SIZE_UNITS = ("chars", "tokens")
+
+# 切分超长段落时，优先在这些字符之后断开
+_BREAK_CHARS = set("。．！？!?；;\n.,，、 ")
+
+
+class _CharMeasure:
+    """
+    以字符计量窗口；位置参数均为字符下标
+    """
+    separator = len(SEPARATOR)
+
+    def length(self, text: str) -> int:
+        return len(text)
+
+    def remaining(self, text: str, start: int) -> int:
+        return len(text) - start
+
+    def advance(self, text: str, start: int, budget: int) -> int:
+        return start + budget
+
+    def tail(self, text: str, budget: int) -> int:
+        return max(0, len(text) - budget)
+
+
+class _TokenMeasure:
+    """
+    以 token 计量窗口，段落的切分结果来自分词器的缓存
+    """
+
+    def __init__(self, tokenizer: Tokenizer):
+        self.tokenizer = tokenizer
+        self.separator = tokenizer.count(SEPARATOR)
+
+    def length(self, text: str) -> int:
+        return self.tokenizer.count(text)
+
+    def remaining(self, text: str, start: int) -> int:
+        ends = self.tokenizer.token_ends(text)
+        return len(ends) - bisect_right(ends, start)
+
+    def advance(self, text: str, start: int, budget: int) -> int:
+        ends = self.tokenizer.token_ends(text)
+        first = bisect_right(ends, start)
+        return ends[min(first + budget, len(ends)) - 1]
+
+    def tail(self, text: str, budget: int) -> int:
+        ends = self.tokenizer.token_ends(text, cache=False)
+        return ends[-budget - 1] if budget < len(ends) else 0
+
+
+@dataclass
+class Chunk:
+    index: int
+    content: str
+    pieces: List[Tuple[str, str]] = field(default_factory=list)  # (type, text)
+    page: Optional[int] = None
+    page_end: Optional[int] = None
+    heading: Optional[str] = None
+    type: str = "paragraph"
+
+    def to_html(self) -> str:
+        parts = []
+        for kind, text in self.pieces:
+            body = escape(text).replace("\n", "<br>")
+            if kind == "heading":
+                parts.append(f"<h2>{body}</h2>")
+            elif kind == "table":
+                parts.append(f"<pre>{escape(text)}</pre>")
+            else:
+                parts.append(f"<p>{body}</p>")
+        return "".join(parts)
+
+    def to_markdown(self) -> str:
+        parts = []
+        for kind, text in self.pieces:
+            if kind == "heading":
+                parts.append(f"## {text}")
+            elif kind == "table":
+                parts.append(f"```\n{text}\n```")
+            else:
+                parts.append(text)
+        return SEPARATOR.join(parts)
+
+    def metadata(self, method: str, tokenizer: Optional[Tokenizer] = None) -> dict:
+        tokenizer = tokenizer or get_tokenizer()
+        return {
+            "page": self.page,
+            "page_end": self.page_end,
+            "heading": self.heading,
+            "type": self.type,
+            "chars": len(self.content),
+            "tokens": tokenizer.count(self.content),
+            "tokenizer": tokenizer.name,
+            "method": method,
+        }
+
+
+class _Window:
+    def __init__(self, size: int, overlap: int, measure=None):
+        self.size = size
+        self.overlap = overlap
+        self.measure = measure or _CharMeasure()
+        self.pieces: List[Tuple[str, str]] = []
+        self.length = 0
+        self.fresh = False  # 窗口中是否有尚未输出过的内容
+        self.first_type = "paragraph"
+        self.page = None
+        self.page_end = None
+        self.heading = None
+
+    def _append(self, kind: str, text: str, page: Optional[int], heading: Optional[str], units: int):
+        if not self.fresh:
+            self.first_type = kind
+            self.page = page
+            self.heading = heading
+        if self.pieces:
+            self.length += self.measure.separator
+        self.pieces.append((kind, text))
+        self.length += units
+        self.page_end = page
+        self.fresh = True
+
+    def flush(self, carry: bool) -> Tuple[str, List[Tuple[str, str]], Optional[int], Optional[int], Optional[str], str]:
+        content = SEPARATOR.join(text for _, text in self.pieces)
+        result = (content, self.pieces, self.page, self.page_end, self.heading, self.first_type)
+        self.pieces = []
+        self.length = 0
+        self.fresh = False
+        if carry and self.overlap:
+            tail = content[self.measure.tail(content, self.overlap):].lstrip()
+            if tail:
+                self.pieces.append((result[1][-1][0], tail))
+                self.length = self.measure.length(tail)
+        return result
+
+    def add(self, kind: str, text: str, page: Optional[int], heading: Optional[str]) -> list:
+        emitted = []
+        measure = self.measure
+        units = measure.remaining(text, 0)
+        separator = measure.separator if self.pieces else 0
+        room = self.size - self.length - separator
+        # 放不下时先输出当前窗口；若本段本身就超过一个窗口且剩余空间足够，则直接从剩余空间开始切分
+        if self.fresh and units > room and (units <= self.size or room < self.size // 4):
+            emitted.append(self.flush(carry=True))
+
+        position = 0
+        while True:
+            separator = measure.separator if self.pieces else 0
+            room = self.size - self.length - separator
+            if room <= 0:
+                if self.fresh:
+                    # 窗口已满（chunk_size 很小时分隔符就会占满），先输出尚未输出的内容
+                    emitted.append(self.flush(carry=True))
+                else:
+                    # 重叠部分已占满窗口，放弃重叠以保证前进
+                    self.pieces, self.length = [], 0
+                continue
+            rest = measure.remaining(text, position)
+            if rest <= room:
+                self._append(kind, text[position:], page, heading, rest)
+                return emitted
+            cut = _find_cut(text, position, measure.advance(text, position, room))
+            self._append(kind, text[position:cut].rstrip(), page, heading, rest - measure.remaining(text, cut))
+            emitted.append(self.flush(carry=True))
+            position = cut
+            while position < len(text) and text[position].isspace():
+                position += 1
+            if position >= len(text):
+                return emitted
+
+
+def _find_cut(text: str, start: int, end: int) -> int:
+    """
+    在窗口末尾 1/5 的范围内寻找自然断点，找不到则硬切
+    """
+    floor = max(start + 1, end - (end - start) // 5)
+    for position in range(end, floor - 1, -1):
+        if text[position - 1] in _BREAK_CHARS:
+            return position
+    return end
+
+
+def chunk_blocks(
+    blocks: Iterable[Block],
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    chunk_method: str = "paragraph",
+    size_unit: str = "chars",
+    tokenizer: Optional[Tokenizer] = None,
+) -> Iterator[Chunk]:
+    """
+    按 chunk_method 对 Block 流分块
+
+    - paragraph: 以段落为单位装箱，超长段落按窗口切分
+    - page: 页边界处强制断开
+    - heading: 标题处强制断开，标题作为新块的开头
+
+    size_unit="tokens" 时 chunk_size / chunk_overlap 按 tokenizer 的 token 数计
+    """
+    if size_unit not in SIZE_UNITS:
+        raise ValueError(f"Unknown size unit: {size_unit}")
+    size = max(1, chunk_size)
+    overlap = max(0, min(chunk_overlap, size // 2))
+    measure = _TokenMeasure(tokenizer or get_tokenizer()) if size_unit == "tokens" else _CharMeasure()
+    window = _Window(size, overlap, measure)
+    heading = None
+    index = 0
+
+    def build(flushed) -> Chunk:
+        content, pieces, page, page_end, chunk_heading, first_type = flushed
+        return Chunk(
+            index=index,
+            content=content,
+            pieces=pieces,
+            page=page,
+            page_end=page_end,
+            heading=chunk_heading,
+            type=first_type,
+        )
+
+    for block in blocks:
+        text = block.text.strip()
+        if not text:
+            continue
+
+        boundary = (
+            (chunk_method == "page" and window.page_end is not None and block.page != window.page_end)
+            or (chunk_method == "heading" and block.type == "heading")
+        )
+        if boundary and window.fresh:
+            yield build(window.flush(carry=False))
+            index += 1
+        elif boundary:
+            window.flush(carry=False)
+
+        if block.type == "heading":
+            heading = text
+
+        for flushed in window.add(block.type, text, block.page, heading):
+            yield build(flushed)
+            index += 1
+
+    if window.fresh:
+        yield build(window.flush(carry=False))
@@ -0,0 +1,36 @@
+"""
+行数缓存
+
+列表接口需要返回总数，但每次轮询都执行 COUNT(*) 代价很高。
+这里按 key 缓存计数结果，TTL 内直接返回；本进程内的写入路径主动失效，
+其他进程（worker）的写入由 TTL 兜底。
+"""
+from typing import Awaitable, Callable, Dict, Tuple
+import time
+
+from app.core.config import settings
+
+
+class CountCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._values: Dict[str, Tuple[float, int]] = {}
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[int]]) -> int:
+        cached = self._values.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        value = await loader()
+        self._values[key] = (now, value)
+        return value
+
+    def invalidate(self, prefix: str = ""):
+        """
+        失效以 prefix 开头的所有 key，不传则全部失效
+        """
+        for key in [key for key in self._values if key.startswith(prefix)]:
+            self._values.pop(key, None)
+
+
+count_cache = CountCache(ttl=settings.COUNT_CACHE_TTL)
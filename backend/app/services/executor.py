@@ -0,0 +1,211 @@
+"""
+处理任务的进程池
+
+解析和分块是 CPU 密集型工作，放在独立进程中执行，避免阻塞服务 API 请求的事件循环。
+worker 的进度通过跨进程队列回传，由主进程中的转发线程投递到事件循环并推送给 WebSocket；
+每个任务结束后 worker 记录的指标也经同一队列回传，在主进程中合并。
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+import asyncio
+import multiprocessing
+import threading
+
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+
+# worker 进程内的进度队列，由 initializer 设置
+_progress_queue = None
+
+# 进度队列中携带指标的消息，其余消息为 (task_id, status, progress, message)
+METRICS_MESSAGE = "metrics"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _init_worker(progress_queue, pool_workers: int):
+    from app.services.parsers import set_pool_workers
+
+    global _progress_queue
+    _progress_queue = progress_queue
+    # 大 PDF 的并行提取在各 worker 之间分摊 CPU，避免嵌套进程池占满机器
+    set_pool_workers(pool_workers)
+
+
+def _report(task_id: int, status: str, progress: Optional[float] = None, message: Optional[str] = None):
+    if _progress_queue is not None:
+        _progress_queue.put((task_id, status, progress, message))
+
+
+def _run_in_worker(task_id: int, file_id: int, config: dict):
+    from app.services.metrics import registry
+    from app.services.pipeline import run_chunk_job
+
+    try:
+        run_chunk_job(task_id, file_id, config, _report)
+    finally:
+        # worker 进程中记录的指标交给主进程合并
+        if _progress_queue is not None and registry.enabled:
+            drained = registry.drain()
+            if drained:
+                _progress_queue.put((METRICS_MESSAGE, drained))
+
+
+class ProcessingExecutor:
+    def __init__(self, max_workers: int, max_queued: int, max_retries: int = 0, retry_backoff: float = 1.0):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._relay: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._futures: Dict[int, Future] = {}
+        self._attempts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return len(self._futures)
+
+    @property
+    def running(self) -> int:
+        return min(self.pending, self.max_workers)
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.max_workers)
+
+    def is_saturated(self) -> bool:
+        return self.pending >= self.max_workers + self.max_queued
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self._pool is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        # spawn 避免子进程继承主进程的数据库连接和线程状态
+        self._context = multiprocessing.get_context("spawn")
+        self._progress_queue = self._context.Queue()
+        self._pool = self._create_pool()
+        self._relay = threading.Thread(target=self._relay_progress, name="progress-relay", daemon=True)
+        self._relay.start()
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue, self.max_workers),
+        )
+
+    def shutdown(self):
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._progress_queue.put(None)
+        self._relay.join(timeout=5)
+        self._pool = None
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        """
+        提交任务，返回 "running" 或 "queued"；进程池和等待队列都已满时抛出 QueueFullError
+        """
+        self.start()
+        with self._lock:
+            if self.is_saturated():
+                raise QueueFullError("Processing queue is full")
+            state = "queued" if self.pending >= self.max_workers else "running"
+            self._attempts[task_id] = 0
+            self._submit(task_id, file_id, config)
+        return state
+
+    def cancel(self, task_id: int):
+        """
+        取消尚未开始的任务；已在 worker 中运行的任务由 pipeline 通过取消检查自行停止
+        """
+        with self._lock:
+            future = self._futures.get(task_id)
+        if future is not None:
+            future.cancel()
+
+    def _submit(self, task_id: int, file_id: int, config: dict):
+        future = self._pool.submit(_run_in_worker, task_id, file_id, config)
+        self._futures[task_id] = future
+        future.add_done_callback(lambda f: self._on_done(task_id, file_id, config, f))
+
+    def _on_done(self, task_id: int, file_id: int, config: dict, future: Future):
+        if future.cancelled():
+            with self._lock:
+                self._futures.pop(task_id, None)
+                self._attempts.pop(task_id, None)
+            return
+        error = future.exception()
+        if error is None:
+            with self._lock:
+                self._futures.pop(task_id, None)
+                self._attempts.pop(task_id, None)
+            return
+
+        # worker 进程崩溃或数据库临时不可用时重试，pipeline 会从断点继续
+        retryable = isinstance(error, (BrokenProcessPool, OperationalError))
+        with self._lock:
+            attempt = self._attempts.get(task_id, 0) + 1
+            if retryable and attempt <= self.max_retries and self._pool is not None:
+                self._attempts[task_id] = attempt
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                timer = threading.Timer(delay, self._retry, args=(task_id, file_id, config))
+                timer.daemon = True
+                timer.start()
+                return
+            self._futures.pop(task_id, None)
+            self._attempts.pop(task_id, None)
+        # worker 进程异常退出时，任务状态不会被 pipeline 自己更新
+        self._mark_failed(task_id, error)
+
+    def _retry(self, task_id: int, file_id: int, config: dict):
+        with self._lock:
+            if self._pool is None:
+                return
+            try:
+                self._submit(task_id, file_id, config)
+            except BrokenProcessPool:
+                # 进程池中有 worker 崩溃后整个池不可用，需要重建
+                self._pool = self._create_pool()
+                self._submit(task_id, file_id, config)
+
+    def _mark_failed(self, task_id: int, error: BaseException):
+        from app.services.pipeline import mark_task_failed
+
+        mark_task_failed(task_id, error)
+        self._forward((task_id, "failed", None, f"処理に失敗しました: {error}"))
+
+    def _forward(self, update):
+        from app.api.endpoints.websocket import send_task_update
+
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(send_task_update(*update), self._loop)
+
+    def _relay_progress(self):
+        while True:
+            update = self._progress_queue.get()
+            if update is None:
+                break
+            if update[0] == METRICS_MESSAGE:
+                from app.services.metrics import registry
+
+                registry.merge(update[1])
+                continue
+            self._forward(update)
+
+
+executor = ProcessingExecutor(
+    max_workers=settings.PROCESSING_WORKERS,
+    max_queued=settings.PROCESSING_QUEUE_SIZE,
+    max_retries=settings.TASK_MAX_RETRIES,
+    retry_backoff=settings.TASK_RETRY_BACKOFF,
+)
@@ -0,0 +1,231 @@
+"""
+导出 schema 注册表
+
+每个 schema 用一组字段声明分块的输出结构，注册时编译成两个函数：
+
+- ``serialize(chunk, file) -> bytes``: 直接拼接 JSON 字节，数据库中已经是 JSON 文本的
+  chunk_metadata 原样嵌入，不再 json.loads / json.dumps 一遍
+- ``to_dict(chunk, file) -> dict``: 需要 Python 对象时使用（如 Dify 导出）
+
+安装了 orjson 时用它编码字段值。第三方包可以通过 ``smartrag.export_schemas``
+entry point 提供 ExportSchema 对象来增加新的格式。
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from importlib.metadata import entry_points
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+
+from app.models import DocumentChunk, UploadedFile
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 是可选依赖
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "smartrag.export_schemas"
+
+Getter = Callable[[DocumentChunk, UploadedFile], Any]
+
+
+def encode(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@dataclass
+class Field:
+    """
+    输出字段；raw=True 表示 getter 返回的已经是 JSON 文本，children 用于嵌套对象
+    """
+    name: str
+    getter: Optional[Getter] = None
+    raw: bool = False
+    children: Optional[List["Field"]] = None
+
+
+def _compile_bytes(fields: List[Field]) -> Callable[[DocumentChunk, UploadedFile], bytes]:
+    # 键名和分隔符只编码一次
+    parts = []
+    for position, f in enumerate(fields):
+        prefix = (b"{" if position == 0 else b",") + encode(f.name) + b":"
+        if f.children is not None:
+            parts.append((prefix, _compile_bytes(f.children), False))
+        else:
+            parts.append((prefix, f.getter, f.raw))
+
+    def serialize(chunk: DocumentChunk, file: UploadedFile) -> bytes:
+        out = []
+        for prefix, getter, raw in parts:
+            out.append(prefix)
+            value = getter(chunk, file)
+            if isinstance(value, bytes):
+                out.append(value)
+            elif raw:
+                out.append(value.encode("utf-8"))
+            else:
+                out.append(encode(value))
+        out.append(b"}")
+        return b"".join(out)
+
+    if not fields:
+        return lambda chunk, file: b"{}"
+    return serialize
+
+
+def _compile_dict(fields: List[Field]) -> Callable[[DocumentChunk, UploadedFile], Dict[str, Any]]:
+    parts = [
+        (f.name, _compile_dict(f.children) if f.children is not None else f.getter, f.raw)
+        for f in fields
+    ]
+
+    def to_dict(chunk: DocumentChunk, file: UploadedFile) -> Dict[str, Any]:
+        data = {}
+        for name, getter, raw in parts:
+            value = getter(chunk, file)
+            data[name] = json.loads(value) if raw else value
+        return data
+
+    return to_dict
+
+
+def _default_envelope(file: UploadedFile, total_chunks: int) -> Tuple[Dict[str, Any], str]:
+    return {}, "chunks"
+
+
+@dataclass
+class ExportSchema:
+    name: str
+    description: str
+    fields: List[Field]
+    # 返回 (外层字段, 分块列表的键名)
+    envelope: Callable[[UploadedFile, int], Tuple[Dict[str, Any], str]] = _default_envelope
+    serialize: Callable[[DocumentChunk, UploadedFile], bytes] = field(init=False)
+    to_dict: Callable[[DocumentChunk, UploadedFile], Dict[str, Any]] = field(init=False)
+
+    def __post_init__(self):
+        self.serialize = _compile_bytes(self.fields)
+        self.to_dict = _compile_dict(self.fields)
+
+    @property
+    def field_names(self) -> List[str]:
+        return [f.name for f in self.fields]
+
+
+EXPORT_SCHEMAS: Dict[str, ExportSchema] = {}
+_plugins_loaded = False
+
+
+def register_schema(schema: ExportSchema) -> ExportSchema:
+    EXPORT_SCHEMAS[schema.name] = schema
+    return schema
+
+
+def load_plugins():
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            schema = entry_point.load()
+            register_schema(schema() if callable(schema) and not isinstance(schema, ExportSchema) else schema)
+        except Exception:
+            logger.exception("Failed to load export schema plugin %s", entry_point.name)
+
+
+def get_schema(name: str) -> Optional[ExportSchema]:
+    load_plugins()
+    return EXPORT_SCHEMAS.get(name)
+
+
+def list_schemas() -> List[ExportSchema]:
+    load_plugins()
+    return list(EXPORT_SCHEMAS.values())
+
+
+def _metadata(chunk: DocumentChunk, file: UploadedFile) -> str:
+    # 分块元数据在写入时已经序列化为 JSON 文本
+    return chunk.chunk_metadata or "{}"
+
+
+def _standard_envelope(file: UploadedFile, total_chunks: int):
+    return {
+        "file_id": file.id,
+        "filename": file.original_filename,
+        "total_chunks": total_chunks,
+        "export_time": datetime.now().isoformat()
+    }, "chunks"
+
+
+def _dify_envelope(file: UploadedFile, total_chunks: int):
+    return {
+        "file_info": {
+            "filename": file.original_filename,
+            "source": file.original_filename,
+            "created_at": file.upload_time.isoformat()
+        }
+    }, "chunks"
+
+
+def _elasticsearch_envelope(file: UploadedFile, total_chunks: int):
+    return {"index_name": "smartrag_docs"}, "documents"
+
+
+register_schema(ExportSchema(
+    name="standard",
+    description="标准JSON格式",
+    fields=[
+        Field("id", lambda c, f: c.id),
+        Field("chunk_index", lambda c, f: c.chunk_index),
+        Field("content", lambda c, f: c.content),
+        Field("html_content", lambda c, f: c.html_content),
+        Field("markdown_content", lambda c, f: c.markdown_content),
+        Field("metadata", _metadata, raw=True),
+    ],
+    envelope=_standard_envelope,
+))
+
+register_schema(ExportSchema(
+    name="dify",
+    description="Dify知识库格式",
+    fields=[
+        Field("text", lambda c, f: c.content),
+        Field("metadata", _metadata, raw=True),
+        Field("source", lambda c, f: f.original_filename),
+    ],
+    envelope=_dify_envelope,
+))
+
+register_schema(ExportSchema(
+    name="elasticsearch",
+    description="Elasticsearch索引格式",
+    fields=[
+        Field("content", lambda c, f: c.content),
+        Field("title", lambda c, f: f"{f.original_filename} - Chunk {c.chunk_index + 1}"),
+        Field("metadata", _metadata, raw=True),
+        Field("timestamp", lambda c, f: c.created_at.isoformat()),
+        Field("source_file", lambda c, f: f.original_filename),
+    ],
+    envelope=_elasticsearch_envelope,
+))
+
+register_schema(ExportSchema(
+    name="qdrant",
+    description="Qdrant/Milvus 向量库 payload 格式",
+    fields=[
+        Field("id", lambda c, f: c.id),
+        Field("payload", children=[
+            Field("file_id", lambda c, f: c.file_id),
+            Field("source", lambda c, f: f.original_filename),
+            Field("chunk_index", lambda c, f: c.chunk_index),
+            Field("content", lambda c, f: c.content),
+            Field("metadata", _metadata, raw=True),
+        ]),
+    ],
+    envelope=lambda file, total_chunks: ({"collection": "smartrag_docs"}, "points"),
+))
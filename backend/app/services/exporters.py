@@ -0,0 +1,343 @@
+"""
+外部知识库导出
+
+通过共享的异步 HTTP 客户端（连接池）把分块批量写入 Dify 知识库或 Elasticsearch。
+批次并发发送，网络错误、429 和 5xx 按指数退避重试；
+单个分块写入失败不会中断整个导出，结果中报告成功数、失败数和失败原因。
+"""
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+
+import httpx
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+# 结果中最多保留的错误条数
+MAX_REPORTED_ERRORS = 100
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    进程内共享的 HTTP 客户端，复用到同一目标的连接
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=settings.EXPORT_HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=settings.EXPORT_HTTP_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class ExportError(Exception):
+    pass
+
+
+@dataclass
+class ExportResult:
+    exported: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    aborted: bool = False  # 目标不可用，导出在中途停止
+
+    @property
+    def status(self) -> str:
+        if self.aborted:
+            return "aborted"
+        if not self.failed:
+            return "completed"
+        return "partial" if self.exported else "failed"
+
+    def add_error(self, chunk_index: Optional[int], error: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"chunk_index": chunk_index, "error": error})
+
+    def abort(self, chunk_index: Optional[int], error: str, unsent: int):
+        """
+        停止导出：未发送的 unsent 条记录全部计为失败，错误只记录一条
+        """
+        self.aborted = True
+        self.failed += unsent
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"chunk_index": chunk_index, "error": error})
+
+
+# 待导出的一条记录：(chunk_index, 文档字典或已序列化的 JSON 字节)
+ExportItem = Tuple[int, Union[Dict[str, Any], bytes]]
+
+
+class BulkExporter:
+    """
+    分批并发导出的公共部分，子类实现 ``send_batch``
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        batch_size: int,
+        concurrency: int,
+        max_retries: int,
+        retry_backoff: float,
+    ):
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        发送请求，网络错误和可重试的状态码按指数退避重试，其他错误状态抛出 ExportError
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if response.status_code not in RETRYABLE_STATUS:
+                    if response.is_error:
+                        raise ExportError(f"HTTP {response.status_code}: {response.text[:200]}")
+                    return response
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            attempt += 1
+            if attempt > self.max_retries:
+                raise ExportError(error)
+            await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    async def send_batch(self, batch: List[ExportItem], result: ExportResult):
+        raise NotImplementedError
+
+    async def prepare(self, first: ExportItem, result: ExportResult) -> bool:
+        """
+        发送第一批之前调用，返回 True 表示第一条记录已经写入；
+        第一条记录写入后才失败时，应先把它计入 result.exported 再抛出异常
+        """
+        return False
+
+    async def export(self, items: AsyncIterator[ExportItem]) -> ExportResult:
+        result = ExportResult()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = set()
+
+        async def run(batch: List[ExportItem]):
+            try:
+                await self.send_batch(batch, result)
+            except Exception as e:
+                # 整批失败（重试耗尽、响应无法解析等）
+                for chunk_index, _ in batch:
+                    result.add_error(chunk_index, str(e))
+            finally:
+                result.batches += 1
+                semaphore.release()
+
+        batch: List[ExportItem] = []
+        prepared = False
+        async for item in items:
+            if not prepared:
+                prepared = True
+                try:
+                    if await self.prepare(item, result):
+                        continue
+                except Exception as e:
+                    # 目标不可用时没有继续发送的意义，其余记录全部计为失败
+                    unsent = 0 if result.exported else 1
+                    async for _ in items:
+                        unsent += 1
+                    result.abort(item[0], str(e), unsent)
+                    return result
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                # 并发批次数达到上限时等待，读取数据库的速度不会超过发送速度
+                await semaphore.acquire()
+                pending.add(asyncio.create_task(run(batch)))
+                batch = []
+        if batch:
+            await semaphore.acquire()
+            pending.add(asyncio.create_task(run(batch)))
+        if pending:
+            await asyncio.gather(*pending)
+        return result
+
+
+class ElasticsearchExporter(BulkExporter):
+    """
+    通过 _bulk 接口写入，每批一个 NDJSON 请求体；文档 ID 为 ``<file_id>-<chunk_index>``，重复导出会覆盖
+    """
+
+    def __init__(self, client: httpx.AsyncClient, es_url: str, index_name: str, file_id: int,
+                 api_key: Optional[str] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, **options):
+        super().__init__(client, **options)
+        self.url = es_url.rstrip("/") + "/_bulk"
+        self.index_name = index_name
+        self.file_id = file_id
+        self.headers = {"Content-Type": "application/x-ndjson"}
+        if api_key:
+            self.headers["Authorization"] = f"ApiKey {api_key}"
+        self.auth = (username, password or "") if username else None
+
+    def _body(self, batch: List[ExportItem]) -> bytes:
+        lines = []
+        for chunk_index, document in batch:
+            action = {"index": {"_index": self.index_name, "_id": f"{self.file_id}-{chunk_index}"}}
+            lines.append(json.dumps(action).encode())
+            # 文档可以是已经序列化好的 JSON 字节
+            if not isinstance(document, bytes):
+                document = json.dumps(document, ensure_ascii=False).encode("utf-8")
+            lines.append(document)
+        return b"\n".join(lines) + b"\n"
+
+    async def send_batch(self, batch: List[ExportItem], result: ExportResult):
+        attempt = 0
+        while batch:
+            try:
+                response = await self.request(
+                    "POST", self.url, content=self._body(batch), headers=self.headers, auth=self.auth
+                )
+                body = response.json()
+            except Exception as e:
+                # 重试被限流的文档时失败，只报告尚未写入的部分
+                if not attempt:
+                    raise
+                for chunk_index, _ in batch:
+                    result.add_error(chunk_index, str(e))
+                return
+            if not body.get("errors"):
+                result.exported += len(batch)
+                return
+            # 只重试被限流的文档，其他失败直接报告
+            throttled = []
+            for item, outcome in zip(batch, body.get("items", [])):
+                action = next(iter(outcome.values()))
+                status = action.get("status", 500)
+                if status < 300:
+                    result.exported += 1
+                elif status == 429 and attempt < self.max_retries:
+                    throttled.append(item)
+                else:
+                    reason = action.get("error", {})
+                    if isinstance(reason, dict):
+                        reason = f"{reason.get('type')}: {reason.get('reason')}"
+                    result.add_error(item[0], f"HTTP {status}: {reason}")
+            batch = throttled
+            if batch:
+                attempt += 1
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+
+class DifyExporter(BulkExporter):
+    """
+    通过 Dify 知识库 API 写入分段
+
+    未指定 document_id 时用第一个分块创建文档（create-by-text），等待文档索引完成后，
+    其余分块作为分段批量追加（Dify 拒绝向尚未索引完成的文档追加分段）。
+    """
+
+    def __init__(self, client: httpx.AsyncClient, api_endpoint: str, api_key: str, dataset_id: str,
+                 document_name: str, document_id: Optional[str] = None,
+                 indexing_poll_interval: float = settings.DIFY_INDEXING_POLL_INTERVAL,
+                 indexing_timeout: float = settings.DIFY_INDEXING_TIMEOUT, **options):
+        super().__init__(client, **options)
+        self.base_url = api_endpoint.rstrip("/")
+        self.dataset_id = dataset_id
+        self.document_name = document_name
+        self.document_id = document_id
+        self.indexing_poll_interval = indexing_poll_interval
+        self.indexing_timeout = indexing_timeout
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def wait_for_indexing(self, batch: str):
+        """
+        轮询 create-by-text 返回的批次的索引状态，直到 completed；出错、暂停或超时时抛出 ExportError
+        """
+        url = f"{self.base_url}/datasets/{self.dataset_id}/documents/{batch}/indexing-status"
+        deadline = asyncio.get_running_loop().time() + self.indexing_timeout
+        while True:
+            response = await self.request("GET", url, headers=self.headers)
+            documents = response.json().get("data") or [{}]
+            status = next((document for document in documents if document.get("id") == self.document_id),
+                          documents[0]).get("indexing_status")
+            if status == "completed":
+                return
+            if status in ("error", "paused"):
+                raise ExportError(f"Dify document indexing {status}")
+            if asyncio.get_running_loop().time() >= deadline:
+                raise ExportError(f"Dify document indexing not completed after {self.indexing_timeout}s ({status})")
+            await asyncio.sleep(self.indexing_poll_interval)
+
+    async def prepare(self, first: ExportItem, result: ExportResult) -> bool:
+        if self.document_id:
+            return False
+        chunk_index, segment = first
+        response = await self.request(
+            "POST",
+            f"{self.base_url}/datasets/{self.dataset_id}/document/create-by-text",
+            headers=self.headers,
+            json={
+                "name": self.document_name,
+                "text": segment["content"],
+                "indexing_technique": "high_quality",
+                # 分块已经切好，不让 Dify 再次切分
+                "process_rule": {"mode": "custom", "rules": {
+                    "pre_processing_rules": [],
+                    "segmentation": {"separator": "\n\n\n\n", "max_tokens": 4000}
+                }},
+            },
+        )
+        body = response.json()
+        self.document_id = body["document"]["id"]
+        # 文档已经用第一个分块创建，即使等待索引失败也计为已写入，由调用方报告 document_id
+        result.exported += 1
+        await self.wait_for_indexing(body.get("batch") or self.document_id)
+        return True
+
+    async def send_batch(self, batch: List[ExportItem], result: ExportResult):
+        await self.request(
+            "POST",
+            f"{self.base_url}/datasets/{self.dataset_id}/documents/{self.document_id}/segments",
+            headers=self.headers,
+            json={"segments": [segment for _, segment in batch]},
+        )
+        result.exported += len(batch)
+
+
+def _option(config: Dict[str, Any], key: str, convert: type, minimum: float, default: Any):
+    value = config.get(key, default)
+    try:
+        if isinstance(value, bool) or (convert is int and isinstance(value, float) and not value.is_integer()):
+            raise ValueError
+        converted = convert(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"{key} must be a number, got {value!r}")
+    if converted < minimum:
+        raise HTTPException(status_code=400, detail=f"{key} must be at least {minimum}")
+    return converted
+
+
+def exporter_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    请求中可以覆盖的批量参数，未指定时使用配置文件中的默认值；类型或范围不对时返回 400
+    """
+    return {
+        "batch_size": _option(config, "batch_size", int, 1, settings.EXPORT_BATCH_SIZE),
+        "concurrency": _option(config, "concurrency", int, 1, settings.EXPORT_CONCURRENCY),
+        "max_retries": _option(config, "max_retries", int, 0, settings.EXPORT_MAX_RETRIES),
+        "retry_backoff": _option(config, "retry_backoff", float, 0, settings.EXPORT_RETRY_BACKOFF),
+    }
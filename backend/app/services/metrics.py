@@ -0,0 +1,319 @@
+"""
+Prometheus 指标
+
+进程内的轻量实现，按 Prometheus 文本格式（0.0.4）由 ``GET /metrics`` 输出，不依赖 prometheus_client：
+
+- Histogram: 固定桶的直方图，可带标签；``with HISTOGRAM.time("pdf"):`` 记录代码块的耗时
+- StageTimer: 解析和分块在流式处理中交替进行，各自的耗时分散在多次 next() 中，
+  由 StageTimer 累计，阶段结束后 observe 一次
+- Gauge: 抓取时设置或调用函数取值（队列深度、连接数等）
+- Counter: 只增不减的计数（丢弃的消息数等），在事件发生处 inc()
+
+METRICS_ENABLED=false 时 time() 返回共享的空上下文，StageTimer 不读时钟，observe() 直接返回。
+进程池 worker 中记录的值在每个任务结束后随进度队列回传主进程合并（drain / merge）；
+Celery worker 的阶段耗时留在 worker 进程中，不出现在 API 进程的 /metrics 里。
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20, 100 << 20, 1 << 30)
+
+# 标签值 -> [各桶计数（不累计，最后一个为 +Inf）, 总和, 次数]
+HistogramValues = Dict[Tuple[str, ...], List[Any]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started", "seconds")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.started
+        self.histogram.observe(self.seconds, *self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+    seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if samples is None:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> Dict[str, HistogramValues]:
+        """
+        取出并清零本进程记录的直方图，供 worker 回传给主进程
+        """
+        drained = {}
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Histogram):
+                values = metric.drain()
+                if values:
+                    drained[name] = values
+        return drained
+
+    def merge(self, drained: Dict[str, HistogramValues]):
+        for name, values in drained.items():
+            metric = self._metrics.get(name)
+            if isinstance(metric, Histogram):
+                metric.merge(values)
+
+
+registry = MetricsRegistry(settings.METRICS_ENABLED)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS, registry: MetricsRegistry = registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.registry = registry
+        self._values: HistogramValues = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, *labels: str):
+        if not self.registry.enabled:
+            return
+        # 桶的上界包含等于的值（le）
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels: str):
+        """
+        ``with histogram.time(*labels) as timer:`` 记录代码块耗时，结束后 timer.seconds 为本次耗时
+        """
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def drain(self) -> HistogramValues:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: HistogramValues):
+        with self._lock:
+            for labels, (counts, total, count) in values.items():
+                labels = tuple(labels)
+                state = self._values.get(labels)
+                if state is None:
+                    state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for position, bucket_count in enumerate(counts):
+                    state[0][position] += bucket_count
+                state[1] += total
+                state[2] += count
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+        lines = []
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, registry: MetricsRegistry = registry):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        self._value: Optional[float] = None
+        self._function: Optional[Callable[[], float]] = None
+        registry.register(self)
+
+    def set(self, value: float):
+        if not self.registry.enabled:
+            return
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        抓取时调用 function 取值
+        """
+        self._function = function
+
+    def samples(self) -> Optional[List[str]]:
+        value = self._value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                logger.exception("Failed to collect gauge %s", self.name)
+                return None
+        if value is None:
+            return None
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, registry: MetricsRegistry = registry):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry
+        self.value = 0.0
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1.0):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value)}"]
+
+
+class StageTimer:
+    """
+    累计一个阶段分散在多次调用中的耗时：``with timer:`` 计入代码块，``timer.wrap(iterable)`` 计入每次 next()
+    """
+    __slots__ = ("seconds", "enabled", "_started")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.enabled = registry.enabled
+
+    def __enter__(self):
+        if self.enabled:
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            self.seconds += time.perf_counter() - self._started
+
+    def wrap(self, iterable: Iterable) -> Iterable:
+        return self._timed(iterable) if self.enabled else iterable
+
+    def _timed(self, iterable: Iterable) -> Iterator:
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.seconds += time.perf_counter() - started
+                yield item
+        finally:
+            # 提前结束（取消、异常）时让内层生成器执行自己的清理
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+
+UPLOAD_BYTES = Histogram(
+    "smartrag_upload_bytes", "Size of each uploaded file in bytes.", buckets=SIZE_BUCKETS
+)
+UPLOAD_SECONDS = Histogram(
+    "smartrag_upload_duration_seconds", "Upload request latency, including hashing and registration.", ("endpoint",)
+)
+PARSE_SECONDS = Histogram(
+    "smartrag_parse_duration_seconds",
+    "Time spent extracting blocks from one document; format=ir when cached blocks are replayed.",
+    ("format",),
+)
+CHUNK_SECONDS = Histogram(
+    "smartrag_chunking_duration_seconds", "Time spent chunking one document, excluding parsing.", ("size_unit",)
+)
+DB_WRITE_SECONDS = Histogram(
+    "smartrag_db_write_duration_seconds", "Time to insert and commit one batch of chunks."
+)
+EXPORT_SECONDS = Histogram(
+    "smartrag_export_serialization_seconds", "Time spent serializing one export.", ("format",)
+)
+TASK_QUEUE_DEPTH = Gauge("smartrag_task_queue_depth", "Chunk tasks waiting for a worker.")
+TASKS_RUNNING = Gauge("smartrag_tasks_running", "Chunk tasks currently running.")
+WEBSOCKET_CONNECTIONS = Gauge("smartrag_websocket_connections", "Open WebSocket connections in this process.")
+WEBSOCKET_SUBSCRIPTIONS = Gauge("smartrag_websocket_subscriptions", "Tasks with at least one WebSocket subscriber.")
+WEBSOCKET_DROPPED_MESSAGES = Counter(
+    "smartrag_websocket_dropped_messages_total", "Messages dropped from full WebSocket send queues."
+)
+SSE_SUBSCRIBERS = Gauge("smartrag_sse_subscribers", "Open Server-Sent Events streams in this process.")
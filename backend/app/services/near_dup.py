@@ -0,0 +1,222 @@
+"""
+近似重复分块检测（MinHash + LSH）
+
+页眉、页脚、免责声明等样板文字会在大量文档中重复出现，写入向量库前应当识别出来。
+分块写入前按批计算 MinHash 签名：
+
+- 文本规整（小写、合并空白）后取字符 n-gram（对中日文同样有效），多项式滚动哈希一次算出全部 n-gram
+- 用 NEAR_DUP_NUM_PERM 个乘移位哈希（(a * x + b) >> 32，uint64 自然溢出）对所有 n-gram 做一次矩阵运算取最小值
+- 签名分成 NEAR_DUP_BANDS 段，每段压成一个 64 位桶值，存入 chunk_lsh_buckets；
+  桶值相同的分块是候选，再用签名的一致比例估计 Jaccard 相似度
+
+非重复分块的签名写入索引（与分块在同一事务中），之后所有文件的分块都会与它比较。
+重复分块按 ChunkConfig.near_duplicates 标记（flag，元数据中记录 duplicate_of）或直接丢弃（drop）。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+
+import numpy as np
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models import ChunkLSHBucket, ChunkSignature
+
+NEAR_DUP_MODES = ("off", "flag", "drop")
+
+# 多项式滚动哈希的基数（奇数，uint64 溢出即取模 2^64）
+_BASE = np.uint64(1099511628211)
+# SQLite 单条语句的参数个数有上限，IN 查询分批执行
+_QUERY_BATCH = 500
+
+ChunkKey = Tuple[int, int]  # (file_id, chunk_index)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # 乘移位哈希要求乘数为奇数
+        self._a = rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+        self._band_weights = rng.integers(1, 2 ** 63, size=(bands, self.rows), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._powers = _BASE ** np.arange(shingle_size - 1, -1, -1, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        normalized = " ".join(text.lower().split())
+        if not normalized:
+            return np.empty(0, dtype=np.uint64)
+        codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        k = min(self.shingle_size, len(codes))
+        count = len(codes) - k + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        powers = self._powers[-k:]
+        with np.errstate(over="ignore"):
+            for offset in range(k):
+                hashes += codes[offset:offset + count] * powers[offset]
+        return np.unique(hashes)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        shingles = self.shingles(text)
+        if not len(shingles):
+            return None
+        with np.errstate(over="ignore"):
+            # (num_perm, n) 的矩阵一次算完所有哈希函数
+            hashed = (self._a * shingles[np.newaxis, :] + self._b) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def buckets(self, signature: np.ndarray) -> List[int]:
+        with np.errstate(over="ignore"):
+            combined = (signature.reshape(self.bands, self.rows).astype(np.uint64) * self._band_weights).sum(axis=1)
+        # 存为有符号 BIGINT
+        return combined.view(np.int64).tolist()
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def delete_signatures(*criteria_by_column: Tuple[str, int]) -> list:
+    """
+    删除签名和分桶的语句，如 delete_signatures(("file_id", 1))；同步和异步会话都可执行
+    """
+    statements = []
+    for model in (ChunkLSHBucket, ChunkSignature):
+        statements.append(delete(model).where(*(getattr(model, column) == value for column, value in criteria_by_column)))
+    return statements
+
+
+def _batched(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class NearDuplicateFilter:
+    """
+    ChunkWriter 的 before_flush 处理：查找每个分块的近似重复，标记或丢弃，并把其余分块的签名写入索引
+
+    重新分块时新分块暂存在 staging_id 下：file_id 原有的分块即将被替换，不作为候选；
+    其他任务暂存中的分块（file_id 为负）也不作为候选；duplicate_of 中的 staging_id 记为 file_id
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        mode: str,
+        threshold: float,
+        hasher: Optional[MinHasher] = None,
+        file_id: Optional[int] = None,
+        staging_id: Optional[int] = None,
+    ):
+        if mode not in NEAR_DUP_MODES or mode == "off":
+            raise ValueError(f"Unknown near-duplicate mode: {mode}")
+        self.db = db
+        self.mode = mode
+        self.threshold = threshold
+        self.hasher = hasher or get_hasher()
+        self.file_id = file_id
+        self.staging_id = staging_id
+        self.duplicates = 0
+
+    def _excluded(self, file_id: int) -> bool:
+        return file_id == self.file_id or (file_id < 0 and file_id != self.staging_id)
+
+    def _candidates(self, buckets: List[int]) -> Dict[int, List[Tuple[ChunkKey, np.ndarray]]]:
+        found: Dict[int, List[Tuple[ChunkKey, np.ndarray]]] = {}
+        signatures: Dict[ChunkKey, np.ndarray] = {}
+        for batch in _batched(sorted(set(buckets)), _QUERY_BATCH):
+            rows = self.db.execute(
+                select(ChunkLSHBucket.bucket, ChunkLSHBucket.file_id, ChunkLSHBucket.chunk_index)
+                .where(ChunkLSHBucket.bucket.in_(batch))
+            ).all()
+            for bucket, file_id, chunk_index in rows:
+                if self._excluded(file_id):
+                    continue
+                found.setdefault(bucket, []).append(((file_id, chunk_index), None))
+                signatures[(file_id, chunk_index)] = None
+        keys = list(signatures)
+        for batch in _batched(keys, _QUERY_BATCH):
+            rows = self.db.execute(
+                select(ChunkSignature.file_id, ChunkSignature.chunk_index, ChunkSignature.signature)
+                .where(tuple_(ChunkSignature.file_id, ChunkSignature.chunk_index).in_(batch))
+            ).all()
+            for file_id, chunk_index, data in rows:
+                signatures[(file_id, chunk_index)] = np.frombuffer(data, dtype=np.uint32)
+        return {
+            bucket: [(key, signatures[key]) for key, _ in entries if signatures[key] is not None]
+            for bucket, entries in found.items()
+        }
+
+    def __call__(self, rows: List[dict]) -> List[dict]:
+        computed = [(row, self.hasher.signature(row["content"])) for row in rows]
+        computed = [(row, signature, self.hasher.buckets(signature) if signature is not None else [])
+                    for row, signature in computed]
+        index = self._candidates([bucket for _, _, buckets in computed for bucket in buckets])
+
+        kept, signature_rows, bucket_rows = [], [], []
+        for row, signature, buckets in computed:
+            key = (row["file_id"], row["chunk_index"])
+            best: Optional[Tuple[float, ChunkKey]] = None
+            if signature is not None:
+                seen = set()
+                for bucket in buckets:
+                    for other_key, other in index.get(bucket, ()):
+                        # 断点续做时可能遇到自己上次写入的签名
+                        if other_key == key or other_key in seen:
+                            continue
+                        seen.add(other_key)
+                        score = similarity(signature, other)
+                        if score >= self.threshold and (best is None or score > best[0]):
+                            best = (score, other_key)
+
+            if best is not None:
+                self.duplicates += 1
+                if self.mode == "drop":
+                    continue
+                metadata = json.loads(row["chunk_metadata"]) if row.get("chunk_metadata") else {}
+                metadata["duplicate_of"] = {
+                    "file_id": self.file_id if best[1][0] == self.staging_id else best[1][0],
+                    "chunk_index": best[1][1],
+                    "similarity": round(best[0], 3),
+                }
+                row = dict(row, chunk_metadata=json.dumps(metadata, ensure_ascii=False))
+            elif signature is not None:
+                # 只有原始分块进入索引，同一批中后面的分块也会与它比较
+                signature_rows.append({
+                    "file_id": key[0],
+                    "task_id": row.get("task_id"),
+                    "chunk_index": key[1],
+                    "signature": signature.tobytes(),
+                })
+                for bucket in buckets:
+                    bucket_rows.append({"bucket": bucket, "file_id": key[0], "task_id": row.get("task_id"), "chunk_index": key[1]})
+                    index.setdefault(bucket, []).append((key, signature))
+            kept.append(row)
+
+        if signature_rows:
+            self.db.execute(insert(ChunkSignature), signature_rows)
+            self.db.execute(insert(ChunkLSHBucket), bucket_rows)
+        return kept
+
+
+_hasher: Optional[MinHasher] = None
+
+
+def get_hasher() -> MinHasher:
+    """
+    进程内共享的 MinHasher；参数变化后旧签名不可比较，需要重新分块
+    """
+    global _hasher
+    if _hasher is None:
+        _hasher = MinHasher(
+            num_perm=settings.NEAR_DUP_NUM_PERM,
+            bands=settings.NEAR_DUP_BANDS,
+            shingle_size=settings.NEAR_DUP_SHINGLE_SIZE,
+            seed=settings.NEAR_DUP_SEED,
+        )
+    return _hasher
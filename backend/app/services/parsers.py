@@ -0,0 +1,358 @@
+"""
+文档解析器
+
+每种格式的解析器都以流的方式逐个产出 Block（段落、标题、表格），
+不会一次性把整个文档的文本载入内存。解析进度通过 ``progress``
+（0.0 ~ 1.0）对外暴露，供处理任务上报进度。
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+import multiprocessing
+import os
+import re
+
+from app.core.config import settings
+
+# 单个 Block 的最大字符数，避免无空行的超长文本被当作一个段落整体读入
+MAX_BLOCK_CHARS = 8192
+
+# 句末标点，用于从 PDF 的折行文本中恢复段落
+_SENTENCE_END = tuple("。．！？.!?」』）)")
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+")
+
+# 处理进程池的 worker 数，由 worker 的 initializer 通过 set_pool_workers 设置；0 表示不在进程池中
+_pool_workers = 0
+
+
+@dataclass
+class Block:
+    text: str
+    type: str = "paragraph"  # paragraph, heading, table
+    page: Optional[int] = None
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+class BaseParser:
+    extensions: tuple = ()
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.progress = 0.0
+        # 长时间不产出 Block 时（如扫描页）也能上报进度，目前由 PDFParser 按页调用
+        self.on_progress: Optional[Callable[[float], None]] = None
+
+    def iter_blocks(self) -> Iterator[Block]:
+        raise NotImplementedError
+
+
+def _split_pages(pages: Iterable[Tuple[int, str]]) -> Iterator[Block]:
+    """
+    把折行文本恢复成段落：遇到空行或句末标点即结束当前段落
+
+    页末未结束的段落延续到下一页，页码记为段落开始的页
+    """
+    buffer = []
+    length = 0
+    start_page = None
+    for page, text in pages:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                if buffer:
+                    yield Block("\n".join(buffer), page=start_page)
+                    buffer, length = [], 0
+                continue
+            if not buffer:
+                start_page = page
+            buffer.append(line)
+            length += len(line) + 1
+            if line.endswith(_SENTENCE_END) or length >= MAX_BLOCK_CHARS:
+                yield Block("\n".join(buffer), page=start_page)
+                buffer, length = [], 0
+    if buffer:
+        yield Block("\n".join(buffer), page=start_page)
+
+
+class TextParser(BaseParser):
+    extensions = (".txt", ".md", ".csv")
+
+    def iter_blocks(self) -> Iterator[Block]:
+        total = os.path.getsize(self.file_path) or 1
+        consumed = 0
+        buffer = []
+        length = 0
+        # 以二进制逐行读取，便于按字节数计算进度
+        with open(self.file_path, "rb") as f:
+            for raw in f:
+                consumed += len(raw)
+                line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                stripped = line.strip()
+                if not stripped or _MARKDOWN_HEADING.match(stripped):
+                    if buffer:
+                        yield Block("\n".join(buffer))
+                        buffer, length = [], 0
+                    if stripped:
+                        yield Block(_MARKDOWN_HEADING.sub("", stripped), type="heading")
+                else:
+                    buffer.append(line)
+                    length += len(line) + 1
+                    if length >= MAX_BLOCK_CHARS:
+                        yield Block("\n".join(buffer))
+                        buffer, length = [], 0
+                self.progress = consumed / total
+            if buffer:
+                yield Block("\n".join(buffer))
+        self.progress = 1.0
+
+
+def set_pool_workers(count: int):
+    global _pool_workers
+    _pool_workers = count
+
+
+def parse_workers(requested: int) -> int:
+    """
+    单个 PDF 实际可用的提取进程数
+
+    Celery prefork 等守护进程中不能再创建子进程；处理进程池的各 worker 可能同时解析 PDF，
+    只分得 CPU 核数 / worker 数，不足 2 时串行提取
+    """
+    if multiprocessing.current_process().daemon:
+        return 1
+    if _pool_workers:
+        return max(1, min(requested, (os.cpu_count() or 1) // _pool_workers))
+    return requested
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    提取第 start ~ end 页（含，从 1 开始）的文本，在解析进程池中执行
+    """
+    import pdfplumber
+
+    texts = []
+    with pdfplumber.open(file_path, pages=range(start, end + 1)) as pdf:
+        for page in pdf.pages:
+            texts.append(page.extract_text() or "")
+            page.close()
+    return texts
+
+
+class PDFParser(BaseParser):
+    """
+    页数达到 PDF_PARALLEL_MIN_PAGES 时按页段（每段 PDF_PAGES_PER_RANGE 页）在多个进程中并行提取，
+    再按页序拼接；跨页的段落由 _split_pages 接续
+    """
+    extensions = (".pdf",)
+
+    def __init__(self, file_path: str, workers: Optional[int] = None):
+        super().__init__(file_path)
+        self.workers = settings.PDF_PARSE_WORKERS if workers is None else workers
+
+    def iter_blocks(self) -> Iterator[Block]:
+        yield from _split_pages(self._iter_pages())
+        self.progress = 1.0
+
+    def _iter_pages(self) -> Iterator[Tuple[int, str]]:
+        import pdfplumber
+
+        workers = parse_workers(self.workers)
+        with pdfplumber.open(self.file_path) as pdf:
+            total = len(pdf.pages)
+            parallel = workers > 1 and total >= settings.PDF_PARALLEL_MIN_PAGES
+            if not parallel:
+                for number, page in enumerate(pdf.pages, start=1):
+                    text = page.extract_text() or ""
+                    # 释放页面对象缓存，保证大文件内存占用有界
+                    page.close()
+                    self._page_done(number, total)
+                    yield number, text
+                return
+        yield from self._iter_pages_parallel(total, workers)
+
+    def _iter_pages_parallel(self, total: int, workers: int) -> Iterator[Tuple[int, str]]:
+        size = max(1, settings.PDF_PAGES_PER_RANGE)
+        ranges = [(start, min(start + size - 1, total)) for start in range(1, total + 1, size)]
+        workers = min(workers, len(ranges))
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        # 只提前提交有限个页段，已提取但尚未被分块的文本不会无限堆积
+        pending = deque()
+        remaining = iter(ranges)
+        for start, end in islice(remaining, workers * 2):
+            pending.append((start, pool.submit(_extract_pages, self.file_path, start, end)))
+        try:
+            while pending:
+                start, future = pending.popleft()
+                texts = future.result()
+                for start_next, end_next in islice(remaining, 1):
+                    pending.append((start_next, pool.submit(_extract_pages, self.file_path, start_next, end_next)))
+                for number, text in enumerate(texts, start=start):
+                    self._page_done(number, total)
+                    yield number, text
+        finally:
+            # 任务被取消时不等待尚未开始的页段
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _page_done(self, number: int, total: int):
+        self.progress = number / (total or 1)
+        if self.on_progress is not None:
+            self.on_progress(self.progress)
+
+
+class DocxParser(BaseParser):
+    extensions = (".docx",)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        import docx
+        from docx.oxml.ns import qn
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+
+        document = docx.Document(self.file_path)
+        body = document.element.body
+        children = list(body.iterchildren())
+        total = len(children) or 1
+        page = 1
+        for position, element in enumerate(children, start=1):
+            # Word 不保存页码，只能根据分页符推算
+            for br in element.iter(qn("w:br")):
+                if br.get(qn("w:type")) == "page":
+                    page += 1
+            for _ in element.iter(qn("w:lastRenderedPageBreak")):
+                page += 1
+
+            if element.tag == qn("w:p"):
+                paragraph = Paragraph(element, document)
+                text = paragraph.text.strip()
+                if text:
+                    style = paragraph.style.name if paragraph.style is not None else ""
+                    is_heading = style.startswith(("Heading", "Title", "見出し", "标题"))
+                    yield Block(text, type="heading" if is_heading else "paragraph", page=page)
+            elif element.tag == qn("w:tbl"):
+                table = Table(element, document)
+                rows = ["\t".join(cell.text.strip() for cell in row.cells) for row in table.rows]
+                text = "\n".join(row for row in rows if row.strip())
+                if text:
+                    yield Block(text, type="table", page=page)
+            self.progress = position / total
+        self.progress = 1.0
+
+
+class PptxParser(BaseParser):
+    extensions = (".pptx",)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        from pptx import Presentation
+
+        presentation = Presentation(self.file_path)
+        slides = presentation.slides
+        total = len(slides) or 1
+        for number, slide in enumerate(slides, start=1):
+            title = slide.shapes.title
+            if title is not None and title.has_text_frame and title.text_frame.text.strip():
+                yield Block(title.text_frame.text.strip(), type="heading", page=number)
+            for shape in slide.shapes:
+                if title is not None and shape.shape_id == title.shape_id:
+                    continue
+                if shape.has_text_frame:
+                    for paragraph in shape.text_frame.paragraphs:
+                        text = "".join(run.text for run in paragraph.runs).strip()
+                        if text:
+                            yield Block(text, page=number)
+                elif getattr(shape, "has_table", False) and shape.has_table:
+                    rows = ["\t".join(cell.text.strip() for cell in row.cells) for row in shape.table.rows]
+                    text = "\n".join(row for row in rows if row.strip())
+                    if text:
+                        yield Block(text, type="table", page=number)
+            self.progress = number / total
+        self.progress = 1.0
+
+
+class XlsxParser(BaseParser):
+    extensions = (".xlsx",)
+
+    def iter_blocks(self) -> Iterator[Block]:
+        import openpyxl
+
+        # read_only 模式按行流式读取，不会构建整张工作表
+        workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            sheets = workbook.worksheets
+            total = len(sheets) or 1
+            for number, sheet in enumerate(sheets, start=1):
+                yield Block(sheet.title, type="heading", page=number)
+                buffer = []
+                length = 0
+                for row in sheet.iter_rows(values_only=True):
+                    line = "\t".join("" if value is None else str(value) for value in row).strip()
+                    if not line:
+                        continue
+                    buffer.append(line)
+                    length += len(line) + 1
+                    if length >= MAX_BLOCK_CHARS:
+                        yield Block("\n".join(buffer), type="table", page=number)
+                        buffer, length = [], 0
+                if buffer:
+                    yield Block("\n".join(buffer), type="table", page=number)
+                self.progress = number / total
+        finally:
+            workbook.close()
+        self.progress = 1.0
+
+
+class HTMLParser(BaseParser):
+    extensions = (".html", ".htm")
+
+    _BLOCK_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "pre", "blockquote", "table"]
+
+    def iter_blocks(self) -> Iterator[Block]:
+        from bs4 import BeautifulSoup
+
+        with open(self.file_path, "rb") as f:
+            soup = BeautifulSoup(f, "html.parser")
+        for element in soup(["script", "style", "noscript"]):
+            element.decompose()
+
+        elements = soup.find_all(self._BLOCK_TAGS)
+        total = len(elements) or 1
+        for position, element in enumerate(elements, start=1):
+            # 嵌套的块级元素（如 li 内的 p）只由最外层产出一次
+            if element.find_parent(self._BLOCK_TAGS) is None:
+                if element.name == "table":
+                    rows = [
+                        "\t".join(cell.get_text(" ", strip=True) for cell in row.find_all(["td", "th"]))
+                        for row in element.find_all("tr")
+                    ]
+                    text = "\n".join(row for row in rows if row.strip())
+                    block_type = "table"
+                else:
+                    text = element.get_text(" ", strip=True)
+                    block_type = "heading" if element.name.startswith("h") and len(element.name) == 2 else "paragraph"
+                if text:
+                    yield Block(text, type=block_type)
+            self.progress = position / total
+        self.progress = 1.0
+
+
+PARSERS: Dict[str, Type[BaseParser]] = {
+    extension: parser
+    for parser in (TextParser, PDFParser, DocxParser, PptxParser, XlsxParser, HTMLParser)
+    for extension in parser.extensions
+}
+
+
+def get_parser(file_path: str) -> BaseParser:
+    """
+    根据文件扩展名选择解析器
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    parser_class = PARSERS.get(extension)
+    if parser_class is None:
+        raise UnsupportedFormatError(f"Unsupported file format: {extension or 'unknown'}")
+    return parser_class(file_path)
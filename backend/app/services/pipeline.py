@@ -0,0 +1,284 @@
+"""
+文档处理流水线
+
+同步实现，既可以在进程池 worker 中运行，也可以在任意不持有事件循环的线程中运行。
+进度通过 ``report(task_id, status, progress, message)`` 回调上报。
+"""
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterator, Optional
+import hashlib
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import UploadedFile, ProcessingTask, DocumentChunk, ChunkSignature, ChunkLSHBucket
+from app.services.block_store import BlockReader, BlockRecorder, ir_path
+from app.services.cancellation import CancellationToken, TaskCancelled, task_deadline
+from app.services.chunk_writer import ChunkWriter
+from app.services.chunker import chunk_blocks
+from app.services.metrics import CHUNK_SECONDS, PARSE_SECONDS, StageTimer, registry
+from app.services.near_dup import NearDuplicateFilter, delete_signatures
+from app.services.parsers import Block, get_parser
+from app.services.tokenizers import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+ProgressReporter = Callable[[int, str, Optional[float], Optional[str]], None]
+
+
+def _noop_report(task_id: int, status: str, progress: Optional[float] = None, message: Optional[str] = None):
+    pass
+
+
+# 只影响任务执行、不影响分块结果的配置项，不计入指纹
+RUNTIME_CONFIG_KEYS = ("timeout",)
+
+
+def staging_file_id(task_id: int) -> int:
+    """
+    任务写入中的分块、签名和分桶暂记在 file_id = -task_id 下，完成时才换成真实的 file_id；
+    预览、导出、检索都按真实的 file_id 查询，看不到暂存的行
+    """
+    return -task_id
+
+
+def config_fingerprint(config: dict) -> str:
+    """
+    分块配置的指纹，与文件内容哈希一起作为分块结果的缓存键
+    """
+    config = {key: value for key, value in config.items() if key not in RUNTIME_CONFIG_KEYS}
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def run_chunk_job(task_id: int, file_id: int, config: dict, report: ProgressReporter = _noop_report):
+    """
+    解析上传的文件并按配置分块，结果写入 document_chunks
+
+    新分块按批提交到暂存区（staging_file_id），完成时在一个短事务中删除旧分块并换入新分块，
+    重新分块期间和失败、取消、超时后，文件都保留原有的分块。
+    任务可能被重复投递（至少一次语义）：已完成或已取消的任务直接返回；
+    中断过的任务从已暂存的分块之后继续，不会重复写入。
+    数据库的临时性错误（如 SQLite 被锁）会原样抛出，交给任务队列重试。
+    """
+    chunk_size = config.get("chunk_size", 500)
+    chunk_overlap = config.get("chunk_overlap", 50)
+    chunk_method = config.get("chunk_method", "paragraph")
+    size_unit = config.get("size_unit", "chars")
+
+    db = SessionLocal()
+    try:
+        task = db.query(ProcessingTask).filter(ProcessingTask.id == task_id).first()
+        file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+        if not task or not file or task.status in ("completed", "failed", "cancelled"):
+            return
+
+        try:
+            # 已写入的最大 chunk_index 即断点，分块结果是确定的，跳过之前的分块即可续做
+            # （丢弃近似重复分块时 chunk_index 不连续，不能用行数）
+            last_index = db.query(func.max(DocumentChunk.chunk_index)).filter(DocumentChunk.task_id == task_id).scalar()
+            resumed = 0 if last_index is None else last_index + 1
+            staging = staging_file_id(task_id)
+            # 已有解析结果时只需重新分块，不必再解析原文件
+            ir = ir_path(file)
+            reuse_ir = os.path.exists(ir)
+
+            # 更新任务状态为running
+            task.status = "running"
+            task.started_at = task.started_at or datetime.utcnow()
+            if not resumed:
+                task.progress = 0.0
+                # 新的分块结果将替换该文件之前的分块，完成前不能再被当作缓存复用
+                file.chunk_config_hash = None
+            db.commit()
+            if resumed:
+                report(task_id, "running", task.progress, f"チャンク {resumed} から処理を再開しています...")
+            else:
+                report(task_id, "running", 0.0, "処理を開始しています...")
+
+            token = CancellationToken(task_id, task_deadline(task.started_at, config.get("timeout")))
+            started = time.perf_counter()
+            # 解析在分块的 next() 中进行，分块耗时扣除其中的解析耗时
+            parse_timer, chunk_timer = StageTimer(), StageTimer()
+
+            if reuse_ir:
+                source = BlockReader(ir)
+                source_format = "ir"
+            else:
+                parser = get_parser(file.file_path)
+                parser.on_progress = lambda progress: _page_progress(token, writer, progress)
+                source = BlockRecorder(parser, ir)
+                source_format = os.path.splitext(file.file_path)[1].lstrip(".").lower() or "unknown"
+            tokenizer = get_tokenizer(config.get("tokenizer"))
+            near_dup_mode = config.get("near_duplicates", "off")
+            near_duplicates = None
+            if near_dup_mode != "off":
+                near_duplicates = NearDuplicateFilter(
+                    db, near_dup_mode, config.get("near_duplicate_threshold", settings.NEAR_DUP_THRESHOLD),
+                    file_id=file_id, staging_id=staging,
+                )
+            chunks = chunk_timer.wrap(chunk_blocks(
+                _checked(parse_timer.wrap(source.iter_blocks()), token),
+                chunk_size, chunk_overlap, chunk_method, size_unit, tokenizer,
+            ))
+            writer = ChunkWriter(
+                db,
+                task,
+                batch_size=settings.CHUNK_WRITE_BATCH_SIZE,
+                flush_interval_ms=settings.CHUNK_WRITE_FLUSH_MS,
+                # 每批写入后上报一次进度，而不是每个分块一次
+                on_flush=lambda written, progress: report(
+                    task_id, "running", progress, f"チャンク {resumed + written} を処理中..."
+                ),
+                before_flush=near_duplicates,
+            )
+            for chunk in islice(chunks, resumed, None):
+                token.check()
+                writer.add({
+                    "file_id": staging,
+                    "task_id": task_id,
+                    "chunk_index": chunk.index,
+                    "content": chunk.content,
+                    "html_content": chunk.to_html(),
+                    "markdown_content": chunk.to_markdown(),
+                    "chunk_metadata": json.dumps(chunk.metadata(chunk_method, tokenizer), ensure_ascii=False),
+                }, progress=min(source.progress * 100, 99.0))
+            writer.flush()
+
+            # 完成任务；只有仍处于 running 时才改为 completed，不会覆盖并发的取消
+            completed = db.execute(
+                update(ProcessingTask)
+                .where(ProcessingTask.id == task_id, ProcessingTask.status == "running")
+                .values(status="completed", progress=100.0, completed_at=datetime.utcnow())
+            )
+            if completed.rowcount == 0:
+                raise TaskCancelled("cancelled")
+            _publish_chunks(db, file_id, staging)
+            total_chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).count()
+            file.status = "completed"
+            file.chunks_count = total_chunks
+            file.chunk_config_hash = config_fingerprint(config)
+            db.commit()
+            report(task_id, "completed", 100.0, "処理が完了しました！")
+            _record_stages(task_id, file, source_format, size_unit, time.perf_counter() - started,
+                           parse_timer, chunk_timer, writer)
+
+        except TaskCancelled as e:
+            db.rollback()
+            _discard_task_chunks(db, task, file, e)
+            if e.timed_out:
+                report(task_id, "failed", task.progress, f"処理がタイムアウトしました: {e}")
+            else:
+                report(task_id, "cancelled", task.progress, "処理がキャンセルされました")
+
+        except OperationalError:
+            db.rollback()
+            raise
+
+        except Exception as e:
+            db.rollback()
+            _delete_staged_chunks(db, task_id)
+            task.status = "failed"
+            task.error_message = str(e)
+            task.completed_at = datetime.utcnow()
+            file.status = "failed"
+            file.error_message = str(e)
+            db.commit()
+            report(task_id, "failed", task.progress, f"処理に失敗しました: {e}")
+
+    finally:
+        db.close()
+
+
+def _publish_chunks(db: Session, file_id: int, staging: int):
+    """
+    删除文件原有的分块和签名，把暂存的换成该文件的；由调用方与任务状态一起提交
+    """
+    db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).delete(synchronize_session=False)
+    for statement in delete_signatures(("file_id", file_id)):
+        db.execute(statement)
+    for model in (DocumentChunk, ChunkSignature, ChunkLSHBucket):
+        db.execute(update(model).where(model.file_id == staging).values(file_id=file_id))
+
+
+def _delete_staged_chunks(db: Session, task_id: int):
+    staging = staging_file_id(task_id)
+    db.execute(delete(DocumentChunk).where(DocumentChunk.file_id == staging))
+    for statement in delete_signatures(("file_id", staging)):
+        db.execute(statement)
+
+
+def _record_stages(task_id: int, file: UploadedFile, source_format: str, size_unit: str, elapsed: float,
+                   parse_timer: StageTimer, chunk_timer: StageTimer, writer: ChunkWriter):
+    if not registry.enabled:
+        return
+    chunk_seconds = max(0.0, chunk_timer.seconds - parse_timer.seconds)
+    PARSE_SECONDS.observe(parse_timer.seconds, source_format)
+    CHUNK_SECONDS.observe(chunk_seconds, size_unit)
+    if settings.SLOW_TASK_SECONDS and elapsed >= settings.SLOW_TASK_SECONDS:
+        logger.warning(
+            "Slow chunk task %s: file %s (%s, %s bytes, %s) took %.2fs: parse %.2fs, chunk %.2fs, db write %.2fs",
+            task_id, file.id, file.original_filename, file.file_size, source_format, elapsed,
+            parse_timer.seconds, chunk_seconds, writer.write_seconds,
+        )
+
+
+def _checked(blocks: Iterator[Block], token: CancellationToken) -> Iterator[Block]:
+    for block in blocks:
+        token.check()
+        yield block
+
+
+def _page_progress(token: CancellationToken, writer: ChunkWriter, progress: float):
+    # 扫描页等不产出 Block 的页面之间也检查取消
+    token.check()
+    writer.update_progress(min(progress * 100, 99.0))
+
+
+def _discard_task_chunks(db: Session, task: ProcessingTask, file: UploadedFile, error: TaskCancelled):
+    """
+    删除被取消（或超时）的任务暂存的分块，并按文件原有的分块恢复文件状态
+    """
+    _delete_staged_chunks(db, task.id)
+    remaining = db.query(DocumentChunk).filter(DocumentChunk.file_id == file.id).count()
+    task.completed_at = datetime.utcnow()
+    file.chunks_count = remaining
+    if error.timed_out:
+        task.status = "failed"
+        task.error_message = str(error)
+        file.status = "failed"
+        file.error_message = str(error)
+    else:
+        task.status = "cancelled"
+        file.status = "completed" if remaining else "uploaded"
+    db.commit()
+
+
+def mark_task_failed(task_id: int, error: BaseException):
+    """
+    任务在 pipeline 之外失败（worker 崩溃、重试耗尽）时更新状态
+    """
+    db = SessionLocal()
+    try:
+        task = db.query(ProcessingTask).filter(ProcessingTask.id == task_id).first()
+        if task and task.status not in ("completed", "failed", "cancelled"):
+            task.status = "failed"
+            task.error_message = str(error)
+            task.completed_at = datetime.utcnow()
+            # 重试耗尽后不会再续做，丢弃已暂存的分块
+            _delete_staged_chunks(db, task_id)
+            file = db.query(UploadedFile).filter(UploadedFile.id == task.file_id).first()
+            if file:
+                file.status = "failed"
+                file.error_message = str(error)
+            db.commit()
+    finally:
+        db.close()
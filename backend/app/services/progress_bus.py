@@ -0,0 +1,162 @@
+"""
+任务进度总线
+
+send_task_update 把进度发布到总线，每个 API 进程的 ConnectionManager 订阅总线并转发给本进程的连接：
+
+- memory: 进程内直接转发（默认），单进程部署和测试使用
+- redis: Redis pub/sub，频道为 ``<PROGRESS_CHANNEL_PREFIX><task_id>``；
+  多个 uvicorn worker 或副本部署时，客户端连接在任意进程上都能收到任意 worker 上任务的进度，
+  Celery worker 也直接发布到同一组频道
+
+进度是尽力而为的通知，Redis 不可用时只投递给本进程的连接，不影响任务本身。
+"""
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import json
+import logging
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ProgressHandler = Callable[[int, Dict[str, Any]], None]
+
+
+def task_update_message(task_id: int, status: str, progress: Optional[float] = None,
+                        message: Optional[str] = None) -> Dict[str, Any]:
+    data = {
+        "type": "task_update",
+        "task_id": task_id,
+        "status": status,
+        # 不同进程发布的进度需要可比较的时间
+        "timestamp": time.time()
+    }
+    if progress is not None:
+        data["progress"] = progress
+    if message:
+        data["message"] = message
+    return data
+
+
+class InMemoryProgressBus:
+    name = "memory"
+
+    def __init__(self):
+        self._handler: Optional[ProgressHandler] = None
+
+    async def start(self, handler: ProgressHandler):
+        self._handler = handler
+
+    async def publish(self, task_id: int, data: Dict[str, Any]):
+        if self._handler is not None:
+            self._handler(task_id, data)
+
+    async def close(self):
+        self._handler = None
+
+
+class RedisProgressBus:
+    name = "redis"
+
+    def __init__(self, url: str, channel_prefix: str, reconnect_delay: float = 1.0):
+        self.url = url
+        self.channel_prefix = channel_prefix
+        self.reconnect_delay = reconnect_delay
+        self._client = None
+        self._handler: Optional[ProgressHandler] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self, handler: ProgressHandler):
+        import redis.asyncio as redis
+
+        self._handler = handler
+        self._client = redis.from_url(self.url, decode_responses=True)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def publish(self, task_id: int, data: Dict[str, Any]):
+        from redis.exceptions import RedisError
+
+        try:
+            await self._client.publish(f"{self.channel_prefix}{task_id}", json.dumps(data, ensure_ascii=False))
+        except RedisError as e:
+            logger.warning("Failed to publish progress for task %s: %s", task_id, e)
+            # 至少让连接在本进程上的客户端收到
+            self._dispatch(task_id, data)
+
+    def _dispatch(self, task_id: int, data: Dict[str, Any]):
+        if self._handler is not None:
+            self._handler(task_id, data)
+
+    async def _listen(self):
+        from redis.exceptions import RedisError
+
+        while True:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{self.channel_prefix}*")
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    try:
+                        task_id = int(message["channel"][len(self.channel_prefix):])
+                        data = json.loads(message["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    self._dispatch(task_id, data)
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.warning("Progress subscription lost, reconnecting: %s", e)
+                await asyncio.sleep(self.reconnect_delay)
+            finally:
+                await pubsub.aclose()
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._handler = None
+
+
+class RedisProgressPublisher:
+    """
+    同步发布进度，供不运行事件循环的 Celery worker 作为 pipeline 的 report 回调
+    """
+
+    def __init__(self, url: str, channel_prefix: str):
+        import redis
+
+        self.channel_prefix = channel_prefix
+        self._client = redis.Redis.from_url(url)
+
+    def __call__(self, task_id: int, status: str, progress: Optional[float] = None, message: Optional[str] = None):
+        from redis.exceptions import RedisError
+
+        data = task_update_message(task_id, status, progress, message)
+        try:
+            self._client.publish(f"{self.channel_prefix}{task_id}", json.dumps(data, ensure_ascii=False))
+        except RedisError as e:
+            logger.warning("Failed to publish progress for task %s: %s", task_id, e)
+
+
+def progress_bus_url() -> str:
+    return settings.PROGRESS_BUS_URL or settings.REDIS_URL
+
+
+def create_progress_bus():
+    if settings.PROGRESS_BUS == "redis":
+        return RedisProgressBus(progress_bus_url(), settings.PROGRESS_CHANNEL_PREFIX)
+    if settings.PROGRESS_BUS != "memory":
+        raise ValueError(f"Unknown PROGRESS_BUS: {settings.PROGRESS_BUS}")
+    return InMemoryProgressBus()
+
+
+progress_bus = create_progress_bus()
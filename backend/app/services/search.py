@@ -0,0 +1,243 @@
+"""
+分块全文检索
+
+SQLite 下使用迁移 0006 建立的 FTS5 外部内容表 document_chunks_fts（trigram 分词），
+分块写入、删除时由触发器同步更新索引，按 bm25 排序。trigram 不需要词典，中日文按子串匹配。
+少于 3 个字符的词无法用 trigram 索引，由迁移 0009 的 document_chunks_bigram 索引：
+触发器调用 chunk_bigrams() 把内容拆成单字和相邻两字的词，短词按整词匹配。
+
+查询中同时有长词和短词时只用 trigram 索引检索，短词在命中的行上用 LIKE 复核；
+含标点等无法索引的短词也只在索引命中的行或 file_id 指定的文件内用 LIKE 过滤，不扫描全表。
+其他数据库没有 FTS 表时全部使用 LIKE，摘要由 like_snippet 按与 FTS5 snippet() 相同的格式生成。
+"""
+from dataclasses import dataclass
+from typing import Any, List, Optional, Set, Tuple, Union
+import re
+
+from sqlalchemy import JSON, Select, cast, column, literal_column, select, table, text, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import DocumentChunk, UploadedFile
+
+FTS_TABLE = "document_chunks_fts"
+BIGRAM_TABLE = "document_chunks_bigram"
+TRIGRAM_MIN_CHARS = 3
+SNIPPET_TOKENS = 16
+
+_fts = table(FTS_TABLE, column("rowid"))
+_bigram = table(BIGRAM_TABLE, column("rowid"))
+
+_METADATA_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_fts_tables: Optional[Set[str]] = None
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+@dataclass
+class SearchQuery:
+    text: str
+    file_ids: Optional[List[int]] = None
+    metadata: Optional[List[Tuple[str, Union[str, int, float]]]] = None
+    include_content: bool = False
+    limit: int = 20
+    offset: int = 0
+
+
+def parse_terms(query: str) -> Tuple[List[str], List[str], List[str]]:
+    """
+    按空白切分为 (trigram 词, bigram 词, LIKE 词)；引号括起的部分作为一个词
+
+    少于 3 个字符且全部是字母数字的词由 bigram 索引检索，其余短词只能用 LIKE 过滤
+    """
+    terms = [quoted or plain for quoted, plain in re.findall(r'"([^"]+)"|(\S+)', query)]
+    trigram_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_CHARS]
+    short_terms = [term for term in terms if len(term) < TRIGRAM_MIN_CHARS]
+    bigram_terms = [term for term in short_terms if term.isalnum()]
+    like_terms = [term for term in short_terms if not term.isalnum()]
+    return trigram_terms, bigram_terms, like_terms
+
+
+def chunk_bigrams(content: Optional[str]) -> str:
+    """
+    bigram 索引的内容：每个字母数字字符，以及相邻两个字母数字字符组成的词，以空格分隔
+
+    由 SQLite 函数 chunk_bigrams() 在 document_chunks 的触发器中调用；
+    unicode61 分词按空格切分，短词与 LIKE 一样按子串命中
+    """
+    if not content:
+        return ""
+    tokens = []
+    for run in re.findall(r"[^\W_]+", content.casefold()):
+        tokens.extend(run)
+        tokens.extend(run[index:index + 2] for index in range(len(run) - 1))
+    return " ".join(tokens)
+
+
+def register_sqlite_functions(dbapi_connection):
+    """
+    注册 bigram 索引触发器使用的 SQL 函数，每个 SQLite 连接都需要注册
+    """
+    dbapi_connection.create_function("chunk_bigrams", 1, chunk_bigrams, deterministic=True)
+
+
+def match_expression(terms: List[str]) -> str:
+    # 每个词作为短语，避免用户输入被解释成 FTS5 语法；多个词之间为 AND
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def parse_metadata_filter(value: str) -> Tuple[str, Union[str, int, float]]:
+    """
+    ``key=value`` 形式的元数据过滤条件，数字值按数字比较
+    """
+    key, separator, raw = value.partition("=")
+    if not separator or not _METADATA_KEY.match(key):
+        raise SearchQueryError(f"Invalid metadata filter: {value}")
+    for convert in (int, float):
+        try:
+            return key, convert(raw)
+        except ValueError:
+            pass
+    return key, raw
+
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def like_snippet(content: str, terms: List[str], size: int = SNIPPET_TOKENS) -> Optional[str]:
+    """
+    截取第一个命中词附近约 size 个字符，命中部分用 <mark> 标出，截断处加省略号
+
+    trigram 分词下每个字符对应一个 token，与 snippet(..., 16) 的长度一致；
+    与 LIKE 一样不区分 ASCII 大小写
+    """
+    pattern = re.compile(
+        "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE
+    )
+    first = pattern.search(content)
+    if first is None:
+        return None
+    width = max(size, first.end() - first.start())
+    start = max(0, min(first.start() - (width - (first.end() - first.start())) // 2, len(content) - width))
+    end = min(len(content), start + width)
+    parts = ["…" if start > 0 else ""]
+    position = start
+    for match in pattern.finditer(content, start, end):
+        parts.append(content[position:match.start()])
+        parts.append(f"<mark>{match.group()}</mark>")
+        position = match.end()
+    parts.append(content[position:end])
+    parts.append("…" if end < len(content) else "")
+    return "".join(parts)
+
+
+async def fts_tables(db: AsyncSession) -> Set[str]:
+    """
+    已建立的全文索引表，非 SQLite 数据库为空
+    """
+    global _fts_tables
+    if _fts_tables is None:
+        if db.bind.dialect.name != "sqlite":
+            _fts_tables = set()
+        else:
+            names = await db.scalars(
+                text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (:fts, :bigram)"),
+                {"fts": FTS_TABLE, "bigram": BIGRAM_TABLE},
+            )
+            _fts_tables = set(names)
+    return _fts_tables
+
+
+def _metadata_value(dialect: str, key: str, value: Any):
+    document = (
+        type_coerce(DocumentChunk.chunk_metadata, JSON) if dialect == "sqlite"
+        else cast(DocumentChunk.chunk_metadata, JSON)
+    )[key]
+    if isinstance(value, int):
+        return document.as_integer()
+    if isinstance(value, float):
+        return document.as_float()
+    return document.as_string()
+
+
+async def search_chunks(query: SearchQuery, db: AsyncSession) -> List[dict]:
+    trigram_terms, bigram_terms, like_terms = parse_terms(query.text)
+    if not trigram_terms and not bigram_terms and not like_terms:
+        raise SearchQueryError("Empty query")
+    tables = await fts_tables(db)
+    use_fts = bool(trigram_terms) and FTS_TABLE in tables
+    use_bigram = not use_fts and bool(bigram_terms) and BIGRAM_TABLE in tables
+    if use_fts:
+        # 短词在 trigram 命中的行上复核
+        like_terms = bigram_terms + like_terms
+    elif not use_bigram:
+        # 有索引但查询全是无法索引的短词时只在指定的文件内过滤，不扫描全表
+        if tables and not query.file_ids:
+            raise SearchQueryError("Query needs a term of letters or digits, or a file_id filter")
+        like_terms = trigram_terms + bigram_terms + like_terms
+        bigram_terms = []
+
+    columns = [
+        DocumentChunk.id,
+        DocumentChunk.file_id,
+        UploadedFile.original_filename,
+        DocumentChunk.chunk_index,
+        DocumentChunk.chunk_metadata,
+    ]
+    if query.include_content:
+        columns.append(DocumentChunk.content)
+
+    stmt: Select
+    if use_fts or use_bigram:
+        # 先物化索引命中的行，LIKE 和其他过滤条件只在这些行上判断；
+        # bm25 越小越相关，对外取负值使分数越大越相关
+        if use_fts:
+            index_table, source, terms = FTS_TABLE, _fts, trigram_terms
+            extra = [literal_column(f"snippet({FTS_TABLE}, 0, '<mark>', '</mark>', '…', 16)").label("snippet")]
+        else:
+            # bigram 索引不保存内容，摘要从完整内容中截取
+            index_table, source, terms = BIGRAM_TABLE, _bigram, [term.casefold() for term in bigram_terms]
+            extra = []
+        matches = (
+            select(source.c.rowid.label("id"), (-literal_column(f"bm25({index_table})")).label("score"), *extra)
+            .where(literal_column(index_table).op("MATCH")(match_expression(terms)))
+            .cte("matches")
+            .prefix_with("MATERIALIZED")
+        )
+        stmt = (
+            select(
+                *columns,
+                matches.c.score,
+                (matches.c.snippet if use_fts else DocumentChunk.content).label("snippet"),
+            )
+            .select_from(matches)
+            .join(DocumentChunk, DocumentChunk.id == matches.c.id)
+            .order_by(matches.c.score.desc(), DocumentChunk.id)
+        )
+    else:
+        stmt = (
+            select(*columns, literal_column("NULL").label("score"), DocumentChunk.content.label("snippet"))
+            .select_from(DocumentChunk)
+            .order_by(DocumentChunk.file_id, DocumentChunk.chunk_index)
+        )
+    stmt = stmt.join(UploadedFile, UploadedFile.id == DocumentChunk.file_id)
+
+    for term in like_terms:
+        stmt = stmt.where(DocumentChunk.content.like(_like_pattern(term), escape="\\"))
+    if query.file_ids:
+        stmt = stmt.where(DocumentChunk.file_id.in_(query.file_ids))
+    dialect = db.bind.dialect.name
+    for key, value in query.metadata or ():
+        stmt = stmt.where(_metadata_value(dialect, key, value) == value)
+
+    rows = (await db.execute(stmt.limit(query.limit).offset(query.offset))).mappings().all()
+    results = [dict(row) for row in rows]
+    if not use_fts:
+        # 没有 FTS 摘要时 snippet 列取的是完整内容，在这里截取摘要
+        for result in results:
+            result["snippet"] = like_snippet(result["snippet"], bigram_terms + like_terms)
+    return results
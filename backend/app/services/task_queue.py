@@ -0,0 +1,178 @@
+"""
+任务队列后端
+
+- local: 本进程内的进程池（默认），重启时从数据库恢复未完成的任务
+- celery: Celery/Redis 分布式队列，多个副本和节点共享任务
+
+两种后端都依赖 pipeline 的断点续做保证任务重复投递时结果一致。
+"""
+from typing import Optional
+import os
+import socket
+
+from app.core.config import settings
+from app.services.executor import ProcessingExecutor, QueueFullError, executor
+
+UNFINISHED_STATUSES = ("pending", "queued", "running")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class LocalTaskQueue:
+    name = "local"
+
+    def __init__(self, executor: ProcessingExecutor):
+        self.executor = executor
+        self.host = socket.gethostname()
+        # 任务在提交它的进程的进程池中执行，owner 标识该进程
+        self.owner = f"{self.host}:{os.getpid()}"
+
+    def start(self):
+        self.executor.start()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def queue_depth(self) -> int:
+        return self.executor.queued
+
+    def is_saturated(self) -> bool:
+        return self.executor.is_saturated()
+
+    def is_busy(self) -> bool:
+        return self.executor.pending >= self.executor.max_workers
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        return self.executor.submit(task_id, file_id, config)
+
+    def cancel(self, task_id: int):
+        self.executor.cancel(task_id)
+
+    def _orphaned(self, owner: Optional[str]) -> bool:
+        """
+        任务的所属进程是否已经退出；其他主机上的任务留给该主机重启后恢复
+        """
+        if owner is None:
+            return True
+        host, _, pid = owner.rpartition(":")
+        if host != self.host or not pid.isdigit():
+            return False
+        # 与本进程 pid 相同的是重启前的上一个进程（如容器内固定的 pid）
+        return int(pid) == os.getpid() or not _process_alive(int(pid))
+
+    def resume_interrupted(self) -> int:
+        """
+        重新提交所属进程已退出的未完成任务
+
+        多个 uvicorn worker 同时启动时都会执行恢复，每个任务先以条件 UPDATE 认领（owner 仍为读取时的值才成功），
+        只有认领成功的 worker 提交，任务不会被重复执行。
+        """
+        import json
+        from sqlalchemy import select, update
+        from app.core.database import SessionLocal
+        from app.models import ProcessingTask
+
+        db = SessionLocal()
+        try:
+            tasks = db.execute(
+                select(ProcessingTask.id, ProcessingTask.file_id, ProcessingTask.config, ProcessingTask.owner)
+                .where(ProcessingTask.task_type == "chunk", ProcessingTask.status.in_(UNFINISHED_STATUSES))
+                .order_by(ProcessingTask.created_at)
+            ).all()
+            resumed = 0
+            for task_id, file_id, config, owner in tasks:
+                if not self._orphaned(owner):
+                    continue
+                if self.executor.is_saturated():
+                    break
+                claimed = db.execute(
+                    update(ProcessingTask)
+                    .where(
+                        ProcessingTask.id == task_id,
+                        ProcessingTask.status.in_(UNFINISHED_STATUSES),
+                        ProcessingTask.owner.is_not_distinct_from(owner)
+                    )
+                    .values(owner=self.owner)
+                    .returning(ProcessingTask.id)
+                ).scalar()
+                db.commit()
+                if claimed is None:
+                    continue
+                try:
+                    self.executor.submit(task_id, file_id, json.loads(config or "{}"))
+                except QueueFullError:
+                    break
+                resumed += 1
+            return resumed
+        finally:
+            db.close()
+
+
+class CeleryTaskQueue:
+    name = "celery"
+    # 任何 worker 都可以执行，不记录所属进程
+    owner = None
+
+    def __init__(self, max_queued: int):
+        self.max_queued = max_queued
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def queue_depth(self) -> int:
+        from app.worker import celery_app
+
+        try:
+            with celery_app.connection_for_write() as connection:
+                queue = celery_app.conf.task_default_queue
+                return connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+        except Exception:
+            # 队列尚未创建或 broker 不支持查询时不做限流
+            return 0
+
+    def is_saturated(self) -> bool:
+        return self.queue_depth() >= self.max_queued
+
+    def is_busy(self) -> bool:
+        return self.queue_depth() > 0
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        from app.worker import chunk_document
+
+        chunk_document.apply_async(args=(task_id, file_id, config), task_id=f"chunk-{task_id}")
+        return "queued"
+
+    def cancel(self, task_id: int):
+        from app.worker import celery_app
+
+        # 只撤销尚未执行的消息；即使撤销失败，worker 取到任务后也会因状态为 cancelled 直接返回
+        try:
+            celery_app.control.revoke(f"chunk-{task_id}")
+        except Exception:
+            pass
+
+    def resume_interrupted(self) -> int:
+        # acks_late 下未确认的任务由 broker 重新投递，不需要 API 进程介入
+        return 0
+
+
+def create_task_queue():
+    if settings.TASK_QUEUE_BACKEND == "celery":
+        return CeleryTaskQueue(max_queued=settings.PROCESSING_QUEUE_SIZE)
+    if settings.TASK_QUEUE_BACKEND != "local":
+        raise ValueError(f"Unknown TASK_QUEUE_BACKEND: {settings.TASK_QUEUE_BACKEND}")
+    return LocalTaskQueue(executor)
+
+
+task_queue = create_task_queue()
@@ -0,0 +1,158 @@
+"""
+任务状态缓存
+
+任务状态查询（前端轮询、SSE 的初始快照）优先从本进程的缓存读取，缓存未命中时读数据库一次。
+缓存由进度总线上的更新维护：PROGRESS_BUS=redis 时所有进程都能收到任意 worker 的更新；
+收不到更新的部署（如 memory 总线配合 Celery）由 TASK_STATE_TTL 兜底，进行中的任务超时后重新读取。
+已结束的任务状态不会再变化，一直缓存到被 LRU 淘汰。
+
+最近的更新保存在一个环形缓冲区中，SSE 客户端断线重连时按 Last-Event-ID 补发错过的事件。
+事件 ID 为 ``<epoch>-<序号>``：序号在本进程收到更新时递增分配，不受发布方时钟偏差和相同时间戳的影响；
+epoch 在进程启动时随机生成，重连到其他副本或服务重启后 ID 无法续传，单个任务的流改发当前状态。
+"""
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+import asyncio
+import time
+import uuid
+
+from app.core.config import settings
+from app.models import ProcessingTask
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# (序号, task_id, 数据)
+TaskEvent = Tuple[int, int, Dict[str, Any]]
+
+
+def _isoformat(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def task_state(task: ProcessingTask) -> Dict[str, Any]:
+    return {
+        "task_id": task.id,
+        "file_id": task.file_id,
+        "status": task.status,
+        "progress": task.progress,
+        "task_type": task.task_type,
+        "created_at": _isoformat(task.created_at),
+        "started_at": _isoformat(task.started_at),
+        "completed_at": _isoformat(task.completed_at),
+    }
+
+
+class TaskStateCache:
+    def __init__(self, max_size: int, ttl: float, history_size: int, subscriber_queue_size: int = 100):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.subscriber_queue_size = subscriber_queue_size
+        # task_id -> (最后更新时间, 状态)
+        self._states: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._history: Deque[TaskEvent] = deque(maxlen=history_size)
+        self.epoch = uuid.uuid4().hex[:12]
+        # 最后一个事件的序号
+        self.sequence = 0
+        # task_id（None 表示全部任务）-> 订阅队列
+        self._subscribers: Dict[Optional[int], Set[asyncio.Queue]] = {}
+
+    def _fresh(self, entry: Tuple[float, Dict[str, Any]]) -> bool:
+        touched, state = entry
+        return state["status"] in TERMINAL_STATUSES or time.monotonic() - touched < self.ttl
+
+    def put(self, task: ProcessingTask):
+        self._store(task.id, task_state(task))
+
+    def _store(self, task_id: int, state: Dict[str, Any]):
+        self._states[task_id] = (time.monotonic(), state)
+        self._states.move_to_end(task_id)
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+
+    async def get(self, task_id: int, loader: Callable[[], Awaitable[Optional[ProcessingTask]]]) -> Optional[Dict[str, Any]]:
+        """
+        读取任务状态，缓存未命中或已过期时调用 loader 从数据库读取
+        """
+        entry = self._states.get(task_id)
+        if entry is not None and self._fresh(entry):
+            self._states.move_to_end(task_id)
+            return entry[1]
+        task = await loader()
+        if task is None:
+            self._states.pop(task_id, None)
+            return None
+        self.put(task)
+        return self._states[task_id][1]
+
+    def apply(self, task_id: int, data: Dict[str, Any]):
+        """
+        进度总线的处理函数：更新缓存中的状态，记录事件并通知 SSE 订阅者
+        """
+        entry = self._states.get(task_id)
+        if entry is not None:
+            state = dict(entry[1])
+            status = data.get("status", state["status"])
+            if data.get("progress") is not None:
+                state["progress"] = data["progress"]
+            timestamp = data.get("timestamp")
+            if status == "running" and not state["started_at"] and timestamp:
+                state["started_at"] = _isoformat(datetime.utcfromtimestamp(timestamp))
+            if status in TERMINAL_STATUSES and not state["completed_at"] and timestamp:
+                state["completed_at"] = _isoformat(datetime.utcfromtimestamp(timestamp))
+            state["status"] = status
+            self._store(task_id, state)
+
+        self.sequence += 1
+        event: TaskEvent = (self.sequence, task_id, data)
+        self._history.append(event)
+        for key in (task_id, None):
+            for queue in self._subscribers.get(key, ()):
+                if queue.full():
+                    # 消费太慢的订阅者只丢弃最旧的事件
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    def event_id(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        """
+        Last-Event-ID 转换为本进程的序号；格式不对或来自其他进程时返回 None
+        """
+        epoch, _, sequence = (value or "").rpartition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def events_since(self, sequence: int, task_id: Optional[int] = None) -> Optional[List[TaskEvent]]:
+        """
+        返回序号大于 sequence 的事件；缓冲区已经不包含其后的全部事件时返回 None，调用方改发当前快照
+        """
+        oldest = self._history[0][0] if self._history else self.sequence + 1
+        if sequence > self.sequence or sequence < oldest - 1:
+            return None
+        return [event for event in self._history if event[0] > sequence and (task_id is None or event[1] == task_id)]
+
+    def subscribe(self, task_id: Optional[int] = None) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, task_id: Optional[int] = None):
+        subscribers = self._subscribers.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[task_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+task_states = TaskStateCache(
+    max_size=settings.TASK_STATE_CACHE_SIZE,
+    ttl=settings.TASK_STATE_TTL,
+    history_size=settings.TASK_EVENT_HISTORY,
+)
@@ -0,0 +1,183 @@
+"""
+离线分词器
+
+- cjk: 启发式分词，CJK 字符（含假名、谚文）每字一个 token，其余按单词和标点计，
+  单个正则即可完成，速度快，适合中日文为主的语料
+- BPE: 从 TOKENIZER_DIR 读取 tiktoken 格式的词表文件（``<name>.tiktoken``，每行 ``base64 rank``），
+  安装了 tiktoken 时用它编码，否则使用纯 Python 的字节级 BPE
+
+分块器需要把 token 预算换算成字符位置，所以分词器返回每个 token 的结束字符位置。
+段落级结果放在 LRU 缓存中，同一文档以不同大小重新分块时直接复用。
+"""
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence
+import base64
+import os
+import re
+import threading
+
+from app.core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken 是可选依赖
+    tiktoken = None
+
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+# cl100k 的预切分规则；标准库 re 不支持 \p{L}，用 [^\W\d_] 表示字母
+_BPE_PATTERN = re.compile(
+    r"'(?i:[sdmt]|ll|ve|re)"
+    r"|(?:(?![\r\n])[\W_])?+[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:(?!\s)[\W_])++[\r\n]*"
+    r"|\s*[\r\n]"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+
+class UnknownTokenizerError(ValueError):
+    pass
+
+
+class Tokenizer:
+    name = "base"
+
+    def __init__(self, cache_size: int = 4096):
+        self._cached_ends = lru_cache(maxsize=cache_size)(self._token_ends)
+
+    def _token_ends(self, text: str) -> List[int]:
+        raise NotImplementedError
+
+    def token_ends(self, text: str, cache: bool = True) -> List[int]:
+        """
+        每个 token 的结束字符位置（单调不减）
+
+        cache=False 用于只会出现一次的文本（如拼接后的分块内容），避免挤掉缓存中的段落
+        """
+        return self._cached_ends(text) if cache else self._token_ends(text)
+
+    def count(self, text: str) -> int:
+        return len(self._token_ends(text))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(self.token_ends(text)) for text in texts]
+
+
+class CJKTokenizer(Tokenizer):
+    name = "cjk"
+
+    def _token_ends(self, text: str) -> List[int]:
+        return [match.end() for match in _CJK_PATTERN.finditer(text)]
+
+    def count(self, text: str) -> int:
+        # 只计数时 findall 比逐个取 match 对象快
+        return len(_CJK_PATTERN.findall(text))
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        return [len(_CJK_PATTERN.findall(text)) for text in texts]
+
+
+def load_bpe_ranks(path: str) -> Dict[bytes, int]:
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def _bpe_merge(piece: bytes, ranks: Dict[bytes, int]) -> List[int]:
+    """
+    字节级 BPE 合并，返回每个 token 的结束字节位置
+    """
+    parts = [(i, i + 1) for i in range(len(piece))]
+    while len(parts) > 1:
+        best_rank, best = None, None
+        for i in range(len(parts) - 1):
+            rank = ranks.get(piece[parts[i][0]:parts[i + 1][1]])
+            if rank is not None and (best_rank is None or rank < best_rank):
+                best_rank, best = rank, i
+        if best is None:
+            break
+        parts[best:best + 2] = [(parts[best][0], parts[best + 1][1])]
+    return [end for _, end in parts]
+
+
+class BPETokenizer(Tokenizer):
+    def __init__(self, name: str, path: str, cache_size: int = 4096):
+        super().__init__(cache_size)
+        self.name = name
+        self.ranks = load_bpe_ranks(path)
+        self._encoding = None
+        if tiktoken is not None:
+            self._encoding = tiktoken.Encoding(
+                name=name, pat_str=_BPE_PATTERN.pattern, mergeable_ranks=self.ranks, special_tokens={}
+            )
+        # 预切分后的片段大量重复（常用词），单独缓存合并结果
+        self._merge = lru_cache(maxsize=cache_size * 4)(self._merge_piece)
+
+    def _merge_piece(self, piece: str) -> List[int]:
+        data = piece.encode("utf-8")
+        if data in self.ranks:
+            return [len(piece)]
+        # 字节位置换算为字符位置，token 在字符中间结束时计到该字符末尾
+        char_ends = list(accumulate(len(ch.encode("utf-8")) for ch in piece))
+        return [bisect_left(char_ends, end) + 1 for end in _bpe_merge(data, self.ranks)]
+
+    def _token_ends(self, text: str) -> List[int]:
+        if self._encoding is not None:
+            tokens = self._encoding.encode_ordinary(text)
+            _, starts = self._encoding.decode_with_offsets(tokens)
+            return starts[1:] + [len(text)] if tokens else []
+        ends = []
+        for match in _BPE_PATTERN.finditer(text):
+            start = match.start()
+            ends.extend(start + end for end in self._merge(match.group()))
+        return ends
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        if self._encoding is not None:
+            return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(list(texts))]
+        return super().count_batch(texts)
+
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_lock = threading.Lock()
+
+
+def available_tokenizers() -> List[str]:
+    names = [CJKTokenizer.name]
+    if os.path.isdir(settings.TOKENIZER_DIR):
+        names += sorted(
+            filename[:-len(".tiktoken")]
+            for filename in os.listdir(settings.TOKENIZER_DIR)
+            if filename.endswith(".tiktoken")
+        )
+    return names
+
+
+def get_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    """
+    按名称取得分词器（进程内单例），未指定时使用 DEFAULT_TOKENIZER
+    """
+    name = name or settings.DEFAULT_TOKENIZER
+    with _lock:
+        tokenizer = _tokenizers.get(name)
+        if tokenizer is not None:
+            return tokenizer
+        if name == CJKTokenizer.name:
+            tokenizer = CJKTokenizer(settings.TOKENIZER_CACHE_SIZE)
+        else:
+            path = os.path.join(settings.TOKENIZER_DIR, f"{name}.tiktoken")
+            if not _NAME_PATTERN.match(name) or not os.path.isfile(path):
+                raise UnknownTokenizerError(f"Unknown tokenizer: {name}")
+            tokenizer = BPETokenizer(name, path, settings.TOKENIZER_CACHE_SIZE)
+        _tokenizers[name] = tokenizer
+        return tokenizer
@@ -0,0 +1,226 @@
+"""
+流式上传
+
+直接解析请求体中的 multipart 数据，把文件内容写入上传目录下的临时文件，
+同时增量计算 SHA-256；超过大小上限时立即中止。写完后用 rename 放到最终位置，
+每个字节只落盘一次（Starlette 的 UploadFile 会先把请求体缓存到临时文件，再复制一遍）。
+
+文件按内容寻址存放在 ``objects/<sha256 前两位>/<sha256><扩展名>``，
+相同内容只保存一份。
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+import hashlib
+import os
+import uuid
+
+from fastapi import Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.metrics import UPLOAD_BYTES
+
+ALLOWED_CONTENT_TYPES = [
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "text/plain",
+    "text/html",
+    "text/csv",
+    "application/vnd.ms-excel"
+]
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StoredUpload:
+    filename: str  # 用户上传时的文件名
+    content_type: str
+    path: str
+    size: int
+    sha256: str
+    deduplicated: bool = False  # 存储中已有相同内容
+
+
+def content_path(upload_dir: str, sha256: str, extension: str) -> str:
+    return os.path.join(upload_dir, "objects", sha256[:2], f"{sha256}{extension.lower()}")
+
+
+class FileSink:
+    """
+    写入临时文件并增量计算哈希，超过大小上限立即中止
+    """
+
+    def __init__(self, upload_dir: str, filename: str, content_type: str, max_size: int):
+        if content_type not in ALLOWED_CONTENT_TYPES:
+            raise UploadError(400, f"File type {content_type} not supported")
+        self.upload_dir = upload_dir
+        self.filename = filename
+        self.content_type = content_type
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._extension = os.path.splitext(filename)[1]
+        self._temp_path = os.path.join(upload_dir, f".{uuid.uuid4()}.part")
+        self._file = open(self._temp_path, "wb")
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.abort()
+            raise UploadError(413, f"File {self.filename} exceeds the {self.max_size} byte limit")
+        self._hash.update(data)
+        self._file.write(data)
+
+    def finish(self) -> StoredUpload:
+        self._file.close()
+        digest = self._hash.hexdigest()
+        path = content_path(self.upload_dir, digest, self._extension)
+        deduplicated = os.path.exists(path)
+        if deduplicated:
+            # 已有相同内容，丢弃这次写入的副本
+            os.remove(self._temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 同一文件系统内 rename 只修改目录项，不会再复制数据
+            os.replace(self._temp_path, path)
+        UPLOAD_BYTES.observe(self.size)
+        return StoredUpload(
+            filename=self.filename,
+            content_type=self.content_type,
+            path=path,
+            size=self.size,
+            sha256=digest,
+            deduplicated=deduplicated,
+        )
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+
+def _decode(value: Optional[bytes]) -> str:
+    return value.decode("utf-8", errors="replace") if value else ""
+
+
+async def _receive(
+    request: Request, upload_dir: str, max_size: int, max_files: int, fail_fast: bool
+) -> List[Tuple[str, Union[StoredUpload, UploadError]]]:
+    """
+    从请求体中流式接收 multipart 文件字段，按字段顺序返回 (文件名, 结果)
+
+    fail_fast 时单个文件的错误（类型不支持、超过大小上限）立即中止整个请求；
+    否则记录该文件的错误，丢弃其余内容后继续接收下一个文件
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError(400, "Expected multipart/form-data")
+
+    # 声明的请求体大小已超限时不必读取
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_size * max_files + 64 * 1024:
+        raise UploadError(413, f"Request body exceeds the {max_size} byte limit")
+
+    results: List[Tuple[str, Union[StoredUpload, UploadError]]] = []
+    state = {"field": b"", "value": b"", "headers": {}, "filename": "", "sink": None}
+
+    def fail(error: UploadError):
+        if fail_fast:
+            raise error
+        results.append((state["filename"], error))
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None:
+            # 普通表单字段，忽略
+            return
+        if len(results) >= max_files:
+            raise UploadError(400, f"At most {max_files} files per request")
+        state["filename"] = filename = os.path.basename(_decode(filename).replace("\\", "/"))
+        if not filename:
+            fail(UploadError(400, "No file selected"))
+            return
+        part_type = _decode(state["headers"].get(b"content-type")) or "application/octet-stream"
+        try:
+            state["sink"] = FileSink(upload_dir, filename, part_type, max_size)
+        except UploadError as e:
+            fail(e)
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["sink"] is not None:
+            try:
+                state["sink"].write(data[start:end])
+            except UploadError as e:
+                # FileSink 已删除临时文件，该字段的其余内容直接丢弃
+                state["sink"] = None
+                fail(e)
+
+    def on_part_end():
+        if state["sink"] is not None:
+            results.append((state["filename"], state["sink"].finish()))
+            state["sink"] = None
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except BaseException:
+        if state["sink"] is not None:
+            state["sink"].abort()
+        for _, upload in results:
+            if isinstance(upload, StoredUpload) and not upload.deduplicated and os.path.exists(upload.path):
+                os.remove(upload.path)
+        raise
+
+    if not results:
+        raise UploadError(400, "No file selected")
+    return results
+
+
+async def receive_multipart(request: Request, upload_dir: str, max_size: int, max_files: int = 1) -> List[StoredUpload]:
+    """
+    流式接收 multipart 文件字段，返回已保存的文件；任一文件出错时中止整个请求
+    """
+    return [stored for _, stored in await _receive(request, upload_dir, max_size, max_files, fail_fast=True)]
+
+
+async def receive_multipart_files(
+    request: Request, upload_dir: str, max_size: int, max_files: int
+) -> List[Tuple[str, Union[StoredUpload, UploadError]]]:
+    """
+    批量上传：流式接收多个文件字段，单个文件出错不影响其他文件，按字段顺序返回 (文件名, 结果)
+    """
+    return await _receive(request, upload_dir, max_size, max_files, fail_fast=False)
@@ -0,0 +1,69 @@
+"""
+Celery worker
+
+TASK_QUEUE_BACKEND=celery 时，分块任务经由 Redis 分发到任意节点上的 worker：
+
+    celery -A app.worker worker --loglevel=info
+
+测试时可设置 CELERY_BROKER_URL=memory:// 与 CELERY_TASK_ALWAYS_EAGER=true，无需 Redis。
+"""
+from celery import Celery, Task
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+
+celery_app = Celery(
+    "smartrag",
+    broker=settings.CELERY_BROKER_URL or settings.REDIS_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    # 任务执行完才确认；worker 中途退出时由 broker 重新投递（至少一次）
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    task_always_eager=settings.CELERY_TASK_ALWAYS_EAGER,
+    broker_transport_options={"visibility_timeout": 3600},
+)
+
+
+class ChunkTask(Task):
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        from app.services.pipeline import mark_task_failed
+
+        mark_task_failed(args[0], exc)
+
+
+@celery_app.task(
+    name="smartrag.chunk_document",
+    base=ChunkTask,
+    autoretry_for=(OperationalError,),
+    retry_backoff=settings.TASK_RETRY_BACKOFF,
+    max_retries=settings.TASK_MAX_RETRIES,
+)
+def chunk_document(task_id: int, file_id: int, config: dict):
+    from app.services.pipeline import run_chunk_job
+
+    run_chunk_job(task_id, file_id, config, _progress_reporter())
+
+
+_publisher = None
+
+
+def _progress_reporter():
+    """
+    PROGRESS_BUS=redis 时直接把进度发布到 Redis，API 进程订阅后推送给 WebSocket 客户端
+    """
+    global _publisher
+    if settings.PROGRESS_BUS != "redis":
+        from app.services.pipeline import _noop_report
+
+        return _noop_report
+    if _publisher is None:
+        from app.services.progress_bus import RedisProgressPublisher, progress_bus_url
+
+        _publisher = RedisProgressPublisher(progress_bus_url(), settings.PROGRESS_CHANNEL_PREFIX)
+    return _publisher
@@ -0,0 +1,81 @@
+"""
+对比两次基准测试的结果，找出性能退化
+
+    cd backend
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+
+按路径逐项对比两个结果 JSON 中的指标：``*_ms`` 越小越好，``*_per_second`` 越大越好，其他字段忽略。
+变化超过 threshold（默认 10%）的项目列为退化或改善；存在退化时以状态码 1 退出，可以直接用于 CI。
+"""
+from typing import Any, Dict, Iterator, List, Tuple
+import argparse
+import json
+import sys
+
+# 不参与对比的顶层字段
+_SKIPPED = {"environment", "parameters"}
+
+
+def metrics(result: Any, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    if not isinstance(result, dict):
+        return
+    for key, value in result.items():
+        if not prefix and key in _SKIPPED:
+            continue
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from metrics(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and (
+            key.endswith("_ms") or key.endswith("_per_second")
+        ):
+            yield path, float(value)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> Dict[str, List[Dict[str, Any]]]:
+    before = dict(metrics(baseline))
+    report: Dict[str, List[Dict[str, Any]]] = {"regressions": [], "improvements": [], "missing": []}
+    for path, value in metrics(current):
+        if path not in before:
+            continue
+        old = before.pop(path)
+        if old == 0:
+            continue
+        change = (value - old) / old
+        # 耗时增加或吞吐量下降为退化
+        worse = change > 0 if path.endswith("_ms") else change < 0
+        if abs(change) < threshold:
+            continue
+        entry = {"metric": path, "baseline": old, "current": value, "change": round(change, 3)}
+        report["regressions" if worse else "improvements"].append(entry)
+    report["missing"] = sorted(before)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="视为变化的相对幅度")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出对比结果")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    report = compare(baseline, current, args.threshold)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for title, key in (("Regressions", "regressions"), ("Improvements", "improvements")):
+            print(f"{title}: {len(report[key])}")
+            for entry in report[key]:
+                print(f"  {entry['metric']}: {entry['baseline']} -> {entry['current']} ({entry['change']:+.1%})")
+        if report["missing"]:
+            print(f"Missing in current: {', '.join(report['missing'])}")
+    sys.exit(1 if report["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+端到端负载测试：并发上传、分块任务、预览轮询、WebSocket 扇出、流式导出
+
+    cd backend
+    python -m benchmarks.load --files 12 --concurrency 8 --output load.json
+    python -m benchmarks.load --scenarios upload,chunk,export
+
+应用在本进程内运行（httpx.ASGITransport 调用 ASGI 应用，WebSocket 直接驱动 ASGI 接口），
+不监听端口、不访问网络。数据库和上传目录使用临时目录，分块任务由正常的进程池执行。
+场景按 upload → chunk → preview / websocket / export 的顺序运行，后面的场景使用前面产生的文件和分块；
+只选择了后面的场景时会自动先完成上传和分块（不计入结果）。
+"""
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.corpus import FORMATS, generate_corpus
+from benchmarks.results import environment, per_second, summarize, write_result
+
+SCENARIOS = ("upload", "chunk", "preview", "websocket", "export")
+
+API = "/api/v1"
+CONTENT_TYPES = {
+    "txt": "text/plain",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+async def _gather_limited(concurrency: int, coroutines) -> List[Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+
+class _WebSocketClient:
+    """
+    直接调用 ASGI 应用的 WebSocket 客户端（httpx 不支持 WebSocket）
+    """
+
+    def __init__(self, app, path: str):
+        self._incoming: asyncio.Queue = asyncio.Queue()
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._accepted = asyncio.Event()
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self._incoming.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(app(scope, self._incoming.get, self._send))
+
+    async def _send(self, message: dict):
+        if message["type"] == "websocket.accept":
+            self._accepted.set()
+        elif message["type"] == "websocket.send":
+            self._outgoing.put_nowait((time.time(), message.get("text")))
+
+    async def connect(self):
+        await self._accepted.wait()
+
+    async def send_json(self, data: dict):
+        await self._incoming.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive(self):
+        """
+        返回 (收到的时间戳, 消息)
+        """
+        received_at, text = await self._outgoing.get()
+        return received_at, json.loads(text)
+
+    async def close(self):
+        await self._incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await self._task
+
+
+async def upload_scenario(client, paths: List[str], concurrency: int) -> Dict[str, Any]:
+    timings: List[float] = []
+    file_ids: List[int] = []
+
+    async def upload(path: str):
+        with open(path, "rb") as f:
+            content = f.read()
+        name = os.path.basename(path)
+        started = time.perf_counter()
+        response = await client.post(
+            f"{API}/upload/file",
+            files={"file": (name, content, CONTENT_TYPES[name.rsplit(".", 1)[-1]])},
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        file_ids.append(response.json()["id"])
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    started = time.perf_counter()
+    await _gather_limited(concurrency, (upload(path) for path in paths))
+    elapsed = time.perf_counter() - started
+    return {
+        "result": {
+            **summarize(timings),
+            "files": len(paths),
+            "bytes": total_bytes,
+            "seconds": round(elapsed, 3),
+            "files_per_second": per_second(len(paths), elapsed),
+            "bytes_per_second": per_second(total_bytes, elapsed),
+        },
+        "file_ids": sorted(file_ids),
+    }
+
+
+async def chunk_scenario(client, file_ids: List[int], config: dict, poll_interval: float,
+                         timeout: float) -> Dict[str, Any]:
+    """
+    提交全部分块任务（队列满返回 429 时按 Retry-After 重试），轮询任务状态直到全部结束
+    """
+    submit_timings: List[float] = []
+    job_timings: List[float] = []
+    statuses: Dict[str, int] = {}
+    rejected = 0
+
+    async def run(file_id: int):
+        nonlocal rejected
+        while True:
+            started = time.perf_counter()
+            response = await client.post(f"{API}/processing/chunk", params={"file_id": file_id}, json=config)
+            submit_timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 429:
+                break
+            rejected += 1
+            await asyncio.sleep(min(float(response.headers.get("Retry-After", 1)), poll_interval * 10))
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        deadline = started + timeout
+        while True:
+            status = (await client.get(f"{API}/processing/task/{task_id}")).json()["status"]
+            if status in TERMINAL_STATUSES or time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(poll_interval)
+        job_timings.append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(file_id) for file_id in file_ids))
+    elapsed = time.perf_counter() - started
+
+    chunks = 0
+    for file_id in file_ids:
+        response = await client.get(f"{API}/processing/preview/{file_id}", params={"limit": 1, "fields": "id"})
+        chunks += response.json()["total"] or 0
+    return {
+        "submit": summarize(submit_timings),
+        "job": summarize(job_timings),
+        "jobs": len(file_ids),
+        "statuses": statuses,
+        "rejected": rejected,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "jobs_per_second": per_second(len(file_ids), elapsed),
+        "chunks_per_second": per_second(chunks, elapsed),
+    }
+
+
+async def preview_scenario(client, file_ids: List[int], clients: int, rounds: int, page_size: int) -> Dict[str, Any]:
+    """
+    每个客户端按游标翻完一个文件的全部预览页，共 rounds 轮
+    """
+    timings: List[float] = []
+
+    async def browse(file_id: int):
+        after = None
+        while True:
+            params = {"limit": page_size}
+            if after is not None:
+                params["after_chunk_index"] = after
+            started = time.perf_counter()
+            response = await client.get(f"{API}/processing/preview/{file_id}", params=params)
+            timings.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+            after = response.json()["next_after_chunk_index"]
+            if after is None:
+                return
+
+    visits = [file_ids[index % len(file_ids)] for index in range(clients * rounds)]
+    started = time.perf_counter()
+    await _gather_limited(clients, (browse(file_id) for file_id in visits))
+    elapsed = time.perf_counter() - started
+    return {
+        **summarize(timings),
+        "clients": clients,
+        "requests": len(timings),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": per_second(len(timings), elapsed),
+    }
+
+
+async def websocket_scenario(app, connections: int, tasks: int, updates: int, interval: float) -> Dict[str, Any]:
+    """
+    connections 个连接各订阅 tasks 个任务，每个任务发布 updates 条进度和一条结束状态；
+    延迟为结束状态从发布到各连接收到的时间
+    """
+    from app.api.endpoints.websocket import manager, send_task_update
+
+    task_ids = list(range(1_000_000, 1_000_000 + tasks))
+    clients = [_WebSocketClient(app, f"{API}/ws/ws") for _ in range(connections)]
+    for client in clients:
+        await client.connect()
+        for task_id in task_ids:
+            await client.send_json({"type": "subscribe_task", "task_id": task_id})
+        for _ in task_ids:
+            await client.receive()  # subscription_confirmed
+
+    received = [0] * connections
+    latencies: List[float] = []
+
+    async def consume(position: int, client: _WebSocketClient):
+        finished = 0
+        while finished < len(task_ids):
+            received_at, message = await client.receive()
+            received[position] += 1
+            if message.get("status") in TERMINAL_STATUSES:
+                finished += 1
+                latencies.append((received_at - message["timestamp"]) * 1000)
+
+    consumers = [asyncio.create_task(consume(position, client)) for position, client in enumerate(clients)]
+    started = time.perf_counter()
+    for step in range(updates):
+        for task_id in task_ids:
+            await send_task_update(task_id, "running", round(100 * step / updates, 1))
+        await asyncio.sleep(interval)
+    for task_id in task_ids:
+        await send_task_update(task_id, "completed", 100.0)
+    await asyncio.gather(*consumers)
+    elapsed = time.perf_counter() - started
+    dropped = manager.dropped_messages
+
+    for client in clients:
+        await client.close()
+    published = tasks * (updates + 1)
+    return {
+        **summarize(latencies),
+        "connections": connections,
+        "tasks": tasks,
+        "published": published,
+        "delivered": sum(received),
+        "dropped": dropped,
+        # 每个连接实际收到的更新占发布数的比例，节流合并后小于 1
+        "delivery_ratio": round(sum(received) / (published * connections), 3),
+        "seconds": round(elapsed, 3),
+        "messages_per_second": per_second(sum(received), elapsed),
+    }
+
+
+async def export_scenario(client, file_ids: List[int], concurrency: int, schema_type: str) -> Dict[str, Any]:
+    """
+    按文件并发下载 NDJSON 流，再以 Parquet 一次导出全部文件
+
+    ASGITransport 收齐响应体后才返回，这里只能测量完整下载的耗时和吞吐量
+    """
+    async def download(url: str, params, timings: List[float]) -> int:
+        started = time.perf_counter()
+        response = await client.get(url, params=params)
+        timings.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+        return len(response.content)
+
+    ndjson_timings: List[float] = []
+    started = time.perf_counter()
+    sizes = await _gather_limited(concurrency, (
+        download(f"{API}/export/download/{file_id}", {"schema_type": schema_type, "format": "ndjson"}, ndjson_timings)
+        for file_id in file_ids
+    ))
+    elapsed = time.perf_counter() - started
+
+    parquet_timings: List[float] = []
+    parquet_bytes = await download(
+        f"{API}/export/columnar",
+        [("file_id", file_id) for file_id in file_ids] + [("format", "parquet")],
+        parquet_timings,
+    )
+    parquet_seconds = parquet_timings[0] / 1000
+
+    return {
+        "ndjson": {
+            **summarize(ndjson_timings),
+            "files": len(file_ids),
+            "bytes": sum(sizes),
+            "seconds": round(elapsed, 3),
+            "bytes_per_second": per_second(sum(sizes), elapsed),
+        },
+        "parquet": {
+            **summarize(parquet_timings),
+            "bytes": parquet_bytes,
+            "bytes_per_second": per_second(parquet_bytes, parquet_seconds),
+        },
+    }
+
+
+async def run(args, directory: str) -> Dict[str, Any]:
+    import httpx
+
+    # 环境变量在导入应用之前设置，进程池中的 worker 也会继承
+    from app.main import app
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+    paths = generate_corpus(os.path.join(directory, "corpus"), args.files, formats, args.scale, args.seed)
+    config = {"chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap, "size_unit": args.size_unit}
+    results: Dict[str, Any] = {}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            uploaded = await upload_scenario(client, paths, args.concurrency)
+            if "upload" in scenarios:
+                results["upload"] = uploaded["result"]
+            file_ids = uploaded["file_ids"]
+
+            if any(name in scenarios for name in ("chunk", "preview", "export")):
+                chunked = await chunk_scenario(client, file_ids, config, args.poll_interval, args.timeout)
+                if "chunk" in scenarios:
+                    results["chunk"] = chunked
+            if "preview" in scenarios:
+                results["preview"] = await preview_scenario(
+                    client, file_ids, args.concurrency, args.preview_rounds, args.page_size
+                )
+            if "websocket" in scenarios:
+                results["websocket"] = await websocket_scenario(
+                    app, args.ws_connections, args.ws_tasks, args.ws_updates, args.ws_interval
+                )
+            if "export" in scenarios:
+                results["export"] = await export_scenario(client, file_ids, args.concurrency, args.schema_type)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--scale", type=int, default=1, help="文档大小的倍数，见 benchmarks.corpus.make_file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8, help="上传、预览和导出的并发请求数")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--size-unit", default="chars")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="轮询任务状态的间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=600, help="单个分块任务的最长等待时间（秒）")
+    parser.add_argument("--preview-rounds", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--ws-connections", type=int, default=100)
+    parser.add_argument("--ws-tasks", type=int, default=10)
+    parser.add_argument("--ws-updates", type=int, default=50, help="每个任务发布的进度条数")
+    parser.add_argument("--ws-interval", type=float, default=0.01, help="两轮进度之间的间隔（秒）")
+    parser.add_argument("--schema-type", default="standard")
+    parser.add_argument("--output", help="结果 JSON 的写入路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        os.environ["UPLOAD_DIR"] = os.path.join(directory, "uploads")
+        os.environ["PROGRESS_BUS"] = "memory"
+        os.environ["TASK_QUEUE_BACKEND"] = "local"
+        results = asyncio.run(run(args, directory))
+
+    write_result({
+        "benchmark": "load",
+        "environment": environment(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "seconds": round(time.perf_counter() - started, 2),
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
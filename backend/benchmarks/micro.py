@@ -0,0 +1,178 @@
+"""
+热点代码的微基准测试：解析、分块、token 计数、导出序列化、列式写出、MinHash
+
+    cd backend
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --filter chunk --repeat 20
+
+输入来自 benchmarks.corpus 按固定种子生成的文档，不访问数据库和网络。
+每项结果包含每次调用的耗时分布和吞吐量（chars_per_second / chunks_per_second 等）。
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+import argparse
+import json
+import tempfile
+import time
+
+from app.core.config import settings
+from app.models import DocumentChunk, UploadedFile
+from app.services.chunker import chunk_blocks
+from app.services.columnar import COLUMNAR_FORMATS, ColumnarWriter
+from app.services.export_schemas import list_schemas
+from app.services.near_dup import MinHasher
+from app.services.parsers import Block, PDFParser, get_parser
+from app.services.tokenizers import CJKTokenizer
+
+from benchmarks.corpus import make_file
+from benchmarks.results import environment, per_second, summarize, time_calls, write_result
+
+# 与 ChunkConfig 的默认值相同
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+def _result(timings: List[float], **throughput) -> dict:
+    """
+    throughput 为每次调用处理的数量，如 chars=100000，换算成按 p50 计的每秒处理量
+    """
+    result = summarize(timings)
+    seconds = result["p50_ms"] / 1000
+    for name, count in throughput.items():
+        result[name] = count
+        result[f"{name}_per_second"] = per_second(count, seconds)
+    return result
+
+
+def _chunk_rows(blocks: List[Block], file_id: int = 1) -> List[DocumentChunk]:
+    created_at = datetime(2025, 1, 1)
+    rows = []
+    for chunk in chunk_blocks(blocks, CHUNK_SIZE, CHUNK_OVERLAP):
+        rows.append(DocumentChunk(
+            id=chunk.index + 1,
+            file_id=file_id,
+            chunk_index=chunk.index,
+            content=chunk.content,
+            html_content=chunk.to_html(),
+            markdown_content=chunk.to_markdown(),
+            chunk_metadata=json.dumps(chunk.metadata("paragraph"), ensure_ascii=False),
+            created_at=created_at,
+        ))
+    return rows
+
+
+def build_benchmarks(directory: str, scale: int) -> Dict[str, Callable[[int], dict]]:
+    paths = {file_format: make_file(directory, file_format, index, scale)
+             for index, file_format in enumerate(("txt", "pdf", "docx"))}
+    blocks = list(get_parser(paths["txt"]).iter_blocks())
+    chars = sum(len(block.text) for block in blocks)
+    texts = [block.text for block in blocks]
+    rows = _chunk_rows(blocks)
+    file = UploadedFile(id=1, original_filename="doc.txt", upload_time=datetime(2025, 1, 1))
+    columnar_rows = [
+        SimpleNamespace(
+            file_id=row.file_id, filename=file.original_filename, chunk_id=row.id,
+            chunk_index=row.chunk_index, content=row.content, chunk_metadata=row.chunk_metadata,
+            created_at=row.created_at,
+        )
+        for row in rows
+    ]
+
+    def parse(file_format: str):
+        def run(repeat: int) -> dict:
+            path = paths[file_format]
+            # PDF 固定使用单进程解析，结果不受机器核数影响
+            make_parser = (lambda: PDFParser(path, workers=1)) if file_format == "pdf" else (lambda: get_parser(path))
+            count = len(list(make_parser().iter_blocks()))
+            return _result(time_calls(lambda: list(make_parser().iter_blocks()), repeat), blocks=count)
+        return run
+
+    def chunk(size_unit: str):
+        def run(repeat: int) -> dict:
+            def call():
+                # 每次使用新的分词器，不让上一轮的缓存影响结果
+                tokenizer = CJKTokenizer(settings.TOKENIZER_CACHE_SIZE)
+                return list(chunk_blocks(blocks, CHUNK_SIZE, CHUNK_OVERLAP,
+                                         size_unit=size_unit, tokenizer=tokenizer))
+            count = len(call())
+            return _result(time_calls(call, repeat), chars=chars, chunks=count)
+        return run
+
+    def count_tokens(repeat: int) -> dict:
+        return _result(
+            time_calls(lambda: CJKTokenizer(settings.TOKENIZER_CACHE_SIZE).count_batch(texts), repeat),
+            chars=chars,
+        )
+
+    def serialize(schema):
+        def run(repeat: int) -> dict:
+            serializer = schema.serialize
+            size = sum(len(serializer(row, file)) for row in rows)
+            return _result(
+                time_calls(lambda: [serializer(row, file) for row in rows], repeat),
+                chunks=len(rows), bytes=size,
+            )
+        return run
+
+    def columnar(output_format: str):
+        def run(repeat: int) -> dict:
+            def call():
+                writer = ColumnarWriter(output_format)
+                return len(writer.write(columnar_rows)) + len(writer.close())
+            return _result(time_calls(call, repeat), chunks=len(rows), bytes=call())
+        return run
+
+    def minhash(repeat: int) -> dict:
+        hasher = MinHasher(
+            num_perm=settings.NEAR_DUP_NUM_PERM,
+            bands=settings.NEAR_DUP_BANDS,
+            shingle_size=settings.NEAR_DUP_SHINGLE_SIZE,
+            seed=settings.NEAR_DUP_SEED,
+        )
+        contents = [row.content for row in rows]
+        return _result(
+            time_calls(lambda: [hasher.buckets(hasher.signature(content)) for content in contents], repeat),
+            chunks=len(contents),
+        )
+
+    benchmarks = {f"parse_{file_format}": parse(file_format) for file_format in paths}
+    benchmarks["chunk_chars"] = chunk("chars")
+    benchmarks["chunk_tokens"] = chunk("tokens")
+    benchmarks["count_tokens"] = count_tokens
+    for schema in list_schemas():
+        benchmarks[f"serialize_{schema.name}"] = serialize(schema)
+    for output_format in COLUMNAR_FORMATS:
+        benchmarks[f"columnar_{output_format}"] = columnar(output_format)
+    benchmarks["minhash"] = minhash
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--scale", type=int, default=1, help="文档大小的倍数，见 benchmarks.corpus.make_file")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的项目")
+    parser.add_argument("--output", help="结果 JSON 的写入路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    results = {}
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        for name, run in build_benchmarks(directory, args.scale).items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = run(args.repeat)
+
+    write_result({
+        "benchmark": "micro",
+        "environment": environment(),
+        "repeat": args.repeat,
+        "scale": args.scale,
+        "seconds": round(time.perf_counter() - started, 2),
+        "results": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
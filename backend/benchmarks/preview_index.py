@@ -0,0 +1,119 @@
+"""
+预览查询在加索引前后的延迟对比
+
+    cd backend
+    python -m benchmarks.preview_index --rows 10000000 --files 10000
+
+在临时 SQLite 数据库中先迁移到 0001（无索引）版本并写入合成分块，
+测量 GET /processing/preview 所用查询的延迟；再升级到 head 后重新测量。
+结果与其他基准测试使用同一结构的 JSON，可用 --output 写入文件后交给 benchmarks.compare 对比。
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from alembic import command
+from sqlalchemy import create_engine, text
+
+from app.core.database import alembic_config
+from benchmarks.results import environment, per_second, summarize, write_result
+
+PREVIEW_QUERY = text(
+    "SELECT id, chunk_index, content, html_content, markdown_content, chunk_metadata "
+    "FROM document_chunks WHERE file_id = :file_id ORDER BY chunk_index"
+)
+
+
+def populate(engine, rows: int, files: int, content_size: int, batch_size: int = 50000):
+    content = ("分块内容 chunk " * content_size)[:content_size]
+    metadata = json.dumps({"page": 1, "type": "paragraph", "method": "paragraph"})
+    per_file = max(1, rows // files)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        batch = []
+        for row in range(rows):
+            batch.append((row // per_file + 1, row % per_file, content, metadata))
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    "INSERT INTO document_chunks (file_id, chunk_index, content, chunk_metadata) VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+                batch = []
+        if batch:
+            cursor.executemany(
+                "INSERT INTO document_chunks (file_id, chunk_index, content, chunk_metadata) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+        connection.commit()
+    finally:
+        connection.close()
+    return (rows - 1) // per_file + 1
+
+
+def measure(engine, files: int, samples: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    timings = []
+    with engine.connect() as connection:
+        for _ in range(samples):
+            file_id = rng.randint(1, files)
+            started = time.perf_counter()
+            connection.execute(PREVIEW_QUERY, {"file_id": file_id}).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def migrate(engine, revision: str):
+    with engine.begin() as connection:
+        command.upgrade(alembic_config(connection), revision)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--content-size", type=int, default=64)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 的写入路径，默认输出到标准输出")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        migrate(engine, "0001")
+
+        populate_started = time.perf_counter()
+        files = populate(engine, args.rows, args.files, args.content_size)
+        populate_seconds = time.perf_counter() - populate_started
+
+        before = measure(engine, files, args.samples, args.seed)
+
+        migrate_started = time.perf_counter()
+        migrate(engine, "head")
+        migrate_seconds = time.perf_counter() - migrate_started
+
+        after = measure(engine, files, args.samples, args.seed)
+        engine.dispose()
+
+    write_result({
+        "benchmark": "preview_index",
+        "environment": environment(),
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "seconds": round(time.perf_counter() - started, 2),
+        "results": {
+            "populate": {"files": files, "rows_per_second": per_second(args.rows, populate_seconds)},
+            "migrate": {"elapsed_ms": round(migrate_seconds * 1000, 3)},
+            "before": before,
+            "after": after,
+            "speedup_p50": round(before["p50_ms"] / after["p50_ms"], 1) if after.get("p50_ms") else None,
+        },
+    }, args.output)
+
+if __name__ == "__main__":
+    main()
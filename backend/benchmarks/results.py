@@ -0,0 +1,72 @@
+"""
+基准测试结果的统计和输出
+
+所有基准测试输出同一结构的 JSON：顶层 benchmark / environment，各项结果的计时字段统一为
+mean_ms、p50_ms、p95_ms、max_ms，吞吐量字段以 _per_second 结尾，便于 benchmarks.compare 对比。
+"""
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+
+def summarize(timings_ms: List[float]) -> Dict[str, Any]:
+    timings = sorted(timings_ms)
+    if not timings:
+        return {"samples": 0}
+    return {
+        "samples": len(timings),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+def time_calls(function: Callable[[], Any], repeat: int, warmup: int = 1) -> List[float]:
+    """
+    调用 function repeat 次，返回每次的耗时（毫秒）；先空跑 warmup 次
+    """
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def per_second(count: float, seconds: float) -> Optional[float]:
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_result(result: Dict[str, Any], output: Optional[str] = None):
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
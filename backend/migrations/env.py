@@ -0,0 +1,78 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from app.core.config import settings
+from app.models import Base
+from app.services.search import register_sqlite_functions
+
+config = context.config
+
+# 由应用启动时调用（init_db）不覆盖应用自己的日志配置
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+if not config.get_main_option("sqlalchemy.url"):
+    config.set_main_option("sqlalchemy.url", settings.DATABASE_URL.replace("%", "%%"))
+
+target_metadata = Base.metadata
+
+# 由迁移直接用 SQL 维护、不在模型中声明的表（FTS5 虚拟表及其影子表）
+UNMANAGED_TABLE_PREFIXES = ("document_chunks_fts", "document_chunks_bigram")
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name.startswith(UNMANAGED_TABLE_PREFIXES):
+        return False
+    return True
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=True,
+        include_object=include_object,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = config.attributes.get("connection")
+    if connectable is None:
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section, {}),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+        with connectable.connect() as connection:
+            _run(connection)
+    else:
+        _run(connectable)
+
+
+def _run(connection) -> None:
+    if connection.dialect.name == "sqlite":
+        # 迁移中写入 document_chunks 会触发 bigram 索引触发器
+        register_sqlite_functions(connection.connection.driver_connection)
+    # SQLite 不支持大部分 ALTER TABLE，使用 batch 模式重建表
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=True,
+        include_object=include_object,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,79 @@
+"""initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-08-25 00:00:00
+
+与引入 Alembic 之前 Base.metadata.create_all 创建的表结构一致，
+已有数据库会被直接标记为该版本。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "uploaded_files",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("original_filename", sa.String(), nullable=False),
+        sa.Column("file_path", sa.String(), nullable=False),
+        sa.Column("file_size", sa.Integer(), nullable=False),
+        sa.Column("content_type", sa.String(), nullable=False),
+        sa.Column("upload_time", sa.DateTime(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("chunks_count", sa.Integer(), nullable=True),
+        sa.Column("error_message", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_uploaded_files_id", "uploaded_files", ["id"])
+
+    op.create_table(
+        "processing_tasks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("file_id", sa.Integer(), nullable=False),
+        sa.Column("task_type", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("progress", sa.Float(), nullable=True),
+        sa.Column("config", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("error_message", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_processing_tasks_id", "processing_tasks", ["id"])
+
+    op.create_table(
+        "document_chunks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("file_id", sa.Integer(), nullable=False),
+        sa.Column("chunk_index", sa.Integer(), nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("html_content", sa.String(), nullable=True),
+        sa.Column("markdown_content", sa.String(), nullable=True),
+        sa.Column("chunk_metadata", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_document_chunks_id", "document_chunks", ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_document_chunks_id", table_name="document_chunks")
+    op.drop_table("document_chunks")
+    op.drop_index("ix_processing_tasks_id", table_name="processing_tasks")
+    op.drop_table("processing_tasks")
+    op.drop_index("ix_uploaded_files_id", table_name="uploaded_files")
+    op.drop_table("uploaded_files")
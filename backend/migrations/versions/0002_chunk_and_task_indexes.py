@@ -0,0 +1,56 @@
+"""chunk and task lookup indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-09-01 00:00:00
+
+- document_chunks: 增加 task_id 列；(file_id, chunk_index) 唯一索引
+- processing_tasks: (status, created_at) 与 file_id 索引
+- uploaded_files: upload_time 索引
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("document_chunks")}
+    if "task_id" not in columns:
+        op.add_column("document_chunks", sa.Column("task_id", sa.Integer(), nullable=True))
+
+    # 旧版本重新分块时会追加重复的 chunk_index，只保留最新写入的一份
+    op.execute(
+        "DELETE FROM document_chunks WHERE id NOT IN "
+        "(SELECT MAX(id) FROM document_chunks GROUP BY file_id, chunk_index)"
+    )
+
+    op.create_index(
+        "ix_document_chunks_file_id_chunk_index",
+        "document_chunks",
+        ["file_id", "chunk_index"],
+        unique=True,
+    )
+    op.create_index("ix_document_chunks_task_id", "document_chunks", ["task_id"])
+    op.create_index("ix_processing_tasks_status_created_at", "processing_tasks", ["status", "created_at"])
+    op.create_index("ix_processing_tasks_file_id", "processing_tasks", ["file_id"])
+    op.create_index("ix_uploaded_files_upload_time", "uploaded_files", ["upload_time"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_uploaded_files_upload_time", table_name="uploaded_files")
+    op.drop_index("ix_processing_tasks_file_id", table_name="processing_tasks")
+    op.drop_index("ix_processing_tasks_status_created_at", table_name="processing_tasks")
+    op.drop_index("ix_document_chunks_task_id", table_name="document_chunks")
+    op.drop_index("ix_document_chunks_file_id_chunk_index", table_name="document_chunks")
+    with op.batch_alter_table("document_chunks") as batch_op:
+        batch_op.drop_column("task_id")
@@ -0,0 +1,32 @@
+"""uploaded file content hash
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-09-08 00:00:00
+
+上传时增量计算的 SHA-256
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("uploaded_files", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_uploaded_files_content_hash", "uploaded_files", ["content_hash"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_uploaded_files_content_hash", table_name="uploaded_files")
+    with op.batch_alter_table("uploaded_files") as batch_op:
+        batch_op.drop_column("content_hash")
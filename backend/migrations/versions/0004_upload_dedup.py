@@ -0,0 +1,34 @@
+"""upload deduplication
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-09-15 00:00:00
+
+- uploaded_files.ref_count: 相同内容重复上传时的引用计数
+- uploaded_files.chunk_config_hash: 当前分块结果对应的配置指纹，用于复用分块结果
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("uploaded_files") as batch_op:
+        batch_op.add_column(sa.Column("ref_count", sa.Integer(), nullable=False, server_default="1"))
+        batch_op.add_column(sa.Column("chunk_config_hash", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("uploaded_files") as batch_op:
+        batch_op.drop_column("chunk_config_hash")
+        batch_op.drop_column("ref_count")
@@ -0,0 +1,63 @@
+"""chunk near-duplicate index
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-09-22 00:00:00
+
+- chunk_signatures: 分块的 MinHash 签名
+- chunk_lsh_buckets: LSH 分桶，按桶值查找近似重复的候选分块
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "chunk_signatures",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("file_id", sa.Integer(), nullable=False),
+        sa.Column("task_id", sa.Integer(), nullable=True),
+        sa.Column("chunk_index", sa.Integer(), nullable=False),
+        sa.Column("signature", sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_chunk_signatures_file_id_chunk_index",
+        "chunk_signatures",
+        ["file_id", "chunk_index"],
+        unique=True,
+    )
+    op.create_index("ix_chunk_signatures_task_id", "chunk_signatures", ["task_id"])
+    op.create_table(
+        "chunk_lsh_buckets",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("bucket", sa.BigInteger(), nullable=False),
+        sa.Column("file_id", sa.Integer(), nullable=False),
+        sa.Column("task_id", sa.Integer(), nullable=True),
+        sa.Column("chunk_index", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_chunk_lsh_buckets_bucket", "chunk_lsh_buckets", ["bucket"])
+    op.create_index("ix_chunk_lsh_buckets_file_id", "chunk_lsh_buckets", ["file_id"])
+    op.create_index("ix_chunk_lsh_buckets_task_id", "chunk_lsh_buckets", ["task_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_chunk_lsh_buckets_task_id", table_name="chunk_lsh_buckets")
+    op.drop_index("ix_chunk_lsh_buckets_file_id", table_name="chunk_lsh_buckets")
+    op.drop_index("ix_chunk_lsh_buckets_bucket", table_name="chunk_lsh_buckets")
+    op.drop_table("chunk_lsh_buckets")
+    op.drop_index("ix_chunk_signatures_task_id", table_name="chunk_signatures")
+    op.drop_index("ix_chunk_signatures_file_id_chunk_index", table_name="chunk_signatures")
+    op.drop_table("chunk_signatures")
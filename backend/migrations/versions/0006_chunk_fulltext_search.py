@@ -0,0 +1,55 @@
+"""chunk full-text search
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-09-29 00:00:00
+
+- document_chunks_fts: SQLite FTS5 外部内容表（trigram 分词，中日文无需分词即可检索），
+  由触发器随 document_chunks 的增删改同步更新
+- 其他数据库不创建，搜索接口退回 LIKE 查询
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE document_chunks_fts USING fts5("
+        "content, content='document_chunks', content_rowid='id', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_fts_insert AFTER INSERT ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_fts_delete AFTER DELETE ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_fts(document_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_fts_update AFTER UPDATE OF content ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_fts(document_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO document_chunks_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    # 为已有的分块建立索引
+    op.execute("INSERT INTO document_chunks_fts(document_chunks_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_fts_update")
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_fts_delete")
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_fts_insert")
+    op.execute("DROP TABLE IF EXISTS document_chunks_fts")
@@ -0,0 +1,31 @@
+"""task owner
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-10-06 00:00:00
+
+- processing_tasks.owner: 提交任务的 API 进程（local 后端），多个 worker 重启恢复时按此认领未完成的任务
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("processing_tasks") as batch_op:
+        batch_op.add_column(sa.Column("owner", sa.String(length=128), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("processing_tasks") as batch_op:
+        batch_op.drop_column("owner")
@@ -0,0 +1,47 @@
+"""unique upload path
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2025-10-13 00:00:00
+
+- uploaded_files.file_path 唯一索引：上传登记改为 INSERT ... ON CONFLICT 增加引用计数
+- 并发上传相同内容留下的重复记录合并到 id 最小的一条：引用计数相加，任务改指向保留的记录，
+  重复记录的分块和近似重复索引删除（内容相同，保留记录的分块不受影响）
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+KEPT = "SELECT MIN(id) FROM uploaded_files GROUP BY file_path"
+DUPLICATES = f"SELECT id FROM uploaded_files WHERE id NOT IN ({KEPT})"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        "UPDATE uploaded_files SET ref_count = "
+        "(SELECT SUM(d.ref_count) FROM uploaded_files d WHERE d.file_path = uploaded_files.file_path) "
+        f"WHERE id IN ({KEPT} HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "UPDATE processing_tasks SET file_id = ("
+        "SELECT MIN(k.id) FROM uploaded_files k WHERE k.file_path = "
+        "(SELECT f.file_path FROM uploaded_files f WHERE f.id = processing_tasks.file_id)) "
+        f"WHERE file_id IN ({DUPLICATES})"
+    )
+    for table in ("document_chunks", "chunk_signatures", "chunk_lsh_buckets"):
+        op.execute(f"DELETE FROM {table} WHERE file_id IN ({DUPLICATES})")
+    op.execute(f"DELETE FROM uploaded_files WHERE id IN ({DUPLICATES})")
+    op.create_index("ix_uploaded_files_file_path", "uploaded_files", ["file_path"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_uploaded_files_file_path", table_name="uploaded_files")
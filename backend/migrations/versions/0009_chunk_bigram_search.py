@@ -0,0 +1,61 @@
+"""chunk bigram search
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2025-10-16 00:00:00
+
+- document_chunks_bigram: SQLite FTS5 无内容表，索引每个字母数字字符和相邻两个字符组成的词，
+  少于 3 个字符的检索词（trigram 无法索引）走这张表，不再对 document_chunks 全表 LIKE
+- 触发器调用应用注册的 chunk_bigrams() 函数生成索引内容
+- 其他数据库不创建
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, Sequence[str], None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    # 无内容表不保存原文，detail='none' 只记录词出现在哪些行；删除时按原内容重新生成要删除的词
+    op.execute(
+        "CREATE VIRTUAL TABLE document_chunks_bigram USING fts5("
+        "content, content='', detail='none', tokenize='unicode61 remove_diacritics 0')"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_bigram_insert AFTER INSERT ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_bigram(rowid, content) VALUES (new.id, chunk_bigrams(new.content)); END"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_bigram_delete AFTER DELETE ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_bigram(document_chunks_bigram, rowid, content) "
+        "VALUES ('delete', old.id, chunk_bigrams(old.content)); END"
+    )
+    op.execute(
+        "CREATE TRIGGER document_chunks_bigram_update AFTER UPDATE OF content ON document_chunks BEGIN "
+        "INSERT INTO document_chunks_bigram(document_chunks_bigram, rowid, content) "
+        "VALUES ('delete', old.id, chunk_bigrams(old.content)); "
+        "INSERT INTO document_chunks_bigram(rowid, content) VALUES (new.id, chunk_bigrams(new.content)); END"
+    )
+    # 为已有的分块建立索引
+    op.execute(
+        "INSERT INTO document_chunks_bigram(rowid, content) SELECT id, chunk_bigrams(content) FROM document_chunks"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_bigram_update")
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_bigram_delete")
+    op.execute("DROP TRIGGER IF EXISTS document_chunks_bigram_insert")
+    op.execute("DROP TABLE IF EXISTS document_chunks_bigram")
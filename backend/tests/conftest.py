@@ -0,0 +1,76 @@
+"""
+测试使用临时目录中的 SQLite 数据库和上传目录；环境变量必须在导入 app 之前设置
+"""
+import os
+import shutil
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix="smartrag-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_directory, "uploads")
+os.environ["PROGRESS_BUS"] = "memory"
+os.environ["TASK_QUEUE_BACKEND"] = "local"
+# Celery 后端的测试使用内存 broker，不需要 Redis
+os.environ["CELERY_BROKER_URL"] = "memory://"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.database import SessionLocal, init_db
+from app.models import ProcessingTask, UploadedFile
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    os.makedirs(os.environ["UPLOAD_DIR"], exist_ok=True)
+    init_db()
+    yield
+    shutil.rmtree(_directory, ignore_errors=True)
+
+
+@pytest.fixture
+def client():
+    """
+    不运行 lifespan：不启动进程池，也不恢复测试中创建的未完成任务
+    """
+    from app.main import app
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_file(db, tmp_path):
+    def make(content: str = "", **values) -> UploadedFile:
+        path = tmp_path / f"{len(os.listdir(tmp_path))}.txt"
+        path.write_text(content, encoding="utf-8")
+        values.setdefault("filename", path.name)
+        values.setdefault("original_filename", path.name)
+        values.setdefault("file_path", str(path))
+        values.setdefault("file_size", path.stat().st_size)
+        values.setdefault("content_type", "text/plain")
+        file = UploadedFile(**values)
+        db.add(file)
+        db.commit()
+        return file
+    return make
+
+
+@pytest.fixture
+def make_task(db, make_file):
+    def make(status: str = "pending", **values) -> ProcessingTask:
+        if "file_id" not in values:
+            values["file_id"] = make_file().id
+        task = ProcessingTask(task_type="chunk", status=status, **values)
+        db.add(task)
+        db.commit()
+        return task
+    return make
@@ -0,0 +1,42 @@
+import os
+
+from app.models import DocumentChunk, UploadedFile
+from app.services.block_store import ir_path
+from app.services.pipeline import run_chunk_job
+
+HTML = "<html><body><h1>标题</h1><p>第一段内容</p></body></html>"
+
+
+def _upload(client, name: str, content_type: str) -> int:
+    response = client.post("/api/v1/upload/file", files={"file": (name, HTML.encode("utf-8"), content_type)})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def _chunk(db, make_task, file_id: int) -> str:
+    task = make_task(file_id=file_id, config="{}")
+    run_chunk_job(task.id, file_id, {"chunk_size": 500, "chunk_overlap": 0})
+    db.expire_all()
+    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).order_by(DocumentChunk.chunk_index)
+    return "\n".join(chunk.content for chunk in chunks)
+
+
+def test_same_bytes_with_different_extensions_keep_separate_blocks(client, db, make_task):
+    html_id = _upload(client, "page.html", "text/html")
+    text_id = _upload(client, "page.txt", "text/plain")
+    assert html_id != text_id
+
+    html_chunks = _chunk(db, make_task, html_id)
+    text_chunks = _chunk(db, make_task, text_id)
+
+    assert "<p>" not in html_chunks and "第一段内容" in html_chunks
+    assert "<p>" in text_chunks
+
+    # 删除其中一个文件不影响另一个文件的中间结果
+    html_file, text_file = db.get(UploadedFile, html_id), db.get(UploadedFile, text_id)
+    assert ir_path(html_file) != ir_path(text_file)
+    assert client.delete(f"/api/v1/upload/files/{html_id}").status_code == 200
+    assert not os.path.exists(ir_path(html_file))
+    assert os.path.exists(ir_path(text_file))
+    # 再次分块读取自己的中间结果
+    assert _chunk(db, make_task, text_id) == text_chunks
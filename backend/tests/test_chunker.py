@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from app.services.chunker import chunk_blocks
+from app.services.parsers import Block
+
+BLOCKS = [
+    Block(text=f"第{index}段：文档预处理的测试内容，包含标点。Some English words here. " * (1 + index % 4), page=1 + index // 10)
+    for index in range(50)
+]
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"\s", "", text)
+
+
+@pytest.mark.parametrize("size_unit", ["chars", "tokens"])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(1, 0), (2, 1), (3, 0), (3, 1), (4, 1), (10, 3), (500, 50)])
+def test_chunks_cover_all_content(chunk_size, chunk_overlap, size_unit):
+    text = _compact("".join(block.text for block in BLOCKS))
+    position = 0
+    for chunk in chunk_blocks(BLOCKS, chunk_size, chunk_overlap, size_unit=size_unit):
+        content = _compact(chunk.content)
+        # 每个分块从上一个分块的末尾（或其重叠部分内）开始，中间不能有遗漏
+        earliest = max(0, position - len(content)) if chunk_overlap else position
+        start = text.rfind(content, earliest, position + len(content))
+        assert start >= 0, f"content lost after position {position}"
+        position = max(position, start + len(content))
+    assert position == len(text)
+
+
+@pytest.mark.parametrize("config", [
+    {"chunk_size": 0},
+    {"chunk_size": -1},
+    {"chunk_overlap": -1},
+    {"chunk_size": 100, "chunk_overlap": 100},
+    {"chunk_size": 3, "chunk_overlap": 5},
+])
+def test_chunk_config_rejects_invalid_sizes(client, make_file, config):
+    file = make_file("内容")
+
+    response = client.post("/api/v1/processing/chunk", params={"file_id": file.id}, json=config)
+    assert response.status_code == 422
+
+    response = client.post(
+        "/api/v1/upload/files", params={"chunk": "true", **config},
+        files=[("files", ("doc.txt", "内容".encode("utf-8"), "text/plain"))]
+    )
+    assert response.status_code == 422
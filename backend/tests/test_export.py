@@ -0,0 +1,42 @@
+from app.services.pipeline import run_chunk_job
+
+TEXT = "\n\n".join(f"第{index}段：用于导出测试的内容。" * 3 for index in range(30))
+
+
+def test_export_json_streams_all_chunks_in_order(client, make_file, make_task):
+    file = make_file(TEXT)
+    task = make_task(file_id=file.id, config="{}")
+    run_chunk_job(task.id, file.id, {"chunk_size": 60, "chunk_overlap": 0})
+
+    response = client.post("/api/v1/export/json", params={"file_id": file.id}, json={"schema_type": "standard"})
+
+    assert response.status_code == 200
+    body = response.json()
+    chunks = body["export_data"]["chunks"]
+    assert body["file_id"] == file.id and body["status"] == "ready"
+    assert body["total_chunks"] == len(chunks) > 1
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+    assert body["config"]["schema_type"] == "standard"
+
+    download = client.get(f"/api/v1/export/download/{file.id}", params={"schema_type": "standard"})
+    assert download.json()["chunks"] == chunks
+
+
+def test_export_json_for_file_without_chunks(client, make_file):
+    file = make_file("")
+
+    body = client.post("/api/v1/export/json", params={"file_id": file.id}, json={}).json()
+
+    assert body["total_chunks"] == 0
+    assert body["export_data"]["chunks"] == []
+    assert client.post("/api/v1/export/json", params={"file_id": 999999}, json={}).status_code == 404
+
+
+def test_unknown_schema_is_rejected_by_both_endpoints(client, make_file):
+    file = make_file(TEXT)
+
+    export = client.post("/api/v1/export/json", params={"file_id": file.id}, json={"schema_type": "missing"})
+    download = client.get(f"/api/v1/export/download/{file.id}", params={"schema_type": "missing"})
+
+    assert export.status_code == download.status_code == 400
+    assert export.json()["detail"] == download.json()["detail"] == "Unknown schema: missing"
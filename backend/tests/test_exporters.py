@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+import httpx
+
+from app.services.exporters import DifyExporter, ElasticsearchExporter
+
+OPTIONS = {"batch_size": 2, "concurrency": 2, "max_retries": 2, "retry_backoff": 0}
+
+
+async def _items(count: int):
+    for index in range(count):
+        yield index, {"content": f"chunk {index}"}
+
+
+def _export(exporter_class, handler, count: int, **kwargs):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            exporter = exporter_class(client, **kwargs, **OPTIONS)
+            return exporter, await exporter.export(_items(count))
+    return asyncio.run(run())
+
+
+def _bulk_ids(request: httpx.Request):
+    lines = request.content.decode("utf-8").splitlines()
+    return [json.loads(line)["index"]["_id"] for line in lines[::2]]
+
+
+def _elasticsearch(handler, count: int):
+    _, result = _export(ElasticsearchExporter, handler, count,
+                        es_url="http://es.test", index_name="chunks", file_id=7)
+    return result
+
+
+def test_elasticsearch_reports_partial_bulk_failures():
+    attempts = {}
+
+    def handler(request: httpx.Request):
+        items = []
+        for document_id in _bulk_ids(request):
+            attempts[document_id] = attempts.get(document_id, 0) + 1
+            if document_id == "7-1":
+                items.append({"index": {"status": 400, "error": {"type": "mapper_parsing_exception", "reason": "bad"}}})
+            elif document_id == "7-2" and attempts[document_id] == 1:
+                # 被限流的文档单独重试
+                items.append({"index": {"status": 429}})
+            else:
+                items.append({"index": {"status": 201}})
+        errors = any(item["index"]["status"] >= 300 for item in items)
+        return httpx.Response(200, json={"errors": errors, "items": items})
+
+    result = _elasticsearch(handler, 4)
+
+    assert result.exported == 3
+    assert result.failed == 1
+    assert result.errors == [{"chunk_index": 1, "error": "HTTP 400: mapper_parsing_exception: bad"}]
+    assert attempts == {"7-0": 1, "7-1": 1, "7-2": 2, "7-3": 1}
+    assert result.status == "partial"
+
+
+def test_elasticsearch_retries_throttling_and_server_errors():
+    responses = iter([httpx.Response(429), httpx.Response(500)])
+
+    def handler(request: httpx.Request):
+        response = next(responses, None)
+        if response is not None:
+            return response
+        return httpx.Response(200, json={"errors": False, "items": []})
+
+    result = _elasticsearch(handler, 1)
+
+    assert result.exported == 1
+    assert result.failed == 0
+
+
+def test_elasticsearch_gives_up_after_max_retries():
+    result = _elasticsearch(lambda request: httpx.Response(502), 3)
+
+    assert result.exported == 0
+    assert result.failed == 3
+    assert result.errors[0]["error"] == "HTTP 502"
+    assert result.status == "failed"
+
+
+def test_dify_waits_for_indexing_then_appends_segments_in_batches():
+    requests = []
+    statuses = iter(["waiting", "indexing", "completed"])
+
+    def handler(request: httpx.Request):
+        requests.append((request.method, request.url.path))
+        if request.url.path.endswith("/create-by-text"):
+            return httpx.Response(200, json={"document": {"id": "doc-1"}, "batch": "batch-1"})
+        if request.url.path.endswith("/indexing-status"):
+            return httpx.Response(200, json={"data": [{"id": "doc-1", "indexing_status": next(statuses)}]})
+        segments = json.loads(request.content)["segments"]
+        # 追加分段前文档必须已经索引完成
+        assert ("GET", "/v1/datasets/kb/documents/batch-1/indexing-status") in requests
+        return httpx.Response(200, json={"data": segments})
+
+    exporter, result = _export(
+        DifyExporter, handler, 6, api_endpoint="http://dify.test/v1", api_key="key", dataset_id="kb",
+        document_name="doc.txt", indexing_poll_interval=0,
+    )
+
+    assert exporter.document_id == "doc-1"
+    assert result.exported == 6 and result.failed == 0
+    assert requests[:4] == [
+        ("POST", "/v1/datasets/kb/document/create-by-text"),
+        ("GET", "/v1/datasets/kb/documents/batch-1/indexing-status"),
+        ("GET", "/v1/datasets/kb/documents/batch-1/indexing-status"),
+        ("GET", "/v1/datasets/kb/documents/batch-1/indexing-status"),
+    ]
+    # 其余 5 个分块按 batch_size=2 分 3 批追加
+    assert requests[4:] == [("POST", "/v1/datasets/kb/documents/doc-1/segments")] * 3
+    assert result.batches == 3
+
+
+def test_dify_stops_when_indexing_fails():
+    def handler(request: httpx.Request):
+        if request.url.path.endswith("/create-by-text"):
+            return httpx.Response(200, json={"document": {"id": "doc-1"}, "batch": "batch-1"})
+        if request.url.path.endswith("/indexing-status"):
+            return httpx.Response(200, json={"data": [{"id": "doc-1", "indexing_status": "error"}]})
+        raise AssertionError("segments must not be appended")
+
+    _, result = _export(
+        DifyExporter, handler, 3, api_endpoint="http://dify.test/v1", api_key="key", dataset_id="kb",
+        document_name="doc.txt", indexing_poll_interval=0,
+    )
+
+    # 文档已用第一个分块创建，其余两个分块未发送
+    assert result.exported == 1 and result.failed == 2
+    assert result.status == "aborted"
+    assert result.errors == [{"chunk_index": 0, "error": "Dify document indexing error"}]
+
+
+def test_dify_counts_every_chunk_when_document_cannot_be_created():
+    _, result = _export(
+        DifyExporter, lambda request: httpx.Response(401, json={"message": "invalid key"}), 5,
+        api_endpoint="http://dify.test/v1", api_key="key", dataset_id="kb", document_name="doc.txt",
+    )
+
+    assert result.exported == 0 and result.failed == 5
+    assert result.status == "aborted"
+    assert len(result.errors) == 1
+
+
+def test_dify_appends_to_existing_document_without_creating():
+    paths = []
+
+    def handler(request: httpx.Request):
+        paths.append(request.url.path)
+        return httpx.Response(200, json={"data": []})
+
+    _, result = _export(
+        DifyExporter, handler, 3, api_endpoint="http://dify.test/v1", api_key="key", dataset_id="kb",
+        document_name="doc.txt", document_id="doc-9",
+    )
+
+    assert result.exported == 3
+    assert paths == ["/v1/datasets/kb/documents/doc-9/segments"] * 2
+
+
+def test_invalid_exporter_options_are_rejected(client, make_file):
+    file = make_file("")
+
+    for options, detail in (
+        ({"batch_size": "abc"}, "batch_size must be a number, got 'abc'"),
+        ({"concurrency": 0}, "concurrency must be at least 1"),
+        ({"batch_size": -5}, "batch_size must be at least 1"),
+        ({"max_retries": 1.5}, "max_retries must be a number, got 1.5"),
+        ({"retry_backoff": -1}, "retry_backoff must be at least 0"),
+    ):
+        response = client.post("/api/v1/export/elasticsearch", params={"file_id": file.id}, json=options)
+        assert response.status_code == 400
+        assert response.json()["detail"] == detail
@@ -0,0 +1,26 @@
+from app.services.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_disabled_registry_ignores_updates():
+    registry = MetricsRegistry(enabled=False)
+    counter = Counter("test_counter_total", "Counter.", registry=registry)
+    gauge = Gauge("test_gauge", "Gauge.", registry=registry)
+    histogram = Histogram("test_seconds", "Histogram.", registry=registry)
+
+    counter.inc()
+    gauge.set(3)
+    histogram.observe(0.5)
+
+    assert counter.value == 0
+    assert gauge.samples() is None
+    assert registry.drain() == {}
+
+
+def test_enabled_registry_counts():
+    registry = MetricsRegistry()
+    counter = Counter("test_counter_total", "Counter.", registry=registry)
+
+    counter.inc()
+    counter.inc(2)
+
+    assert counter.samples() == ["test_counter_total 3.0"]
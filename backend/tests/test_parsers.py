@@ -0,0 +1,17 @@
+import os
+
+from app.services import parsers
+from app.services.parsers import parse_workers
+
+
+def test_pool_workers_share_pdf_parse_budget(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert parse_workers(8) == 8
+
+    monkeypatch.setattr(parsers, "_pool_workers", 2)
+    assert parse_workers(8) == 4
+    assert parse_workers(3) == 3
+
+    # worker 数接近核数时每个 worker 只分得一个核，串行提取
+    monkeypatch.setattr(parsers, "_pool_workers", 7)
+    assert parse_workers(8) == 1
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models import ChunkSignature, DocumentChunk, ProcessingTask
+from app.services import pipeline
+from app.services.block_store import ir_path
+from app.services.pipeline import run_chunk_job, staging_file_id
+
+TEXT = "\n\n".join(f"第{index}段：重新分块时旧分块保持可见。" * 4 for index in range(30))
+
+
+def _contents(db, file_id: int) -> list:
+    db.expire_all()
+    chunks = db.query(DocumentChunk).filter(DocumentChunk.file_id == file_id).order_by(DocumentChunk.chunk_index)
+    return [chunk.content for chunk in chunks]
+
+
+def _failing_chunker(task_id: int, file_id: int, old: list, fail_after: int):
+    chunk_blocks = pipeline.chunk_blocks
+
+    def chunker(*args, **kwargs):
+        for position, chunk in enumerate(chunk_blocks(*args, **kwargs)):
+            if position == fail_after:
+                # 已暂存的分块已提交，其他会话仍只看到旧分块
+                with SessionLocal() as other:
+                    assert _contents(other, file_id) == old
+                    staged = other.query(DocumentChunk).filter(DocumentChunk.file_id == staging_file_id(task_id))
+                    assert staged.count() > 0
+                raise RuntimeError("parser crashed")
+            yield chunk
+    return chunker
+
+
+@pytest.mark.parametrize("reuse_ir", [True, False])
+def test_failed_rechunk_keeps_previous_chunks(db, make_file, make_task, monkeypatch, reuse_ir):
+    monkeypatch.setattr(settings, "CHUNK_WRITE_BATCH_SIZE", 2)
+    file = make_file(TEXT)
+    run_chunk_job(make_task(file_id=file.id, config="{}").id, file.id, {"chunk_size": 100, "chunk_overlap": 0})
+    old = _contents(db, file.id)
+    assert len(old) > 10
+    if not reuse_ir:
+        os.remove(ir_path(file))
+
+    task = make_task(file_id=file.id, config="{}")
+    monkeypatch.setattr(pipeline, "chunk_blocks", _failing_chunker(task.id, file.id, old, fail_after=6))
+    run_chunk_job(task.id, file.id, {"chunk_size": 60, "chunk_overlap": 0, "near_duplicates": "flag"})
+
+    assert _contents(db, file.id) == old
+    assert db.get(ProcessingTask, task.id).status == "failed"
+    assert db.query(DocumentChunk).filter(DocumentChunk.file_id < 0).count() == 0
+    assert db.query(ChunkSignature).filter(ChunkSignature.file_id < 0).count() == 0
+
+
+def test_rechunk_swaps_in_new_chunks(db, make_file, make_task):
+    file = make_file(TEXT)
+    run_chunk_job(make_task(file_id=file.id, config="{}").id, file.id, {"chunk_size": 100, "chunk_overlap": 0})
+    old = _contents(db, file.id)
+
+    config = {"chunk_size": 60, "chunk_overlap": 0, "near_duplicates": "flag"}
+    run_chunk_job(make_task(file_id=file.id, config="{}").id, file.id, config)
+
+    new = _contents(db, file.id)
+    assert len(new) > len(old)
+    db.refresh(file)
+    assert (file.status, file.chunks_count) == ("completed", len(new))
+    assert db.query(DocumentChunk).filter(DocumentChunk.file_id < 0).count() == 0
+    # 新分块不会被当作旧版本自身的近似重复
+    assert db.query(ChunkSignature).filter(ChunkSignature.file_id == file.id).count() > 0
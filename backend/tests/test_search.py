@@ -0,0 +1,80 @@
+from app.models import DocumentChunk
+from app.services.search import like_snippet
+
+CONTENT = "本季度的预算调整方案属于公司机密资料，未经批准不得对外发布或转发给合作伙伴。"
+
+
+def test_like_snippet_marks_terms_around_first_match():
+    snippet = like_snippet(CONTENT, ["机密"])
+
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert "<mark>机密</mark>" in snippet
+    assert len(snippet.replace("<mark>", "").replace("</mark>", "").strip("…")) == 16
+    assert like_snippet("Top Secret", ["secret"]) == "Top <mark>Secret</mark>"
+    assert like_snippet("无关内容", ["机密"]) is None
+
+
+def test_short_cjk_query_returns_snippet_like_fts(client, db, make_file):
+    file = make_file(CONTENT)
+    db.add(DocumentChunk(file_id=file.id, chunk_index=0, content=CONTENT, chunk_metadata="{}"))
+    db.commit()
+
+    short = client.get("/api/v1/search/chunks", params={"q": "机密", "file_id": file.id}).json()["results"]
+    long = client.get("/api/v1/search/chunks", params={"q": "机密资料", "file_id": file.id}).json()["results"]
+
+    assert len(short) == len(long) == 1
+    assert short[0].keys() == long[0].keys()
+    assert "<mark>机密</mark>" in short[0]["snippet"]
+    assert "<mark>机密资料</mark>" in long[0]["snippet"]
+    assert "content" not in short[0]
+
+
+def _add_chunk(db, file, content: str, index: int = 0) -> DocumentChunk:
+    chunk = DocumentChunk(file_id=file.id, chunk_index=index, content=content, chunk_metadata="{}")
+    db.add(chunk)
+    db.commit()
+    return chunk
+
+
+def test_short_terms_use_bigram_index(client, db, make_file):
+    file = make_file(CONTENT)
+    chunk = _add_chunk(db, file, "代号麒麟的项目预算尚未批准。")
+    _add_chunk(db, file, "Main QX roadmap", 1)
+
+    short = client.get("/api/v1/search/chunks", params={"q": "麒麟"}).json()["results"]
+    single = client.get("/api/v1/search/chunks", params={"q": "麒 qx"}).json()["results"]
+    ascii = client.get("/api/v1/search/chunks", params={"q": "qx"}).json()["results"]
+
+    assert [result["chunk_id"] for result in short] == [chunk.id]
+    assert short[0]["score"] is not None
+    assert "<mark>麒麟</mark>" in short[0]["snippet"]
+    assert single == []
+    assert [result["chunk_index"] for result in ascii] == [1]
+    assert "<mark>QX</mark>" in ascii[0]["snippet"]
+
+    db.delete(chunk)
+    db.commit()
+    assert client.get("/api/v1/search/chunks", params={"q": "麒麟"}).json()["results"] == []
+
+
+def test_mixed_query_filters_short_terms_on_fts_matches(client, db, make_file):
+    file = make_file(CONTENT)
+    _add_chunk(db, file, CONTENT)
+    params = {"file_id": file.id}
+
+    matched = client.get("/api/v1/search/chunks", params={"q": "预算调整 机密", **params}).json()["results"]
+    missed = client.get("/api/v1/search/chunks", params={"q": "预算调整 股票", **params}).json()["results"]
+
+    assert len(matched) == 1 and matched[0]["score"] is not None
+    assert "<mark>预算调整</mark>" in matched[0]["snippet"]
+    assert missed == []
+
+
+def test_unindexable_short_query_requires_file_filter(client, db, make_file):
+    file = make_file(CONTENT)
+    _add_chunk(db, file, CONTENT)
+
+    assert client.get("/api/v1/search/chunks", params={"q": "，"}).status_code == 400
+    scoped = client.get("/api/v1/search/chunks", params={"q": "，", "file_id": file.id})
+    assert scoped.status_code == 200
+    assert len(scoped.json()["results"]) == 1
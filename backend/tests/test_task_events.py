@@ -0,0 +1,100 @@
+import asyncio
+
+from app.api.endpoints.processing import _stream_task_events
+from app.services.progress_bus import task_update_message
+from app.services.task_state import task_states
+
+
+def _events(body: str):
+    return [block for block in body.split("\n\n") if block.startswith("id: ")]
+
+
+def _data(event: bytes) -> str:
+    return event.decode("utf-8")
+
+
+def test_finished_task_stream_sends_snapshot_and_closes(client, make_task):
+    task = make_task("completed", progress=100.0)
+
+    response = client.get(f"/api/v1/processing/task/{task.id}/events")
+
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert len(events) == 1
+    assert '"type": "task_state"' in events[0]
+    assert '"status": "completed"' in events[0]
+
+
+def test_finished_task_stream_sends_snapshot_with_history(client, make_task):
+    other = make_task("running")
+    task_states.apply(other.id, task_update_message(other.id, "running", 10.0))
+    task = make_task("completed", progress=100.0)
+
+    response = client.get(f"/api/v1/processing/task/{task.id}/events")
+
+    events = _events(response.text)
+    assert len(events) == 1
+    assert '"status": "completed"' in events[0]
+
+
+def test_idle_task_stream_sends_snapshot_then_updates(make_task):
+    task = make_task("pending")
+    state = {"task_id": task.id, "status": "pending", "progress": 0.0}
+
+    async def run():
+        stream = _stream_task_events(task.id, state, task_states.sequence, None)
+        try:
+            assert await stream.__anext__() == b"retry: 3000\n\n"
+            snapshot = _data(await stream.__anext__())
+            assert '"type": "task_state"' in snapshot and '"status": "pending"' in snapshot
+            task_states.apply(task.id, task_update_message(task.id, "running", 50.0))
+            update = _data(await asyncio.wait_for(stream.__anext__(), timeout=1))
+            assert '"status": "running"' in update and '"progress": 50.0' in update
+        finally:
+            await stream.aclose()
+
+    asyncio.run(run())
+
+
+def test_resume_replays_missed_events_with_equal_timestamps(make_task):
+    task = make_task("running")
+    first = task_update_message(task.id, "running", 10.0)
+    last_event_id = None
+
+    async def run():
+        nonlocal last_event_id
+        stream = _stream_task_events(None, None, task_states.sequence, None)
+        try:
+            await stream.__anext__()
+            task_states.apply(task.id, first)
+            event = _data(await asyncio.wait_for(stream.__anext__(), timeout=1))
+            last_event_id = event.split("\n", 1)[0][len("id: "):]
+        finally:
+            await stream.aclose()
+
+        # 时间戳相同的事件不能被当作已发送
+        second = dict(first, progress=20.0)
+        third = dict(first, progress=30.0)
+        task_states.apply(task.id, second)
+        task_states.apply(task.id, third)
+
+        stream = _stream_task_events(None, None, task_states.sequence, task_states.parse_event_id(last_event_id))
+        try:
+            await stream.__anext__()
+            replayed = [_data(await stream.__anext__()) for _ in range(2)]
+        finally:
+            await stream.aclose()
+        assert '"progress": 20.0' in replayed[0]
+        assert '"progress": 30.0' in replayed[1]
+
+    asyncio.run(run())
+
+
+def test_unknown_event_id_falls_back_to_snapshot(client, make_task):
+    task = make_task("completed")
+
+    response = client.get(f"/api/v1/processing/task/{task.id}/events", headers={"Last-Event-ID": "other-process-7"})
+
+    events = _events(response.text)
+    assert len(events) == 1
+    assert '"type": "task_state"' in events[0]
@@ -0,0 +1,161 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.api.endpoints import processing
+from app.models import DocumentChunk, ProcessingTask
+from app.services import pipeline
+from app.services.task_queue import CeleryTaskQueue, LocalTaskQueue
+from app.worker import celery_app
+
+TEXT = "\n\n".join(f"第{index}段：文档预处理的测试内容。" * 5 for index in range(20))
+
+
+class _RecordingExecutor:
+    max_workers = 4
+
+    def __init__(self):
+        self.submitted = []
+
+    def is_saturated(self) -> bool:
+        return False
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        self.submitted.append(task_id)
+        return "running"
+
+
+@pytest.fixture
+def celery_queue(monkeypatch):
+    queue = CeleryTaskQueue(max_queued=2)
+    monkeypatch.setattr(processing, "task_queue", queue)
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", True)
+    yield queue
+    with celery_app.connection_for_write() as connection:
+        connection.default_channel.queue_purge(celery_app.conf.task_default_queue)
+
+
+class _LoopCheckingCeleryQueue(CeleryTaskQueue):
+    """
+    记录在事件循环线程中调用的 broker 操作
+    """
+
+    def __init__(self):
+        super().__init__(max_queued=2)
+        self.on_loop = []
+
+    def _check(self, name: str):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.on_loop.append(name)
+
+    def queue_depth(self) -> int:
+        self._check("queue_depth")
+        return super().queue_depth()
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        self._check("submit")
+        return super().submit(task_id, file_id, config)
+
+    def cancel(self, task_id: int):
+        self._check("cancel")
+        super().cancel(task_id)
+
+
+def _task(db, task_id: int) -> ProcessingTask:
+    db.expire_all()
+    return db.get(ProcessingTask, task_id)
+
+
+def test_celery_submit_runs_chunk_job(client, db, make_file, celery_queue):
+    file = make_file(TEXT)
+
+    response = client.post("/api/v1/processing/chunk", params={"file_id": file.id}, json={"chunk_size": 100})
+
+    assert response.status_code == 200
+    task = _task(db, response.json()["task_id"])
+    assert task.status == "completed"
+    assert task.owner is None
+    assert db.query(DocumentChunk).filter(DocumentChunk.file_id == file.id).count() > 0
+
+
+def test_celery_queue_depth_rejects_when_full(client, make_file, celery_queue, monkeypatch):
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", False)
+    for _ in range(2):
+        response = client.post("/api/v1/processing/chunk", params={"file_id": make_file(TEXT).id}, json={})
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+
+    assert celery_queue.queue_depth() == 2
+    response = client.post("/api/v1/processing/chunk", params={"file_id": make_file(TEXT).id}, json={})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_broker_calls_do_not_block_the_event_loop(client, make_file, celery_queue, monkeypatch):
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", False)
+    queue = _LoopCheckingCeleryQueue()
+    monkeypatch.setattr(processing, "task_queue", queue)
+
+    response = client.post("/api/v1/processing/chunk", params={"file_id": make_file(TEXT).id}, json={})
+    assert response.status_code == 200
+    assert client.delete(f"/api/v1/processing/task/{response.json()['task_id']}").status_code == 200
+
+    assert queue.on_loop == []
+
+
+def test_duplicate_submit_conflicts(client, make_file, celery_queue, monkeypatch):
+    monkeypatch.setitem(celery_app.conf, "task_always_eager", False)
+    file = make_file(TEXT)
+
+    first = client.post("/api/v1/processing/chunk", params={"file_id": file.id}, json={})
+    second = client.post("/api/v1/processing/chunk", params={"file_id": file.id}, json={})
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+    assert str(first.json()["task_id"]) in second.json()["detail"]
+
+
+def test_celery_retries_operational_error(client, db, make_file, celery_queue, monkeypatch):
+    run_chunk_job = pipeline.run_chunk_job
+    attempts = []
+
+    def flaky(*args, **kwargs):
+        attempts.append(args[0])
+        if len(attempts) < 3:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return run_chunk_job(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "run_chunk_job", flaky)
+    monkeypatch.setitem(celery_app.conf, "task_eager_propagates", False)
+    file = make_file(TEXT)
+
+    response = client.post("/api/v1/processing/chunk", params={"file_id": file.id}, json={"chunk_size": 100})
+
+    assert response.status_code == 200
+    assert len(attempts) == 3
+    assert _task(db, response.json()["task_id"]).status == "completed"
+
+
+def test_resume_claims_each_interrupted_task_once(make_task):
+    # 两个 worker 同时恢复：第一个认领全部任务，第二个不能再提交
+    host = LocalTaskQueue(_RecordingExecutor()).host
+    dead = make_task("running", owner=f"{host}:999999999")
+    unowned = make_task("queued")
+    alive = make_task("running", owner=f"{host}:{os.getppid()}")
+    remote = make_task("pending", owner="other-host:1")
+    first, second = LocalTaskQueue(_RecordingExecutor()), LocalTaskQueue(_RecordingExecutor())
+    # 模拟两个仍在运行的 worker 进程
+    first.owner = f"{host}:1"
+    second.owner = f"{host}:{os.getppid()}"
+
+    first.resume_interrupted()
+    second.resume_interrupted()
+
+    assert dead.id in first.executor.submitted and unowned.id in first.executor.submitted
+    assert alive.id not in first.executor.submitted and remote.id not in first.executor.submitted
+    assert second.executor.submitted == []
@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+import httpx
+from sqlalchemy import event
+
+from app.api.endpoints import processing
+from app.api.endpoints.processing import ChunkConfig
+from app.core.config import settings
+from app.core.database import async_engine
+from app.main import app
+from app.models import UploadedFile
+from app.services.pipeline import config_fingerprint
+
+CONTENT = "相同内容的并发上传\n".encode("utf-8") * 100
+
+
+async def _upload_concurrently(count: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(
+            client.post("/api/v1/upload/file", files={"file": ("same.txt", CONTENT, "text/plain")})
+            for _ in range(count)
+        ))
+
+
+def test_concurrent_uploads_share_one_record(client, db):
+    responses = asyncio.run(_upload_concurrently(4))
+
+    assert all(response.status_code == 200 for response in responses)
+    ids = {response.json()["id"] for response in responses}
+    assert len(ids) == 1
+    file = db.get(UploadedFile, ids.pop())
+    assert file.ref_count == 4
+    assert db.query(UploadedFile).filter(UploadedFile.file_path == file.file_path).count() == 1
+    assert sorted(response.json()["deduplicated"] for response in responses) == [False, True, True, True]
+
+    # 释放引用时保留物理文件，最后一个引用删除时才删除
+    for expected in (3, 2, 1):
+        assert client.delete(f"/api/v1/upload/files/{file.id}").json()["ref_count"] == expected
+        assert os.path.exists(file.file_path)
+    assert client.delete(f"/api/v1/upload/files/{file.id}").status_code == 200
+    assert not os.path.exists(file.file_path)
+
+
+def test_batch_upload_counts_repeated_files(client, db):
+    content = b"batch upload dedup"
+    response = client.post("/api/v1/upload/files", files=[
+        ("files", ("a.txt", content, "text/plain")),
+        ("files", ("b.txt", content, "text/plain")),
+    ])
+    again = client.post("/api/v1/upload/file", files={"file": ("c.txt", content, "text/plain")})
+
+    first, second = response.json()["files"]
+    assert first["id"] == second["id"] == again.json()["id"]
+    assert (first["deduplicated"], second["deduplicated"], again.json()["deduplicated"]) == (False, True, True)
+    assert again.json()["ref_count"] == 3
+
+
+def test_delete_keeps_file_when_upload_races_last_reference(client, db):
+    uploaded = client.post("/api/v1/upload/file", files={"file": ("race.txt", b"delete race", "text/plain")}).json()
+    raced = []
+
+    def concurrent_upload(conn, cursor, statement, parameters, context, executemany):
+        # 引用计数检查之后、删除记录之前，相同内容的上传增加了引用计数
+        if statement.startswith("DELETE FROM uploaded_files") and not raced:
+            raced.append(True)
+            upload = conn.connection.cursor()
+            upload.execute("UPDATE uploaded_files SET ref_count = ref_count + 1 WHERE id = ?", (uploaded["id"],))
+            upload.close()
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", concurrent_upload)
+    try:
+        response = client.delete(f"/api/v1/upload/files/{uploaded['id']}")
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", concurrent_upload)
+
+    assert raced
+    assert response.json() == {"message": "File reference released", "ref_count": 1}
+    file = db.get(UploadedFile, uploaded["id"])
+    assert file.ref_count == 1
+    assert os.path.exists(file.file_path)
+
+
+class _IdleQueue:
+    owner = None
+
+    def is_saturated(self) -> bool:
+        return False
+
+    def is_busy(self) -> bool:
+        return False
+
+    def submit(self, task_id: int, file_id: int, config: dict) -> str:
+        return "running"
+
+
+def test_chunks_are_not_reused_across_extensions(client, db, monkeypatch):
+    monkeypatch.setattr(processing, "task_queue", _IdleQueue())
+    content = "<p>同样的字节</p>".encode("utf-8")
+    html = client.post("/api/v1/upload/file", files={"file": ("x.html", content, "text/html")}).json()
+    text = client.post("/api/v1/upload/file", files={"file": ("x.txt", content, "text/plain")}).json()
+    assert html["sha256"] == text["sha256"] and html["id"] != text["id"]
+    # HTML 文件已用默认配置分块完成
+    file = db.get(UploadedFile, html["id"])
+    file.status = "completed"
+    file.chunk_config_hash = config_fingerprint(ChunkConfig(tokenizer=settings.DEFAULT_TOKENIZER).model_dump())
+    db.commit()
+
+    response = client.post("/api/v1/processing/chunk", params={"file_id": text["id"]}, json={})
+
+    assert response.status_code == 200
+    assert "cached" not in response.json()
+
+
+def test_batch_upload_rejects_oversized_file_alone(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE", 64)
+    response = client.post("/api/v1/upload/files", files=[
+        ("files", ("small.txt", b"small batch file", "text/plain")),
+        ("files", ("large.txt", b"x" * 65, "text/plain")),
+        ("files", ("image.png", b"png", "image/png")),
+    ])
+
+    small, large, image = response.json()["files"]
+    assert small["status"] == "uploaded"
+    assert os.path.exists(db.get(UploadedFile, small["id"]).file_path)
+    assert (large["status"], large["filename"]) == ("failed", "large.txt")
+    assert large["error"] == "File large.txt exceeds the 64 byte limit"
+    assert (image["status"], image["filename"]) == ("failed", "image.png")
+    # 被拒绝的文件不留下临时文件
+    assert not [name for name in os.listdir(settings.UPLOAD_DIR) if name.endswith(".part")]
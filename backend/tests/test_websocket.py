@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from app.api.endpoints.websocket import ConnectionManager
+from app.services.metrics import WEBSOCKET_DROPPED_MESSAGES
+from app.services.progress_bus import task_update_message
+
+
+class _FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(json.loads(text))
+
+
+class _StalledWebSocket(_FakeWebSocket):
+    async def send_text(self, text: str):
+        await asyncio.Event().wait()
+
+
+def test_updates_without_subscribers_keep_no_state():
+    async def run():
+        manager = ConnectionManager(updates_per_second=5)
+        for progress in (10.0, 20.0, 30.0):
+            manager.publish_task_update(1, task_update_message(1, "running", progress))
+        assert manager._updates == {}
+    asyncio.run(run())
+
+
+def test_stalled_task_state_is_evicted_when_last_subscriber_leaves():
+    async def run():
+        manager = ConnectionManager(updates_per_second=5)
+        websocket = _FakeWebSocket()
+        await manager.connect(websocket)
+        manager.subscribe_to_task(1, websocket)
+
+        manager.publish_task_update(1, task_update_message(1, "running", 10.0))
+        # 间隔内的更新等待定时器发送
+        manager.publish_task_update(1, task_update_message(1, "running", 20.0))
+        assert manager._updates[1].handle is not None
+        await asyncio.sleep(0.3)
+        assert [message["progress"] for message in websocket.sent] == [10.0, 20.0]
+        assert manager._updates[1].handle is None
+
+        # 任务停滞后订阅者断开，不再保留该任务的限流状态和定时器
+        manager.publish_task_update(1, task_update_message(1, "running", 30.0))
+        handle = manager._updates[1].handle
+        manager.disconnect(websocket)
+        assert manager._updates == {}
+        assert handle.cancelled()
+    asyncio.run(run())
+
+
+def test_terminal_update_is_sent_immediately_and_clears_state():
+    async def run():
+        manager = ConnectionManager(updates_per_second=1)
+        websocket = _FakeWebSocket()
+        await manager.connect(websocket)
+        manager.subscribe_to_task(1, websocket)
+
+        manager.publish_task_update(1, task_update_message(1, "running", 50.0))
+        manager.publish_task_update(1, task_update_message(1, "completed", 100.0))
+        await asyncio.sleep(0)
+        assert [message["status"] for message in websocket.sent] == ["running", "completed"]
+        assert manager._updates == {}
+        manager.disconnect(websocket)
+    asyncio.run(run())
+
+
+def test_dropped_messages_counter_survives_disconnect():
+    async def run():
+        manager = ConnectionManager(queue_size=1)
+        websocket = _StalledWebSocket()
+        await manager.connect(websocket)
+        before = WEBSOCKET_DROPPED_MESSAGES.value
+        for index in range(4):
+            await manager.send_personal_message(str(index), websocket)
+            await asyncio.sleep(0)
+        # 第一条卡在发送中，其后队列只容纳一条，每条新消息挤掉一条
+        assert WEBSOCKET_DROPPED_MESSAGES.value - before == 2
+        manager.disconnect(websocket)
+        assert WEBSOCKET_DROPPED_MESSAGES.value - before == 2
+    asyncio.run(run())
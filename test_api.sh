@@ -22,8 +22,8 @@ echo "4️⃣ Testing Export Schemas..."
 curl -s "$BASE_URL/api/v1/export/schemas" | jq .
 
 echo ""
-echo "5️⃣ Testing WebSocket Connection Status..."
-curl -s "$BASE_URL/api/v1/ws/connections" | jq .
+echo "5️⃣ Testing Metrics (WebSocket connections, queue depth)..."
+curl -s "$BASE_URL/metrics" | grep -v "^#" | grep -E "websocket|queue_depth|tasks_running"
 
 echo ""
 echo "✅ API Tests Complete!"